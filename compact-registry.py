@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+import argparse
+import os.path
+import sys
+
+from registry import (
+    TIMINGS_ENV,
+    ConcurrentUpdate,
+    LockTimeout,
+    QueryIndex,
+    RegistryIndex,
+    RegistryLock,
+    timings,
+    version_file_path,
+)
+from registry.compact import compact_entries, freed_size, pinned_entries
+from registry.index import entry_version
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop the superseded port-versions and the old versions from"
+                                                 " the version files. Entries pinned by a baseline or matching"
+                                                 " the current vcpkg.json of their port are always kept")
+    parser.add_argument("ports", nargs='*', help="Ports to compact (default: every port of the registry)")
+    parser.add_argument("--keep", type=int, default=None, metavar="N",
+                        help="Only keep the N most recent versions of each port (default: all). Versions that"
+                             " cannot be ordered, such as version-string, are kept")
+    parser.add_argument("--keep-port-versions", action="store_true",
+                        help="Keep the superseded port-versions of the retained versions")
+    parser.add_argument("--dry-run", action="store_true", help="Print what would be dropped, without writing")
+    parser.add_argument("--lock-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Give up if another update holds the registry lock for longer (default: wait)")
+    parser.add_argument("--timings", nargs='?', const="table", metavar="TRACE.json",
+                        help="Print the time spent in each phase and subprocess, or write it as a Chrome"
+                             f" trace to TRACE.json (default: ${TIMINGS_ENV})")
+    args = parser.parse_args()
+    if args.timings:
+        timings.enable(args.timings)
+    if args.keep is not None and args.keep < 1:
+        parser.error("--keep must be at least 1")
+
+    try:
+        with RegistryLock(timeout=args.lock_timeout):
+            index = RegistryIndex.load()
+            ports = args.ports or index.ports()
+            for port in ports:
+                if port not in index.versions:
+                    fatal(f"Port '{port}' has no version file")
+
+            kept_trees = set()
+            dropped_trees = set()
+            dropped_count = 0
+            size_before = sum(file_size(version_file_path(port)) for port in index.versions)
+            with timings.phase("compact versions"):
+                for port in ports:
+                    pinned = pinned_entries(index.baselines, port)
+                    manifest = index.manifests.get(port)
+                    if manifest is not None:
+                        pinned.add((entry_version(manifest), manifest.get("port-version", 0)))
+                    kept, dropped = compact_entries(index.versions[port], pinned, keep=args.keep,
+                                                    superseded=not args.keep_port_versions)
+                    for entry in dropped:
+                        print(f"{'would drop' if args.dry_run else 'dropping'} {port}"
+                              f" {entry_version(entry)}#{entry.get('port-version', 0)}")
+                    dropped_count += len(dropped)
+                    dropped_trees.update(entry["git-tree"] for entry in dropped if "git-tree" in entry)
+                    index.replace_versions(port, kept)
+            # Trees still referenced by any remaining entry are not freed
+            for port, entries in index.versions.items():
+                kept_trees.update(entry["git-tree"] for entry in entries if "git-tree" in entry)
+
+            changes = index.pending()
+            size_after = size_before + sum(len(text.encode()) - file_size(path) for path, text in changes.items())
+            with timings.phase("measure dropped trees"):
+                tree_count, tree_bytes = freed_size(kept_trees, dropped_trees)
+            if not args.dry_run and changes:
+                index.save()
+                # Only the version files just written are re-read
+                QueryIndex.load().save()
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+    except LockTimeout as e:
+        fatal(e.message)
+    except ConcurrentUpdate as e:
+        fatal(e.message)
+
+    print(f"{dropped_count} entry(ies) dropped, {len(changes)} version file(s)"
+          f" {'to rewrite' if args.dry_run else 'rewritten'}")
+    print(f"version files: {size_before} -> {size_after} bytes")
+    print(f"{tree_count} git-tree(s), {tree_bytes} bytes of objects, only referenced by the dropped entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import os.path
+import sys
+
+from registry import TIMINGS_ENV, RegistryIndex, object_types, timings
+from registry.export import TREES_DIR_PATH, export_version_files, extract_trees
+from registry.index import entry_version
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the registry as a vcpkg filesystem registry, usable"
+                                                 " without git. Only the port trees added since the previous"
+                                                 " export are extracted")
+    parser.add_argument("output", help="Directory of the filesystem registry")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of threads writing the port files")
+    parser.add_argument("--skip-missing", action="store_true",
+                        help="Leave out the version entries whose git-tree is not in the repository,"
+                             " instead of failing")
+    parser.add_argument("--timings", nargs='?', const="table", metavar="TRACE.json",
+                        help="Print the time spent in each phase and subprocess, or write it as a Chrome"
+                             f" trace to TRACE.json (default: ${TIMINGS_ENV})")
+    args = parser.parse_args()
+    if args.timings:
+        timings.enable(args.timings)
+
+    try:
+        index = RegistryIndex.load()
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+
+    # Entries whose git-tree cannot be extracted are found before writing anything
+    trees = {entry["git-tree"] for entries in index.versions.values() for entry in entries if "git-tree" in entry}
+    types = object_types(trees)
+    versions = {}
+    missing = []
+    for port in index.ports():
+        versions[port] = []
+        for entry in index.versions.get(port, []):
+            if types.get(entry.get("git-tree")) == "tree":
+                versions[port].append(entry)
+            else:
+                missing.append(f"{port} {entry_version(entry)}#{entry.get('port-version', 0)}")
+    if missing and not args.skip_missing:
+        fatal(f"{len(missing)} version entries have no git-tree in this repository (first: {missing[0]}),"
+              " use --skip-missing to export the others")
+    for entry in missing:
+        print(f"skipping {entry}: git-tree not found")
+
+    extracted = extract_trees({entry["git-tree"] for entries in versions.values() for entry in entries},
+                              os.path.join(args.output, TREES_DIR_PATH), max_workers=args.jobs)
+    written = export_version_files({port: entries for port, entries in versions.items() if entries},
+                                   index.baselines, args.output)
+    print(f"{len(extracted)} tree(s) extracted, {len(written)} version file(s) written,"
+          f" {len(missing)} entry(ies) skipped")
+
+
+if __name__ == "__main__":
+    main()
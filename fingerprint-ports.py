@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import subprocess
+import sys
+
+from registry import TIMINGS_ENV, CyclicDependency, timings
+from registry.fingerprint import changed_ports, port_fingerprints
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint each port from the files of ports/<port>/ and the"
+                                                 " fingerprints of its registry dependencies, or list the ports"
+                                                 " whose fingerprint changed between two commits")
+    parser.add_argument("revision", nargs='?', help="Commit to fingerprint (default: the working tree)")
+    parser.add_argument("--diff", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="List the ports to rebuild between BEFORE and AFTER, in dependency order."
+                             " AFTER may be '.' for the working tree")
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor update the fingerprint cache")
+    parser.add_argument("--timings", nargs='?', const="table", metavar="TRACE.json",
+                        help="Print the time spent in each phase and subprocess, or write it as a Chrome"
+                             f" trace to TRACE.json (default: ${TIMINGS_ENV})")
+    args = parser.parse_args()
+    if args.timings:
+        timings.enable(args.timings)
+    if args.diff and args.revision:
+        parser.error("a revision cannot be combined with --diff")
+
+    try:
+        if not args.diff:
+            result = port_fingerprints(args.revision, use_cache=not args.no_cache)
+            if args.format == "json":
+                print(json.dumps(result, indent=2))
+            else:
+                for port, fingerprint in result.items():
+                    print(f"{fingerprint} {port}")
+            return
+
+        before, after = (None if revision == "." else revision for revision in args.diff)
+        changed, removed = changed_ports(port_fingerprints(before, use_cache=not args.no_cache),
+                                         port_fingerprints(after, use_cache=not args.no_cache))
+    except subprocess.CalledProcessError as e:
+        fatal(f"git failed: {' '.join(e.cmd)}")
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+    except CyclicDependency as e:
+        fatal(e.message)
+
+    if args.format == "json":
+        print(json.dumps({"changed": changed, "removed": removed}, indent=2))
+    else:
+        for port in changed:
+            print(port)
+        for port in removed:
+            print(f"removed: {port}")
+
+
+if __name__ == "__main__":
+    main()
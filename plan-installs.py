@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+
+from registry import TIMINGS_ENV, PlatformExpressionError, install_plans, native_triplet, timings
+
+DEFAULT_TRIPLETS = ["x64-linux", "arm64-linux", "wasm32-emscripten", "x64-windows"]
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the feature-resolved install plan of the registry"
+                                                 " ports for each triplet, without running vcpkg")
+    parser.add_argument("ports", nargs='*', help="Ports to install (default: every port of the registry)")
+    parser.add_argument("--triplet", dest="triplets", action="append", metavar="TRIPLET",
+                        help=f"Triplet to plan for, repeatable (default: {', '.join(DEFAULT_TRIPLETS)})")
+    parser.add_argument("--host-triplet", default=None, metavar="TRIPLET",
+                        help="Triplet of the \"host\": true dependencies (default: the native triplet,"
+                             f" {native_triplet()})")
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of triplets planned in parallel")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor update the plan cache")
+    parser.add_argument("--timings", nargs='?', const="table", metavar="TRACE.json",
+                        help="Print the time spent in each phase and subprocess, or write it as a Chrome"
+                             f" trace to TRACE.json (default: ${TIMINGS_ENV})")
+    args = parser.parse_args()
+    if args.timings:
+        timings.enable(args.timings)
+
+    try:
+        plans = install_plans(args.triplets or DEFAULT_TRIPLETS, args.ports, max_workers=args.jobs,
+                              use_cache=not args.no_cache, host_triplet=args.host_triplet)
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+    except PlatformExpressionError as e:
+        fatal(e.message)
+
+    if args.format == "json":
+        print(json.dumps(plans, indent=2))
+    else:
+        for triplet, plan in plans.items():
+            print(f"{triplet}:")
+            for step in plan["plan"]:
+                features = f"[{','.join(step['features'])}]" if step["features"] else ""
+                origin = "" if step["registry"] else " (external)"
+                print(f"  {step['port']}{features}{origin}")
+            if plan["host"]:
+                print(f"  host ({plan['host-triplet']}):")
+            for step in plan["host"]:
+                features = f"[{','.join(step['features'])}]" if step["features"] else ""
+                origin = "" if step["registry"] else " (external)"
+                print(f"    {step['port']}{features}{origin}")
+            for problem in plan["unsupported"]:
+                print(f"  unsupported: {problem}")
+    sys.exit(1 if any(plan["unsupported"] for plan in plans.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os.path
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from registry import (
+    MIRRORS_ENV,
+    TIMINGS_ENV,
+    CatFileBatch,
+    RegistryIndex,
+    SourceArchiveError,
+    archive_file_name,
+    file_sha512,
+    find_mirror,
+    has_variables,
+    manifest_variables,
+    portfile_source,
+    timings,
+    version_file_path,
+    write_archive,
+)
+from registry.gittree import TREE_MODE, parse_tree
+
+SOURCE_FILES = (b"portfile.cmake", b"vcpkg.json")
+
+VCPKG_ROOT_ENV = "VCPKG_ROOT"
+
+
+class Source(NamedTuple):
+    port: str
+    repo: str
+    ref: str
+    sha512: str
+
+
+class Result(NamedTuple):
+    port: str
+    status: str
+    message: str
+
+
+class BaselineNotFound(Exception):
+    def __init__(self, baseline: str, *args: object) -> None:
+        super().__init__(*args)
+        self.__baseline = baseline
+
+    @property
+    def message(self) -> str:
+        return f"Baseline '{self.__baseline}' not found"
+
+
+def pinned_trees(index: RegistryIndex, baseline: str, ports: list = None) -> tuple:
+    # ({port: (version, git-tree)}, problems) of the ports pinned in
+    # 'baseline' (or of 'ports' only), 'problems' being the Results of the
+    # ports whose pin has no git-tree
+    try:
+        pinned = index.baselines[baseline]
+    except KeyError:
+        raise BaselineNotFound(baseline)
+    trees = {}
+    problems = []
+    for port in sorted(ports or pinned):
+        pin = pinned.get(port)
+        if pin is None:
+            problems.append(Result(port, "error", f"not pinned in baseline '{baseline}'"))
+            continue
+        version = f"{pin['baseline']}#{pin.get('port-version', 0)}"
+        index.load_versions(port)
+        tree = next((entry["git-tree"] for entry in index.find(port, pin["baseline"])
+                     if entry.get("port-version", 0) == pin.get("port-version", 0) and "git-tree" in entry), None)
+        if tree is None:
+            problems.append(Result(port, "error", f"{version} has no git-tree in {version_file_path(port)}"))
+        else:
+            trees[port] = (version, tree)
+    return trees, problems
+
+
+def baseline_sources(index: RegistryIndex, baseline: str, ports: list = None) -> tuple:
+    # (sources, problems): the vcpkg_from_github sources of the ports
+    # pinned in 'baseline' (or of 'ports' only). portfile.cmake and
+    # vcpkg.json are read from the git-tree of the pinned version, through
+    # one git process: the working tree may be ahead of the baseline
+    trees, problems = pinned_trees(index, baseline, ports)
+    with timings.phase("read pinned trees"), CatFileBatch(index.root) as cat:
+        files = {}
+        for tree, kind, content in cat.read(list(dict.fromkeys(tree for _, tree in trees.values()))):
+            if kind == "tree":
+                files[tree] = {name: entry_id for mode, name, entry_id in parse_tree(content)
+                               if name in SOURCE_FILES and mode != TREE_MODE}
+        blob_ids = list(dict.fromkeys(blob for entries in files.values() for blob in entries.values()))
+        blobs = {blob: content for blob, _, content in cat.read(blob_ids)}
+
+    sources = []
+    for port, (version, tree) in trees.items():
+        if tree not in files:
+            problems.append(Result(port, "error", f"git-tree {tree} of {version} is not in the repository"))
+            continue
+        portfile = blobs.get(files[tree].get(b"portfile.cmake"))
+        if portfile is None:
+            continue
+        # REF is often derived from the version, e.g. "release-${VERSION}"
+        manifest = blobs.get(files[tree].get(b"vcpkg.json"))
+        variables = manifest_variables(json.loads(manifest)) if manifest else {}
+        fields = portfile_source(portfile.decode(), variables)
+        if "REPO" in fields and "REF" in fields:
+            sources.append(Source(port, fields["REPO"], fields["REF"], fields.get("SHA512")))
+    return sources, problems
+
+
+def prefetch(source: Source, mirrors: str, downloads: str) -> Result:
+    if not source.sha512 or source.sha512 == "0":
+        return Result(source.port, "skipped", "portfile.cmake declares no SHA512")
+    if has_variables(source.repo) or has_variables(source.ref):
+        return Result(source.port, "skipped", f"REPO {source.repo} or REF {source.ref} cannot be resolved")
+    path = os.path.join(downloads, archive_file_name(source.repo, source.ref))
+    if os.path.isfile(path):
+        if file_sha512(path).lower() == source.sha512.lower():
+            return Result(source.port, "present", path)
+        print(f"{path} does not match its SHA512, producing it again")
+    mirror = find_mirror(mirrors, source.repo)
+    if mirror is None:
+        return Result(source.port, "error", f"no mirror of {source.repo} found in {mirrors}")
+    try:
+        with timings.phase("prefetch", port=source.port):
+            write_archive(mirror, source.repo, source.ref, path, source.sha512)
+    except SourceArchiveError as e:
+        return Result(source.port, "error", e.message)
+    return Result(source.port, "fetched", path)
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the vcpkg downloads folder with the source archives of the"
+                                                 " ports of a baseline, produced from local mirrors")
+    parser.add_argument("ports", nargs='*', help="Only prefetch these ports (default: every port of the baseline)")
+    parser.add_argument("--baseline", default="default")
+    parser.add_argument("--vcpkg-root", default=os.environ.get(VCPKG_ROOT_ENV), metavar="DIR",
+                        help=f"The archives go to DIR/downloads (default: ${VCPKG_ROOT_ENV})")
+    parser.add_argument("--mirrors", default=os.environ.get(MIRRORS_ENV), metavar="DIR",
+                        help=f"Directory (or file:// URL) holding local clones of the port sources (default: ${MIRRORS_ENV})")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of archives produced in parallel")
+    parser.add_argument("--timings", nargs='?', const="table", metavar="TRACE.json",
+                        help="Print the time spent in each phase and subprocess, or write it as a Chrome"
+                             f" trace to TRACE.json (default: ${TIMINGS_ENV})")
+    args = parser.parse_args()
+    if args.timings:
+        timings.enable(args.timings)
+    if not args.vcpkg_root:
+        parser.error(f"--vcpkg-root or ${VCPKG_ROOT_ENV} is required")
+    if not args.mirrors:
+        parser.error(f"--mirrors or ${MIRRORS_ENV} is required")
+
+    index = RegistryIndex()
+    try:
+        index.load_baselines()
+        sources, problems = baseline_sources(index, args.baseline, args.ports)
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+    except BaselineNotFound as e:
+        fatal(e.message)
+    except EOFError as e:
+        fatal(f"Cannot read the pinned trees: {e}")
+
+    downloads = os.path.join(args.vcpkg_root, "downloads")
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(lambda source: prefetch(source, args.mirrors, downloads), sources))
+    results = sorted(results + problems, key=lambda result: result.port)
+
+    for result in results:
+        print(f"{result.port}: {result.status}: {result.message}")
+    counts = {status: sum(1 for result in results if result.status == status)
+              for status in ("fetched", "present", "skipped", "error")}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    sys.exit(1 if counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+
+from registry import QueryIndex
+
+
+def entry_to_json(port: str, entry):
+    if entry is None:
+        return None
+    version, port_version, git_tree = entry
+    return {"port": port, "version": version, "port-version": port_version, "git-tree": git_tree}
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the versions of the registry, as JSON")
+    subparsers = parser.add_subparsers(dest="query", required=True)
+
+    subparsers.add_parser("ports", help="List the ports")
+
+    latest = subparsers.add_parser("latest", help="Most recent version of a port")
+    latest.add_argument("port")
+
+    versions = subparsers.add_parser("versions", help="Versions of a port, oldest first")
+    versions.add_argument("port")
+    versions.add_argument("--since", help="Only versions greater or equal to this one")
+    versions.add_argument("--until", help="Only versions lower or equal to this one")
+
+    baseline = subparsers.add_parser("baseline", help="Version a baseline pins a port to")
+    baseline.add_argument("port")
+    baseline.add_argument("--baseline", default="default")
+
+    git_tree = subparsers.add_parser("git-tree", help="Entry of a given version of a port")
+    git_tree.add_argument("port")
+    git_tree.add_argument("version")
+    git_tree.add_argument("--port-version", type=int, help="Default: the most recent one")
+
+    args = parser.parse_args()
+
+    try:
+        index = QueryIndex.load()
+        index.save()
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+
+    if args.query == "ports":
+        result = index.ports()
+    elif args.query == "latest":
+        result = entry_to_json(args.port, index.latest(args.port))
+    elif args.query == "versions":
+        result = [entry_to_json(args.port, entry) for entry in index.versions(args.port, args.since, args.until)]
+    elif args.query == "baseline":
+        result = entry_to_json(args.port, index.baseline(args.port, args.baseline))
+    else:
+        result = entry_to_json(args.port, index.find(args.port, args.version, args.port_version))
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Helpers shared by the registry maintenance scripts (update-port.py, ...)."""
+
+from registry.archive import (
+    MIRRORS_ENV,
+    SHA512_CACHE_PATH,
+    ArchiveHasher,
+    SourceArchiveError,
+    archive_file_name,
+    file_sha512,
+    find_mirror,
+    has_variables,
+    manifest_variables,
+    portfile_source,
+    write_archive,
+)
+from registry.catfile import CatFileBatch, object_sizes, object_types
+from registry.deps import CyclicDependency, DependencyGraph, manifest_dependencies
+from registry.fingerprint import FINGERPRINT_CACHE_PATH, changed_ports, port_fingerprints
+from registry.gittree import EMPTY_TREE, hash_blob, hash_object, hash_tree
+from registry.plan import PLAN_CACHE_PATH, install_plans
+from registry.platform import PlatformExpressionError, evaluate_platform, native_triplet, triplet_identifiers
+from registry.query import QUERY_INDEX_PATH, QueryIndex
+from registry.timings import TIMINGS_ENV, timings
+from registry.lock import LOCK_PATH, LockTimeout, RegistryLock
+from registry.index import (
+    PORTS_DIR_PATH,
+    VERSION_BASELINE_PATH,
+    ConcurrentUpdate,
+    RegistryIndex,
+    atomic_write,
+    render_json,
+    version_file_path,
+)
+
+__all__ = [
+    "ArchiveHasher",
+    "CatFileBatch",
+    "ConcurrentUpdate",
+    "CyclicDependency",
+    "DependencyGraph",
+    "EMPTY_TREE",
+    "FINGERPRINT_CACHE_PATH",
+    "LOCK_PATH",
+    "LockTimeout",
+    "MIRRORS_ENV",
+    "PLAN_CACHE_PATH",
+    "PORTS_DIR_PATH",
+    "PlatformExpressionError",
+    "QUERY_INDEX_PATH",
+    "QueryIndex",
+    "RegistryIndex",
+    "RegistryLock",
+    "SHA512_CACHE_PATH",
+    "SourceArchiveError",
+    "TIMINGS_ENV",
+    "VERSION_BASELINE_PATH",
+    "archive_file_name",
+    "atomic_write",
+    "changed_ports",
+    "evaluate_platform",
+    "file_sha512",
+    "find_mirror",
+    "hash_blob",
+    "hash_object",
+    "has_variables",
+    "hash_tree",
+    "install_plans",
+    "manifest_dependencies",
+    "manifest_variables",
+    "native_triplet",
+    "object_sizes",
+    "object_types",
+    "port_fingerprints",
+    "portfile_source",
+    "render_json",
+    "timings",
+    "triplet_identifiers",
+    "version_file_path",
+    "write_archive",
+]
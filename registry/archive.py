@@ -0,0 +1,204 @@
+"""SHA512 of the source archives vcpkg_from_github downloads.
+
+GitHub serves ``<repo>/archive/<ref>.tar.gz`` as the output of
+``git archive --format=tar --prefix=<name>-<ref>/ <ref> | gzip -cn``. Since
+git 2.38, ``--format=tar.gz`` compresses with git's own gzip, whose bytes
+differ, so the external ``gzip -cn`` is forced. Producing that archive from
+a local clone or a file:// mirror gives the SHA512 a portfile
+needs without a failing vcpkg build to learn it, and lets the vcpkg downloads
+folder be filled without reaching GitHub.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from registry.index import atomic_write
+from registry.timings import timings
+
+MIRRORS_ENV = "VCPKG_SOURCE_MIRRORS"
+SHA512_CACHE_PATH = ".sha512-cache.json"
+SHA512_CACHE_FORMAT = 1
+GZIP_COMMAND = "gzip -cn"
+CHUNK_SIZE = 1024 * 1024
+
+FROM_GITHUB_PATTERN = re.compile(r"vcpkg_from_github\s*\((.*?)\)", re.DOTALL)
+FIELD_PATTERN = re.compile(r'^\s*(REPO|REF|SHA512|HEAD_REF)\s+("[^"]*"|\S+)', re.MULTILINE)
+VARIABLE_PATTERN = re.compile(r"\$\{(\w+)\}")
+
+
+class SourceArchiveError(Exception):
+    def __init__(self, repo: str, ref: str, reason: str, *args: object) -> None:
+        super().__init__(*args)
+        self.__repo = repo
+        self.__ref = ref
+        self.__reason = reason
+
+    @property
+    def message(self) -> str:
+        return f"Cannot produce source archive of '{self.__repo}' at '{self.__ref}': {self.__reason}"
+
+
+def manifest_variables(manifest: dict) -> dict:
+    # CMake variables vcpkg defines from vcpkg.json for the portfile
+    variables = {}
+    if "name" in manifest:
+        variables["PORT"] = manifest["name"]
+    for key in ("version", "version-semver", "version-date", "version-string"):
+        if key in manifest:
+            variables["VERSION"] = manifest[key]
+            break
+    return variables
+
+
+def has_variables(value: str) -> bool:
+    # Whether 'value' still references CMake variables
+    return VARIABLE_PATTERN.search(value) is not None
+
+
+def portfile_source(content: str, variables: dict = None) -> dict:
+    # REPO/REF/SHA512/HEAD_REF of the vcpkg_from_github call, {} if none.
+    # Quotes are removed and the ${NAME} of 'variables' (see
+    # manifest_variables) expanded; other references are left as they are
+    match = FROM_GITHUB_PATTERN.search(content)
+    if not match:
+        return {}
+    variables = variables or {}
+    fields = {}
+    for field, value in FIELD_PATTERN.findall(match.group(1)):
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        fields[field] = VARIABLE_PATTERN.sub(lambda m: variables.get(m.group(1), m.group(0)), value)
+    return fields
+
+
+def find_mirror(mirrors: str, repo: str):
+    # A mirror of 'owner/name' is <mirrors>/owner/name[.git]; 'mirrors' may
+    # be a file:// URL. The bare name is not enough: another owner's fork
+    # would give another archive
+    if mirrors.startswith("file://"):
+        mirrors = mirrors[len("file://"):]
+    for candidate in (repo, repo + ".git"):
+        path = os.path.join(mirrors, *candidate.split("/"))
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def archive_file_name(repo: str, ref: str) -> str:
+    # Name vcpkg_from_github gives the archive in <vcpkg-root>/downloads
+    return f"{repo}-{ref}".replace("/", "-") + ".tar.gz"
+
+
+def file_sha512(path: str) -> str:
+    h = hashlib.sha512()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stream_archive(mirror: str, repo: str, ref: str, write=None) -> str:
+    # Runs git archive, passing each chunk to 'write' (if any) as it is
+    # hashed. Returns the SHA512 of the archive
+    name = repo.split("/")[-1]
+    cmd = ["git", "-C", mirror, "-c", f"tar.tar.gz.command={GZIP_COMMAND}", "archive", "--format=tar.gz",
+           f"--prefix={name}-{ref}/", ref]
+    h = hashlib.sha512()
+    with timings.process(cmd) as record:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+            for chunk in iter(lambda: process.stdout.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+                if write is not None:
+                    write(chunk)
+            error = process.stderr.read().decode(errors="replace").strip()
+        record.returncode = process.returncode
+    if process.returncode != 0:
+        raise SourceArchiveError(repo, ref, error or f"git archive exited with {process.returncode}")
+    return h.hexdigest()
+
+
+def archive_sha512(mirror: str, repo: str, ref: str) -> str:
+    # The archive is streamed through the hash, never stored
+    return stream_archive(mirror, repo, ref)
+
+
+def write_archive(mirror: str, repo: str, ref: str, path: str, sha512: str) -> None:
+    # The archive is hashed while it is written next to 'path', and only
+    # renamed to 'path' if it matches 'sha512': vcpkg never sees a partial
+    # or wrong archive
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".part", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            actual = stream_archive(mirror, repo, ref, f.write)
+        if actual.lower() != sha512.lower():
+            raise SourceArchiveError(repo, ref, f"SHA512 {actual} does not match the declared {sha512}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ArchiveHasher(object):
+
+    #
+    # Hashes are cached by (repo, ref) in memory and, across runs, in
+    # .sha512-cache.json of the registry: the mirrors directory may be
+    # shared or read-only. Caches without the current format, written
+    # with git's own gzip, are ignored
+    #
+    def __init__(self, mirrors: str, max_workers: int = None, root: str = ".") -> None:
+        if mirrors.startswith("file://"):
+            mirrors = mirrors[len("file://"):]
+        self.mirrors = mirrors
+        self.max_workers = max_workers
+        self.cache_path = os.path.join(root, SHA512_CACHE_PATH)
+        self.__lock = threading.Lock()
+        self.__cache = {}
+        self.__dirty = False
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.loads(f.read())
+            if data.get("format") == SHA512_CACHE_FORMAT:
+                self.__cache = {tuple(key.split("@", 1)): value for key, value in data["archives"].items()}
+        except (FileNotFoundError, ValueError, AttributeError, KeyError):
+            pass
+
+    def sha512(self, repo: str, ref: str) -> str:
+        with self.__lock:
+            if (repo, ref) in self.__cache:
+                return self.__cache[(repo, ref)]
+        mirror = find_mirror(self.mirrors, repo)
+        if mirror is None:
+            raise SourceArchiveError(repo, ref, f"no mirror found in {self.mirrors}")
+        sha512 = archive_sha512(mirror, repo, ref)
+        with self.__lock:
+            self.__cache[(repo, ref)] = sha512
+            self.__dirty = True
+        return sha512
+
+    def sha512_many(self, sources: list) -> list:
+        # 'sources' is a list of (repo, ref); duplicates are hashed once
+        unique = list(dict.fromkeys(sources))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip(unique, executor.map(lambda source: self.sha512(*source), unique)))
+        self.save()
+        return [results[source] for source in sources]
+
+    def save(self) -> None:
+        with self.__lock:
+            if not self.__dirty:
+                return
+            archives = {f"{repo}@{ref}": value for (repo, ref), value in sorted(self.__cache.items())}
+            self.__dirty = False
+        try:
+            atomic_write(self.cache_path, json.dumps({"format": SHA512_CACHE_FORMAT, "archives": archives}, indent=2))
+        except OSError:
+            # A read-only checkout only loses the cache across runs
+            pass
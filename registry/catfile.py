@@ -0,0 +1,99 @@
+"""Object lookups through a single ``git cat-file`` process.
+
+Forking git once per object is what makes registry-wide checks slow; all
+object ids are instead streamed through one ``git cat-file --batch-check``,
+or one ``git cat-file --batch`` when the object contents are needed.
+"""
+import subprocess
+import threading
+
+from registry.timings import timings
+
+
+def object_types(object_ids, cwd: str = None) -> dict:
+    # {object id: type}, type being None for objects missing from the repo
+    object_ids = list(dict.fromkeys(object_ids))
+    if not object_ids:
+        return {}
+    result = timings.run(["git", "cat-file", "--batch-check"], cwd=cwd, check=True,
+                         input="\n".join(object_ids) + "\n", stdout=subprocess.PIPE,
+                         universal_newlines=True)
+    types = {}
+    # One output line per input line, in order
+    for object_id, line in zip(object_ids, result.stdout.splitlines()):
+        if line.endswith((" missing", " ambiguous")):
+            types[object_id] = None
+        else:
+            types[object_id] = line.split()[1]
+    return types
+
+
+def object_sizes(object_ids, cwd: str = None) -> dict:
+    # {object id: size in bytes}, missing objects being left out
+    object_ids = list(dict.fromkeys(object_ids))
+    if not object_ids:
+        return {}
+    result = timings.run(["git", "cat-file", "--batch-check=%(objectname) %(objectsize)"], cwd=cwd, check=True,
+                         input="\n".join(object_ids) + "\n", stdout=subprocess.PIPE,
+                         universal_newlines=True)
+    sizes = {}
+    for object_id, line in zip(object_ids, result.stdout.splitlines()):
+        if not line.endswith((" missing", " ambiguous")):
+            sizes[object_id] = int(line.split()[1])
+    return sizes
+
+
+class CatFileBatch(object):
+
+    #
+    # A 'git cat-file --batch' process kept open across several read()
+    # calls. Use as a context manager
+    #
+    def __init__(self, cwd: str = None) -> None:
+        self.cwd = cwd
+        self.__process = None
+        self.__timing = None
+        self.__record = None
+
+    def __enter__(self):
+        cmd = ["git", "cat-file", "--batch"]
+        self.__timing = timings.process(cmd)
+        self.__record = self.__timing.__enter__()
+        self.__process = subprocess.Popen(cmd, cwd=self.cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.__process.stdin.close()
+        self.__process.stdout.close()
+        self.__record.returncode = self.__process.wait()
+        self.__timing.__exit__(*exc)
+
+    def __write(self, object_ids: list) -> None:
+        for object_id in object_ids:
+            self.__process.stdin.write(object_id.encode() + b"\n")
+        self.__process.stdin.flush()
+
+    def read(self, object_ids):
+        # Yields (object id, type, content) in order, type and content being
+        # None for missing objects. The ids are written by another thread
+        # while the contents are read, so that neither pipe fills up. The
+        # generator must be consumed entirely
+        object_ids = list(object_ids)
+        writer = threading.Thread(target=self.__write, args=(object_ids,))
+        writer.start()
+        stdout = self.__process.stdout
+        try:
+            for object_id in object_ids:
+                header = stdout.readline()
+                if not header:
+                    raise EOFError("git cat-file --batch exited early")
+                if header.endswith((b" missing\n", b" ambiguous\n")):
+                    yield object_id, None, None
+                    continue
+                _, kind, size = header.split()
+                content = stdout.read(int(size))
+                # Each content is followed by a newline
+                stdout.read(1)
+                yield object_id, kind.decode(), content
+        finally:
+            writer.join()
@@ -0,0 +1,91 @@
+"""Compaction of the version files.
+
+A version entry is dropped when it is superseded (a higher port-version of
+the same version exists) or when its version falls out of the retention
+policy (only the N most recent versions of each port are kept). An entry
+pinned by any baseline, or matching the current ``vcpkg.json`` of its port,
+is always kept, and so are the versions that cannot be ordered
+(``version-string``, ``version-date``): the policy cannot rank them.
+"""
+from registry.catfile import CatFileBatch, object_sizes, object_types
+from registry.export import SUBMODULE_MODE
+from registry.gittree import TREE_MODE, parse_tree
+from registry.index import entry_version, parse_version, sort_entries
+
+
+def pinned_entries(baselines: dict, port: str) -> set:
+    # {(version, port-version)} of 'port' pinned by any baseline
+    pinned = set()
+    for baseline in baselines.values():
+        pin = baseline.get(port)
+        if pin is not None:
+            pinned.add((pin.get("baseline"), pin.get("port-version", 0)))
+    return pinned
+
+
+def compact_entries(entries: list, pinned: set, keep: int = None, superseded: bool = True) -> tuple:
+    # (kept, dropped) of 'entries'. 'keep' is the number of most recent
+    # versions retained (None for all), 'superseded' whether lower
+    # port-versions are dropped
+    entries = list(entries)
+    sort_entries(entries)
+    # Only the versions packaging can order are ranked
+    ranks = {}
+    for entry in entries:
+        if parse_version(entry_version(entry)) is not None:
+            ranks.setdefault(entry_version(entry), len(ranks))
+    kept = []
+    dropped = []
+    seen = set()
+    for entry in entries:
+        version = entry_version(entry)
+        key = (version, entry.get("port-version", 0))
+        newest = version not in seen
+        seen.add(version)
+        # Versions without a rank are never too old
+        retained = keep is None or version not in ranks or ranks[version] < keep
+        if key in pinned or (retained and (newest or not superseded)):
+            kept.append(entry)
+        else:
+            dropped.append(entry)
+    return kept, dropped
+
+
+def tree_blobs(tree_ids, cwd: str = None) -> dict:
+    # {tree id: set of the ids of every object below it}, through one
+    # git cat-file --batch process. Missing trees are left out
+    types = object_types(list(dict.fromkeys(tree_ids)), cwd)
+    objects = {tree_id: set() for tree_id, kind in types.items() if kind == "tree"}
+    children = {}
+    with CatFileBatch(cwd) as cat:
+        level = list(objects)
+        while level:
+            next_level = []
+            for object_id, kind, content in cat.read(level):
+                entries = parse_tree(content) if kind == "tree" else []
+                children[object_id] = [entry_id for mode, _, entry_id in entries if mode != SUBMODULE_MODE]
+                next_level.extend(entry_id for mode, _, entry_id in entries
+                                  if mode == TREE_MODE and entry_id not in children)
+            level = list(dict.fromkeys(next_level))
+
+    for tree_id, found in objects.items():
+        pending = [tree_id]
+        while pending:
+            object_id = pending.pop()
+            if object_id not in found:
+                found.add(object_id)
+                pending.extend(children.get(object_id, []))
+    return objects
+
+
+def freed_size(kept_trees, dropped_trees, cwd: str = None) -> tuple:
+    # (number of trees, bytes) only reachable through the dropped entries,
+    # uncompressed
+    kept_trees = set(kept_trees)
+    dropped_trees = set(dropped_trees) - kept_trees
+    if not dropped_trees:
+        return 0, 0
+    objects = tree_blobs(kept_trees | dropped_trees, cwd)
+    kept = set().union(*(objects[tree] for tree in kept_trees if tree in objects))
+    freed = set().union(*(objects[tree] for tree in dropped_trees if tree in objects)) - kept
+    return len([tree for tree in dropped_trees if tree in objects]), sum(object_sizes(freed, cwd).values())
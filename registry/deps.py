@@ -0,0 +1,78 @@
+"""Dependency graph of the ports of the registry.
+
+Built from ``ports/*/vcpkg.json``: plain names, object-form dependencies
+(``{"name": "grpc", "platform": "!wasm32"}``) and the dependencies of
+features all count. Only edges between ports of this registry are kept.
+"""
+import heapq
+
+
+def manifest_dependencies(manifest: dict) -> set:
+    dependencies = list(manifest.get("dependencies", []))
+    for feature in manifest.get("features", {}).values():
+        dependencies.extend(feature.get("dependencies", []))
+    return {dependency if isinstance(dependency, str) else dependency["name"] for dependency in dependencies}
+
+
+class CyclicDependency(Exception):
+    def __init__(self, ports: list, *args: object) -> None:
+        super().__init__(*args)
+        self.__ports = ports
+
+    @property
+    def message(self) -> str:
+        return f"Dependency cycle between ports: {', '.join(self.__ports)}"
+
+
+class DependencyGraph(object):
+
+    def __init__(self, manifests: dict) -> None:
+        # 'manifests' is {port: parsed vcpkg.json}
+        self.dependencies = {}
+        self.dependents = {port: set() for port in manifests}
+        for port, manifest in manifests.items():
+            self.dependencies[port] = {name for name in manifest_dependencies(manifest)
+                                       if name in manifests and name != port}
+            for dependency in self.dependencies[port]:
+                self.dependents[dependency].add(port)
+
+    @classmethod
+    def from_edges(cls, dependencies: dict):
+        # Graph of arbitrary nodes, 'dependencies' being {node: set of nodes}
+        graph = cls({})
+        graph.dependencies = {node: set(edges) for node, edges in dependencies.items()}
+        graph.dependents = {node: set() for node in dependencies}
+        for node, edges in dependencies.items():
+            for dependency in edges:
+                graph.dependents.setdefault(dependency, set()).add(node)
+        return graph
+
+    def transitive_dependents(self, ports) -> set:
+        # Every port depending, directly or not, on one of 'ports'
+        found = set()
+        pending = list(ports)
+        while pending:
+            for dependent in self.dependents.get(pending.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return found
+
+    def topological_order(self, ports=None) -> list:
+        # Dependencies first, ties broken by name so the order is stable
+        ports = set(self.dependencies if ports is None else ports)
+        remaining = {port: len(self.dependencies.get(port, set()) & ports) for port in ports}
+        ready = [port for port, count in remaining.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            port = heapq.heappop(ready)
+            order.append(port)
+            for dependent in self.dependents.get(port, ()):
+                if dependent in remaining:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        heapq.heappush(ready, dependent)
+        if len(order) != len(ports):
+            raise CyclicDependency(sorted(ports - set(order)))
+        return order
@@ -0,0 +1,125 @@
+"""Export of the registry to the vcpkg filesystem registry layout.
+
+A filesystem registry has the same ``versions/`` files, except that each
+entry points to a directory through a ``path`` (``$/`` being the registry
+root) instead of naming a git tree. Each git tree is materialized once, under
+``trees/<git-tree>``: the directory name is its content id, so a tree that is
+already exported never needs to be written again and an export only
+extracts the trees added since the previous one.
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from registry.catfile import CatFileBatch
+from registry.gittree import EXECUTABLE_MODE, SYMLINK_MODE, TREE_MODE, parse_tree
+from registry.index import atomic_write, render_json
+from registry.timings import timings
+
+TREES_DIR_PATH = "trees"
+SUBMODULE_MODE = b"160000"
+
+
+def tree_path(git_tree: str) -> str:
+    return f"$/{TREES_DIR_PATH}/{git_tree}"
+
+
+def filesystem_versions(entries: list) -> dict:
+    # Content of the filesystem registry version file of 'entries'
+    versions = []
+    for entry in entries:
+        converted = {"path": tree_path(entry["git-tree"])}
+        converted.update((key, value) for key, value in entry.items() if key != "git-tree")
+        versions.append(converted)
+    return {"versions": versions}
+
+
+def write_if_changed(path: str, text: str) -> bool:
+    try:
+        with open(path, 'r') as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    atomic_write(path, text)
+    return True
+
+
+def _write_file(path: str, mode: bytes, content: bytes) -> None:
+    if mode == SYMLINK_MODE:
+        try:
+            os.symlink(os.fsdecode(content), path)
+            return
+        except OSError:
+            # No symlink privilege (Windows): the target is written instead,
+            # as git does with core.symlinks=false
+            pass
+    with open(path, 'wb') as f:
+        f.write(content)
+    if mode == EXECUTABLE_MODE:
+        os.chmod(path, os.stat(path).st_mode | 0o111)
+
+
+def extract_trees(tree_ids, destination: str, cwd: str = None, max_workers: int = None) -> list:
+    # Writes each tree to <destination>/<tree id>, unless already there.
+    # Objects are read level by level through one git cat-file --batch
+    # process while a thread pool writes the files. Each tree is staged
+    # then renamed, so an interrupted export leaves no partial tree.
+    # Returns the extracted tree ids
+    tree_ids = [tree_id for tree_id in dict.fromkeys(tree_ids)
+                if not os.path.isdir(os.path.join(destination, tree_id))]
+    if not tree_ids:
+        return []
+    os.makedirs(destination, exist_ok=True)
+    staging = {tree_id: os.path.join(destination, f".tmp-{tree_id}-{os.getpid()}") for tree_id in tree_ids}
+
+    try:
+        with timings.phase("extract trees"), CatFileBatch(cwd) as cat, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            level = [(tree_id, staging[tree_id], TREE_MODE) for tree_id in tree_ids]
+            while level:
+                next_level = []
+                objects = cat.read(object_id for object_id, _, _ in level)
+                for (object_id, kind, content), (_, path, mode) in zip(objects, level):
+                    if kind is None:
+                        raise FileNotFoundError(f"git object {object_id} not found", object_id)
+                    if mode != TREE_MODE:
+                        futures.append(executor.submit(_write_file, path, mode, content))
+                        continue
+                    os.makedirs(path, exist_ok=True)
+                    for entry_mode, name, entry_id in parse_tree(content):
+                        # Submodules have no content in this repository
+                        if entry_mode != SUBMODULE_MODE:
+                            next_level.append((entry_id, os.path.join(path, os.fsdecode(name)), entry_mode))
+                level = next_level
+            for future in futures:
+                future.result()
+
+        for tree_id, path in staging.items():
+            try:
+                os.rename(path, os.path.join(destination, tree_id))
+            except OSError:
+                # Exported meanwhile by a concurrent run
+                shutil.rmtree(path)
+    except BaseException:
+        for path in staging.values():
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+    return tree_ids
+
+
+def export_version_files(versions: dict, baselines: dict, output: str) -> list:
+    # Writes versions/<x>-/<port>.json and versions/baseline.json of the
+    # filesystem registry. 'versions' maps each port to its git registry
+    # entries. Only the files whose content changed are written, the
+    # written paths are returned
+    written = []
+    for port, entries in sorted(versions.items()):
+        path = os.path.join(output, "versions", f"{port[0]}-", f"{port}.json")
+        if write_if_changed(path, render_json(filesystem_versions(entries))):
+            written.append(path)
+    path = os.path.join(output, "versions", "baseline.json")
+    if write_if_changed(path, render_json(baselines)):
+        written.append(path)
+    return written
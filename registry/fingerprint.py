@@ -0,0 +1,140 @@
+"""Transitive fingerprints of the registry ports.
+
+The fingerprint of a port covers every file of ``ports/<port>/`` (through
+the git tree id of that directory) and the fingerprints of the ports of this
+registry it depends on, computed in dependency order. A port whose
+fingerprint did not change between two commits, or between a commit and the
+working tree, needs no rebuild.
+
+Reading the dependencies of a port means parsing its ``vcpkg.json``. They
+only depend on the port tree, so they are cached by git tree id in
+``.port-fingerprints.json``: a tree seen by a previous run is never read
+again.
+"""
+import hashlib
+import json
+import os
+import subprocess
+
+from registry.catfile import CatFileBatch
+from registry.deps import DependencyGraph, manifest_dependencies
+from registry.gittree import TREE_MODE, hash_tree, parse_tree
+from registry.index import PORTS_DIR_PATH, atomic_write
+from registry.timings import timings
+
+FINGERPRINT_CACHE_PATH = ".port-fingerprints.json"
+FINGERPRINT_CACHE_FORMAT = 1
+WORKTREE = None
+
+
+def port_trees(revision: str = WORKTREE, root: str = ".") -> dict:
+    # {port: git tree id of ports/<port>} at 'revision', or in the working
+    # tree (as it would be committed) when 'revision' is None
+    trees = {}
+    if revision is WORKTREE:
+        ports_dir = os.path.join(root, PORTS_DIR_PATH)
+        for name in sorted(os.listdir(ports_dir)):
+            if os.path.isdir(os.path.join(ports_dir, name)):
+                trees[name] = hash_tree(os.path.join(ports_dir, name))
+        return trees
+    result = timings.run(["git", "ls-tree", "-z", f"{revision}:{PORTS_DIR_PATH}"], cwd=root, check=True,
+                         stdout=subprocess.PIPE)
+    for line in result.stdout.split(b"\0"):
+        if not line:
+            continue
+        info, name = line.split(b"\t", 1)
+        _, kind, object_id = info.split()
+        if kind == b"tree":
+            trees[os.fsdecode(name)] = object_id.decode()
+    return trees
+
+
+class FingerprintCache(object):
+
+    def __init__(self, root: str = ".") -> None:
+        self.root = root
+        self.path = os.path.join(root, FINGERPRINT_CACHE_PATH)
+        # {git tree id: dependency names of its vcpkg.json}
+        self.dependencies = {}
+        self.__dirty = False
+
+    @classmethod
+    def load(cls, root: str = "."):
+        cache = cls(root)
+        try:
+            with open(cache.path, 'r') as f:
+                data = json.loads(f.read())
+            if data.get("format") == FINGERPRINT_CACHE_FORMAT:
+                cache.dependencies = data["trees"]
+        except (FileNotFoundError, ValueError):
+            pass
+        return cache
+
+    def __add(self, tree: str, manifest) -> None:
+        # A tree without vcpkg.json has no dependencies
+        self.dependencies[tree] = sorted(manifest_dependencies(json.loads(manifest))) if manifest else []
+        self.__dirty = True
+
+    def resolve(self, trees: dict, revision: str = WORKTREE) -> dict:
+        # {port: dependency names}, reading the manifests of the trees
+        # missing from the cache only
+        missing = {port: tree for port, tree in trees.items() if tree not in self.dependencies}
+        if missing and revision is WORKTREE:
+            for port, tree in missing.items():
+                try:
+                    with open(os.path.join(self.root, PORTS_DIR_PATH, port, "vcpkg.json"), 'rb') as f:
+                        self.__add(tree, f.read())
+                except FileNotFoundError:
+                    self.__add(tree, None)
+        elif missing:
+            # The trees, then the vcpkg.json blobs, through one git process
+            with timings.phase("read manifests"), CatFileBatch(self.root) as cat:
+                manifests = {}
+                for tree, _, content in cat.read(list(dict.fromkeys(missing.values()))):
+                    entries = parse_tree(content or b"")
+                    manifests[tree] = next((entry_id for mode, name, entry_id in entries
+                                            if name == b"vcpkg.json" and mode != TREE_MODE), None)
+                blob_ids = [blob for blob in dict.fromkeys(manifests.values()) if blob]
+                blobs = {blob: content for blob, _, content in cat.read(blob_ids)}
+                for tree, blob in manifests.items():
+                    self.__add(tree, blobs.get(blob))
+        return {port: self.dependencies[tree] for port, tree in trees.items()}
+
+    def save(self) -> None:
+        if self.__dirty:
+            atomic_write(self.path, json.dumps({"format": FINGERPRINT_CACHE_FORMAT, "trees": self.dependencies},
+                                               separators=(",", ":"), sort_keys=True))
+            self.__dirty = False
+
+
+def fingerprints(trees: dict, dependencies: dict) -> dict:
+    # {port: fingerprint}, in dependency order. Only the dependencies that
+    # are ports of the registry feed the fingerprint
+    graph = DependencyGraph.from_edges({port: {name for name in dependencies[port] if name in trees and name != port}
+                                        for port in trees})
+    result = {}
+    for port in graph.topological_order():
+        h = hashlib.sha256(f"{port}\0{trees[port]}\0".encode())
+        for dependency in sorted(graph.dependencies[port]):
+            h.update(f"{dependency}\0{result[dependency]}\0".encode())
+        result[port] = h.hexdigest()
+    return result
+
+
+def port_fingerprints(revision: str = WORKTREE, root: str = ".", use_cache: bool = True) -> dict:
+    cache = FingerprintCache.load(root) if use_cache else FingerprintCache(root)
+    with timings.phase("compute fingerprints"):
+        trees = port_trees(revision, root)
+        result = fingerprints(trees, cache.resolve(trees, revision))
+    if use_cache:
+        cache.save()
+    return result
+
+
+def changed_ports(before: dict, after: dict) -> tuple:
+    # (changed, removed): the ports of 'after' whose fingerprint differs from
+    # 'before' (new ports included), in the order of 'after', and the ports
+    # that are gone
+    changed = [port for port, fingerprint in after.items() if before.get(port) != fingerprint]
+    removed = sorted(set(before) - set(after))
+    return changed, removed
@@ -0,0 +1,129 @@
+"""Pure-Python computation of git object ids.
+
+vcpkg identifies each port revision by the id of the git tree object of
+``ports/<port>/``. Computing that id straight from the working tree avoids
+having to commit first and ``git rev-parse`` afterwards.
+
+Only the files ``git add`` would stage are hashed: in a git work tree, the
+tracked files and the untracked files that are not ignored. Files are hashed
+byte for byte, which matches what git stores as long as no clean filter or
+``core.autocrlf`` conversion applies to the port files.
+"""
+import hashlib
+import os
+import stat
+import subprocess
+
+from registry.timings import timings
+
+BLOB_MODE = b"100644"
+EXECUTABLE_MODE = b"100755"
+SYMLINK_MODE = b"120000"
+TREE_MODE = b"40000"
+
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_object(kind: str, content: bytes) -> str:
+    h = hashlib.sha1(f"{kind} {len(content)}\0".encode())
+    h.update(content)
+    return h.hexdigest()
+
+
+def hash_blob(path: str) -> str:
+    # Streamed so that large files are never loaded in memory at once
+    h = hashlib.sha1(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_tree(content: bytes) -> list:
+    # [(mode, name, id)] of the raw content of a tree object, mode and name
+    # as bytes and id as hex
+    entries = []
+    position = 0
+    while position < len(content):
+        space = content.index(b" ", position)
+        nul = content.index(b"\0", space)
+        entries.append((content[position:space], content[space + 1:nul], content[nul + 1:nul + 21].hex()))
+        position = nul + 21
+    return entries
+
+
+def _sort_key(entry):
+    # git orders tree entries by name, directories being compared as 'name/'
+    mode, name, _ = entry
+    return name + b"/" if mode == TREE_MODE else name
+
+
+def staged_paths(directory: str):
+    # Paths below 'directory' (relative, '/'-separated) 'git add' would
+    # stage: the tracked files and the untracked ones that are not ignored.
+    # None outside of a git work tree, where every file counts
+    result = timings.run(["git", "-C", directory, "ls-files", "-z", "--cached", "--others", "--exclude-standard",
+                          "--", "."], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        return None
+    return {os.fsdecode(path) for path in result.stdout.split(b"\0") if path}
+
+
+def _tree_entries(directory: str, overrides: dict, prefix: str, paths) -> list:
+    entries = []
+    seen = set()
+    with os.scandir(directory) as it:
+        for dir_entry in it:
+            if dir_entry.name == ".git":
+                continue
+            relative = prefix + dir_entry.name
+            seen.add(dir_entry.name)
+            if dir_entry.is_dir(follow_symlinks=False):
+                tree = _hash_tree(dir_entry.path, overrides, relative + "/", paths)
+                if tree is not None:
+                    entries.append((TREE_MODE, os.fsencode(dir_entry.name), tree))
+            elif paths is not None and relative not in paths and relative not in overrides:
+                # Ignored by git
+                continue
+            elif dir_entry.is_symlink():
+                target = os.fsencode(os.readlink(dir_entry.path))
+                entries.append((SYMLINK_MODE, os.fsencode(dir_entry.name), hash_object("blob", target)))
+            elif relative in overrides:
+                mode = EXECUTABLE_MODE if dir_entry.stat().st_mode & stat.S_IXUSR else BLOB_MODE
+                entries.append((mode, os.fsencode(dir_entry.name), hash_object("blob", overrides[relative])))
+            else:
+                mode = EXECUTABLE_MODE if dir_entry.stat().st_mode & stat.S_IXUSR else BLOB_MODE
+                entries.append((mode, os.fsencode(dir_entry.name), hash_blob(dir_entry.path)))
+
+    # Overridden files that do not exist yet on disk
+    for relative, content in overrides.items():
+        if not relative.startswith(prefix):
+            continue
+        name = relative[len(prefix):]
+        if "/" in name or name in seen:
+            continue
+        entries.append((BLOB_MODE, os.fsencode(name), hash_object("blob", content)))
+    return entries
+
+
+def _hash_tree(directory: str, overrides: dict, prefix: str, paths):
+    entries = _tree_entries(directory, overrides, prefix, paths)
+    # git does not track empty directories
+    if not entries:
+        return None
+    entries.sort(key=_sort_key)
+    content = b"".join(mode + b" " + name + b"\0" + bytes.fromhex(sha) for mode, name, sha in entries)
+    return hash_object("tree", content)
+
+
+def hash_tree(directory: str, overrides: dict = None) -> str:
+    """Return the git tree id ``directory`` would have once committed.
+
+    ``overrides`` maps paths relative to ``directory`` (using '/') to the
+    bytes they are about to be written with, so that the id can be computed
+    before the files are actually modified.
+    """
+    with timings.phase("hash tree"):
+        return _hash_tree(directory, overrides or {}, "", staged_paths(directory)) or EMPTY_TREE
@@ -0,0 +1,289 @@
+"""In-memory model of the registry files.
+
+``RegistryIndex`` parses ``versions/baseline.json``, every
+``versions/<x>-/<port>.json`` and every ``ports/<port>/vcpkg.json`` once and
+keeps them indexed, so that version lookups do not re-read or linearly scan
+the version files. Only the files whose content actually changed are written
+back, each one atomically and under the registry lock. Baseline pins other
+writers saved in the meantime are merged rather than overwritten.
+
+Version entries are kept newest first, by version then port-version, and
+new entries are inserted at their place by bisection.
+"""
+import bisect
+import glob
+import json
+import os
+import stat
+import tempfile
+
+from packaging.version import InvalidVersion, Version
+
+from registry.lock import RegistryLock
+from registry.timings import timings
+
+VERSIONS_DIR_PATH = "versions"
+VERSION_BASELINE_PATH = os.path.join(VERSIONS_DIR_PATH, "baseline.json")
+PORTS_DIR_PATH = "ports"
+
+VERSION_KEYS = ("version", "version-semver", "version-date", "version-string")
+
+
+def version_file_path(port: str) -> str:
+    return os.path.join(VERSIONS_DIR_PATH, f"{port[0]}-", f"{port}.json")
+
+
+def render_json(data) -> str:
+    return json.dumps(data, indent=2)
+
+
+def entry_version(entry: dict):
+    for key in VERSION_KEYS:
+        if key in entry:
+            return entry[key]
+    return None
+
+
+def parse_version(version: str):
+    # None for versions packaging cannot order (e.g. version-string)
+    try:
+        return Version(version)
+    except (InvalidVersion, TypeError):
+        return None
+
+
+class ConcurrentUpdate(Exception):
+    def __init__(self, path: str, *args: object) -> None:
+        super().__init__(*args)
+        self.__path = path
+
+    @property
+    def message(self) -> str:
+        return f"'{self.__path}' was modified by another update since it was read"
+
+
+class _NewestFirst(object):
+    # Sort key of version entries, newest first. Versions packaging cannot
+    # order (e.g. version-string) come last, in their current order
+    __slots__ = ("key",)
+
+    def __init__(self, entry: dict) -> None:
+        parsed = parse_version(entry_version(entry))
+        self.key = (parsed is not None, parsed or _ZERO_VERSION, entry.get("port-version", 0))
+
+    def __lt__(self, other) -> bool:
+        return self.key > other.key
+
+
+_ZERO_VERSION = Version("0")
+
+
+def sort_entries(entries: list) -> None:
+    # In place and stable
+    entries.sort(key=_NewestFirst)
+
+
+def atomic_write(path: str, text) -> None:
+    # Written next to the destination then renamed over it, so readers
+    # never see a half-written file. bytes are written as they are
+    with timings.phase("write file"):
+        _atomic_write(path, text)
+
+
+def _atomic_write(path: str, text) -> None:
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+        # mkstemp creates the file 0600, keep the mode a plain open() would give
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class RegistryIndex(object):
+
+    def __init__(self, root: str = ".") -> None:
+        self.root = root
+        self.baselines = {}
+        self.manifests = {}
+        self.versions = {}
+        self.__documents = {}
+        self.__texts = {}
+        self.__by_version = {}
+        self.__sorted = {}
+        self.__baseline_path = None
+
+    @classmethod
+    def load(cls, root: str = "."):
+        index = cls(root)
+        with timings.phase("load registry"):
+            index.load_baselines()
+            for path in glob.glob(os.path.join(root, PORTS_DIR_PATH, "*", "vcpkg.json")):
+                index.load_manifest(os.path.basename(os.path.dirname(path)))
+            for path in glob.glob(os.path.join(root, VERSIONS_DIR_PATH, "*-", "*.json")):
+                index.load_versions(os.path.splitext(os.path.basename(path))[0])
+        return index
+
+    def __read(self, path: str, default=None):
+        try:
+            with open(os.path.join(self.root, path), 'r') as f:
+                text = f.read()
+            with timings.phase("parse json"):
+                data = json.loads(text)
+        except FileNotFoundError:
+            if default is None:
+                raise
+            data = default
+        self.__documents[path] = data
+        # Compared against on save to find out what actually changed
+        self.__texts[path] = render_json(data)
+        return data
+
+    def load_baselines(self, path: str = VERSION_BASELINE_PATH) -> dict:
+        self.baselines = self.__read(path)
+        self.__baseline_path = path
+        return self.baselines
+
+    def load_manifest(self, port: str) -> dict:
+        self.manifests[port] = self.__read(os.path.join(PORTS_DIR_PATH, port, "vcpkg.json"))
+        return self.manifests[port]
+
+    def load_versions(self, port: str, path: str = None) -> list:
+        # A missing version file is a port that has not been published yet
+        data = self.__read(path or version_file_path(port), {"versions": []})
+        self.versions[port] = data["versions"]
+        self.__reindex(port)
+        return self.versions[port]
+
+    def __reindex(self, port: str) -> None:
+        by_version = {}
+        for entry in self.versions[port]:
+            by_version.setdefault((port, entry_version(entry)), []).append(entry)
+        for key in [key for key in self.__by_version if key[0] == port]:
+            del self.__by_version[key]
+        self.__by_version.update(by_version)
+        parsed = {parse_version(version) for _, version in by_version}
+        self.__sorted[port] = sorted(v for v in parsed if v is not None)
+
+    def has_port(self, port: str) -> bool:
+        return os.path.isdir(os.path.join(self.root, PORTS_DIR_PATH, port))
+
+    def ports(self) -> list:
+        return sorted(set(self.manifests) | set(self.versions))
+
+    def find(self, port: str, version: str) -> list:
+        # Entries of 'version', in version file order (newest first)
+        return self.__by_version.get((port, version), [])
+
+    def sorted_versions(self, port: str) -> list:
+        return self.__sorted.get(port, [])
+
+    def latest_version(self, port: str):
+        versions = self.sorted_versions(port)
+        return versions[-1] if versions else None
+
+    def current_port_version(self, port: str, version: str) -> int:
+        # -1 means the version is not known yet (i.e. new version)
+        entries = self.find(port, version)
+        if not entries:
+            return -1
+        # port-version field may be omitted, 0 is assumed
+        return max(entry.get("port-version", 0) for entry in entries)
+
+    def sort_versions(self, port: str) -> bool:
+        # Puts the version file of 'port' in order. Returns whether it was not
+        versions = self.versions[port]
+        keys = [_NewestFirst(entry) for entry in versions]
+        if not any(b < a for a, b in zip(keys, keys[1:])):
+            return False
+        sort_entries(versions)
+        self.__reindex(port)
+        return True
+
+    def add_version(self, port: str, version: str, git_tree: str) -> int:
+        if port not in self.versions:
+            self.load_versions(port)
+        # Files written before the order was enforced are sorted once
+        self.sort_versions(port)
+        versions = self.versions[port]
+        # update existing version: add new entry with incremented port version
+        port_version = self.current_port_version(port, version) + 1
+
+        entry = {"version": version, "git-tree": git_tree, "port-version": port_version}
+        # A parallel key list, bisect only takes key= since Python 3.10
+        keys = [_NewestFirst(existing) for existing in versions]
+        versions.insert(bisect.bisect_left(keys, _NewestFirst(entry)), entry)
+        entries = self.__by_version.setdefault((port, version), [])
+        entries.insert(0, entry)
+        parsed = parse_version(version)
+        if len(entries) == 1 and parsed is not None:
+            bisect.insort(self.__sorted.setdefault(port, []), parsed)
+        return port_version
+
+    def replace_versions(self, port: str, entries: list) -> None:
+        # The version file of 'port' is the same list object as the parsed
+        # document, it is updated in place
+        self.versions[port][:] = entries
+        self.__reindex(port)
+
+    def pending(self) -> dict:
+        # {path: text} of every loaded file whose content changed
+        changes = {}
+        for path, data in self.__documents.items():
+            text = render_json(data)
+            if text != self.__texts[path]:
+                changes[path] = text
+        return changes
+
+    def __read_current(self, path: str):
+        try:
+            with open(os.path.join(self.root, path), 'r') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def __merge_baselines(self, current: dict) -> str:
+        # Apply the pins changed in memory since load onto the baselines
+        # currently on disk. Returns the merged text
+        loaded = json.loads(self.__texts[self.__baseline_path])
+        for name, pins in self.baselines.items():
+            before = loaded.get(name, {})
+            target = current.setdefault(name, {})
+            for port, pin in pins.items():
+                if before.get(port) != pin:
+                    target[port] = pin
+            for port in set(before) - set(pins):
+                target.pop(port, None)
+        # Keep the same object, other references to it see the merge
+        self.baselines.clear()
+        self.baselines.update(current)
+        return render_json(self.baselines)
+
+    def save(self) -> list:
+        # Files are checked against what is on disk under the lock: the
+        # baselines are merged, any other file changed by another writer
+        # since it was read is a conflict
+        with RegistryLock(self.root):
+            changes = self.pending()
+            for path in changes:
+                current = self.__read_current(path)
+                if current is None or render_json(current) == self.__texts[path]:
+                    continue
+                if path != self.__baseline_path:
+                    raise ConcurrentUpdate(path)
+                changes[path] = self.__merge_baselines(current)
+            for path, text in changes.items():
+                atomic_write(os.path.join(self.root, path), text)
+                self.__texts[path] = text
+        return list(changes)
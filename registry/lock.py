@@ -0,0 +1,109 @@
+"""Advisory lock serializing the writers of a registry checkout.
+
+Every job updating the registry files takes an exclusive lock on
+``.registry.lock`` (``flock`` on POSIX, ``msvcrt.locking`` on Windows) for
+its read-modify-write-commit sequence, so that concurrent updates of
+different ports neither lose each other's baseline entries nor race on the
+git index. The lock is re-entrant within a process.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_PATH = ".registry.lock"
+POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    def __init__(self, path: str, timeout: float, *args: object) -> None:
+        super().__init__(*args)
+        self.__path = path
+        self.__timeout = timeout
+
+    @property
+    def message(self) -> str:
+        return f"Could not lock '{self.__path}' within {self.__timeout} s, another update is running"
+
+
+class _ProcessLock(object):
+    # State shared by every RegistryLock of the same file in this process:
+    # the OS lock belongs to the open file, taking it twice would deadlock
+    def __init__(self) -> None:
+        self.mutex = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+
+_locks = {}
+_locks_mutex = threading.Lock()
+
+
+def _try_lock(f) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RegistryLock(object):
+
+    def __init__(self, root: str = ".", timeout: float = None) -> None:
+        # timeout None waits forever
+        self.path = os.path.abspath(os.path.join(root, LOCK_PATH))
+        self.timeout = timeout
+        with _locks_mutex:
+            self.__lock = _locks.setdefault(self.path, _ProcessLock())
+
+    def acquire(self) -> None:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if not self.__lock.mutex.acquire(timeout=-1 if self.timeout is None else self.timeout):
+            raise LockTimeout(self.path, self.timeout)
+        try:
+            if self.__lock.depth == 0:
+                f = open(self.path, 'a+')
+                while not _try_lock(f):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        f.close()
+                        raise LockTimeout(self.path, self.timeout)
+                    time.sleep(POLL_INTERVAL)
+                self.__lock.file = f
+            self.__lock.depth += 1
+        except BaseException:
+            self.__lock.mutex.release()
+            raise
+
+    def release(self) -> None:
+        self.__lock.depth -= 1
+        if self.__lock.depth == 0:
+            f = self.__lock.file
+            self.__lock.file = None
+            try:
+                _unlock(f)
+            finally:
+                f.close()
+        self.__lock.mutex.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
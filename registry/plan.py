@@ -0,0 +1,161 @@
+"""Feature-resolved install plans of the registry ports, per triplet.
+
+Every ``ports/*/vcpkg.json`` is parsed once. For each triplet, the requested
+ports are expanded the way vcpkg does: dependencies whose ``platform`` does
+not match are dropped, default features are added unless a dependency asks
+for ``"default-features": false``, and the dependencies of every requested
+feature are followed. Ports that are not in this registry are kept as
+leaves, with the features requested from them. ``"host": true``
+dependencies, and everything they depend on, are resolved for the host
+triplet and listed apart from the ports of the target triplet. Plans are cached by the hash
+of the manifest contents, so they are only computed again when a manifest
+changes.
+"""
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from registry.deps import DependencyGraph
+from registry.index import PORTS_DIR_PATH, atomic_write
+from registry.platform import native_triplet, parse_platform, triplet_identifiers
+from registry.timings import timings
+
+PLAN_CACHE_PATH = ".install-plans.json"
+
+
+def load_manifests(root: str = ".") -> tuple:
+    # ({port: manifest}, hash of the manifest contents)
+    manifests = {}
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(root, PORTS_DIR_PATH, "*", "vcpkg.json"))):
+        port = os.path.basename(os.path.dirname(path))
+        with open(path, 'rb') as f:
+            content = f.read()
+        h.update(f"{port}\0{len(content)}\0".encode())
+        h.update(content)
+        manifests[port] = json.loads(content)
+    return manifests, h.hexdigest()
+
+
+def _names(entries: list, applies) -> set:
+    # Feature lists hold names or {"name", "platform"} objects
+    names = set()
+    for entry in entries:
+        if isinstance(entry, str):
+            names.add(entry)
+        elif applies(entry.get("platform")):
+            names.add(entry["name"])
+    return names
+
+
+def install_plan(manifests: dict, triplet: str, roots: list, host_triplet: str = None) -> dict:
+    # The nodes are (port, host), 'host' telling whether the port is built
+    # for the host triplet
+    host_triplet = host_triplet or native_triplet()
+    identifiers = {False: triplet_identifiers(triplet), True: triplet_identifiers(host_triplet)}
+
+    features = {}
+    defaults = set()
+    edges = {}
+    unsupported = []
+    pending = [(port, set(), True, False) for port in roots]
+    while pending:
+        port, requested, default_features, host = pending.pop()
+        node = (port, host)
+
+        def applies(expression) -> bool:
+            return parse_platform(expression or "")(identifiers[host])
+
+        label = f"{port}:{host_triplet}" if host else port
+        manifest = manifests.get(port)
+        have = features.setdefault(node, set())
+        edges.setdefault(node, set())
+        new = set(requested) - have
+        if "core" not in have:
+            new.add("core")
+        if default_features and node not in defaults:
+            defaults.add(node)
+            if manifest is not None:
+                new |= _names(manifest.get("default-features", []), applies) - have
+            else:
+                new.add("default")
+        if not new:
+            continue
+        have |= new
+        # Ports of other registries are leaves, vcpkg resolves them
+        if manifest is None:
+            continue
+
+        dependencies = []
+        if "core" in new:
+            if not applies(manifest.get("supports")):
+                unsupported.append(f"{label}: supports '{manifest['supports']}'")
+            dependencies.extend(manifest.get("dependencies", []))
+        for name in sorted(new - {"core", "default"}):
+            feature = manifest.get("features", {}).get(name)
+            if feature is None:
+                unsupported.append(f"{label}[{name}]: no such feature")
+                continue
+            if not applies(feature.get("supports")):
+                unsupported.append(f"{label}[{name}]: supports '{feature['supports']}'")
+            dependencies.extend(feature.get("dependencies", []))
+
+        for dependency in dependencies:
+            if isinstance(dependency, str):
+                dependency = {"name": dependency}
+            if not applies(dependency.get("platform")):
+                continue
+            # The dependencies of a host port are host ports as well
+            name = dependency["name"]
+            dependency_host = host or dependency.get("host", False)
+            if (name, dependency_host) != node:
+                edges[node].add((name, dependency_host))
+            pending.append((name, _names(dependency.get("features", []), applies),
+                            dependency.get("default-features", True), dependency_host))
+
+    # Host ports never depend on target ports: each side is ordered alone
+    steps = {}
+    for side in (False, True):
+        graph = DependencyGraph.from_edges({port: {name for name, host in dependencies if host == side}
+                                            for (port, host), dependencies in edges.items() if host == side})
+        steps[side] = [{"port": port, "features": sorted(features[(port, side)] - {"core"}),
+                        "registry": port in manifests} for port in graph.topological_order()]
+    return {"triplet": triplet, "plan": steps[False], "host-triplet": host_triplet, "host": steps[True],
+            "unsupported": unsupported}
+
+
+def _cache_key(triplet: str, roots: list, host_triplet: str) -> str:
+    return triplet + ":" + host_triplet + ":" + ",".join(roots)
+
+
+def install_plans(triplets: list, roots: list = None, root: str = ".", max_workers: int = None,
+                  use_cache: bool = True, host_triplet: str = None) -> dict:
+    # {triplet: plan}; the triplets missing from the cache are computed in
+    # parallel, one process each
+    manifests, digest = load_manifests(root)
+    roots = sorted(roots or manifests)
+    host_triplet = host_triplet or native_triplet()
+    cache_path = os.path.join(root, PLAN_CACHE_PATH)
+    cache = {"manifests": digest, "plans": {}}
+    if use_cache:
+        try:
+            with open(cache_path, 'r') as f:
+                data = json.loads(f.read())
+            # A manifest changed: every plan is out of date
+            if data.get("manifests") == digest:
+                cache = data
+        except (FileNotFoundError, ValueError):
+            pass
+
+    missing = [triplet for triplet in dict.fromkeys(triplets) if _cache_key(triplet, roots, host_triplet) not in cache["plans"]]
+    if missing:
+        with timings.phase("compute install plans"), ProcessPoolExecutor(max_workers=max_workers) as executor:
+            plans = executor.map(install_plan, [manifests] * len(missing), missing, [roots] * len(missing),
+                                 [host_triplet] * len(missing))
+            for triplet, plan in zip(missing, plans):
+                cache["plans"][_cache_key(triplet, roots, host_triplet)] = plan
+        if use_cache:
+            atomic_write(cache_path, json.dumps(cache, separators=(",", ":")))
+    return {triplet: cache["plans"][_cache_key(triplet, roots, host_triplet)] for triplet in triplets}
@@ -0,0 +1,146 @@
+"""vcpkg platform expressions, evaluated against a triplet.
+
+A platform expression (``"platform"`` of a dependency, ``"supports"`` of a
+port or a feature) combines identifiers with ``!``, ``&``, ``|`` and
+parentheses; ``,`` is the legacy spelling of ``|``. As in vcpkg, ``&`` and
+``|`` cannot be mixed without parentheses. The identifiers a triplet
+satisfies are derived from its name (``<arch>-<os>[-<linkage>]``), the way
+the standard vcpkg triplets are defined.
+"""
+import functools
+import platform
+import re
+import sys
+
+TOKEN_PATTERN = re.compile(r"\s*(?:([a-z0-9_-]+)|(.))")
+
+# Target systems statically linked by default
+STATIC_SYSTEMS = {"linux", "osx", "ios", "android", "emscripten", "freebsd", "openbsd"}
+
+# platform.machine() and sys.platform names of the vcpkg architectures and systems
+NATIVE_ARCHITECTURES = {"x86_64": "x64", "amd64": "x64", "aarch64": "arm64", "arm64": "arm64", "i386": "x86",
+                        "i686": "x86", "x86": "x86", "armv7l": "arm"}
+NATIVE_SYSTEMS = {"win32": "windows", "cygwin": "windows", "darwin": "osx", "linux": "linux",
+                  "freebsd": "freebsd", "openbsd": "openbsd"}
+
+
+class PlatformExpressionError(Exception):
+    def __init__(self, expression: str, reason: str, *args: object) -> None:
+        super().__init__(*args)
+        self.__expression = expression
+        self.__reason = reason
+
+    @property
+    def message(self) -> str:
+        return f"Invalid platform expression '{self.__expression}': {self.__reason}"
+
+
+def triplet_identifiers(triplet: str) -> frozenset:
+    parts = triplet.lower().split("-")
+    architecture, system, options = parts[0], (parts[1] if len(parts) > 1 else ""), set(parts[2:])
+    identifiers = {architecture, system}
+    if architecture in ("arm", "arm64", "arm64ec"):
+        identifiers.add("arm")
+        identifiers.add("arm32" if architecture == "arm" else architecture)
+    if system == "uwp":
+        identifiers.add("windows")
+    if system == "mingw":
+        identifiers.add("windows")
+        identifiers.add("mingw")
+    if system == "emscripten":
+        identifiers.add("wasm32")
+    if "static" in options or (system in STATIC_SYSTEMS and "dynamic" not in options):
+        identifiers.add("static")
+        # -static-md keeps the dynamic CRT
+        if "md" not in options:
+            identifiers.add("staticcrt")
+    return frozenset(identifiers - {""})
+
+
+def native_triplet() -> str:
+    # The triplet vcpkg picks as host triplet on this machine
+    architecture = NATIVE_ARCHITECTURES.get(platform.machine().lower(), "x64")
+    system = next((name for prefix, name in NATIVE_SYSTEMS.items() if sys.platform.startswith(prefix)), "linux")
+    return f"{architecture}-{system}"
+
+
+def _tokens(expression: str) -> list:
+    tokens = []
+    for name, symbol in TOKEN_PATTERN.findall(expression):
+        if name:
+            tokens.append(("name", name))
+        elif symbol in "!&|(),":
+            tokens.append((symbol, symbol))
+        elif not symbol.isspace():
+            raise PlatformExpressionError(expression, f"unexpected character '{symbol}'")
+    return tokens
+
+
+class _Parser(object):
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.tokens = _tokens(expression)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            # An empty expression is always true
+            return lambda identifiers: True
+        node = self.binary()
+        if self.peek() is not None:
+            raise PlatformExpressionError(self.expression, f"unexpected '{self.take()[1]}'")
+        return node
+
+    def binary(self):
+        operands = [self.unary()]
+        operator = None
+        while self.peek() in ("&", "|", ","):
+            token = self.take()[0]
+            if token == ",":
+                token = "|"
+            if operator is not None and token != operator:
+                raise PlatformExpressionError(self.expression, "'&' and '|' must be grouped with parentheses")
+            operator = token
+            operands.append(self.unary())
+        if operator == "&":
+            return lambda identifiers: all(operand(identifiers) for operand in operands)
+        if operator == "|":
+            return lambda identifiers: any(operand(identifiers) for operand in operands)
+        return operands[0]
+
+    def unary(self):
+        kind = self.peek()
+        if kind == "!":
+            self.take()
+            operand = self.unary()
+            return lambda identifiers: not operand(identifiers)
+        if kind == "(":
+            self.take()
+            node = self.binary()
+            if self.peek() != ")":
+                raise PlatformExpressionError(self.expression, "missing ')'")
+            self.take()
+            return node
+        if kind == "name":
+            name = self.take()[1]
+            return lambda identifiers: name in identifiers
+        raise PlatformExpressionError(self.expression, "unexpected end" if kind is None else f"unexpected '{kind}'")
+
+
+@functools.lru_cache(maxsize=None)
+def parse_platform(expression: str):
+    # A function of the set of identifiers of a triplet
+    return _Parser(expression).parse()
+
+
+def evaluate_platform(expression: str, triplet: str) -> bool:
+    return parse_platform(expression or "")(triplet_identifiers(triplet))
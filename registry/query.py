@@ -0,0 +1,147 @@
+"""Precomputed index answering version queries without parsing the registry.
+
+The index is a single JSON file mapping each port to its entries sorted by
+(version, port-version), plus the baselines. Every part records the
+modification time and size of the file it was built from, so refreshing
+it only re-reads the version files that changed since.
+"""
+import bisect
+import glob
+import json
+import os
+
+from registry.index import (
+    VERSION_BASELINE_PATH,
+    VERSIONS_DIR_PATH,
+    atomic_write,
+    entry_version,
+    parse_version,
+)
+from registry.timings import timings
+
+QUERY_INDEX_PATH = ".registry-index.json"
+QUERY_INDEX_FORMAT = 1
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _sort_key(entry: list):
+    # entry is [version, port-version, git-tree]; versions packaging cannot
+    # parse sort first, by name
+    parsed = parse_version(entry[0])
+    return (parsed is not None, parsed or entry[0], entry[1])
+
+
+class QueryIndex(object):
+
+    def __init__(self, root: str = ".") -> None:
+        self.root = root
+        self.path = os.path.join(root, QUERY_INDEX_PATH)
+        self.data = {"format": QUERY_INDEX_FORMAT, "baseline": None, "ports": {}}
+        self.__dirty = False
+        # {port: sort keys of its entries}, built on the first query of the
+        # port: bisect only takes key= since Python 3.10
+        self.__keys = {}
+
+    @classmethod
+    def load(cls, root: str = "."):
+        # Loads the index and brings it up to date with the registry files
+        index = cls(root)
+        try:
+            with open(index.path, 'r') as f:
+                data = json.loads(f.read())
+            if data.get("format") == QUERY_INDEX_FORMAT:
+                index.data = data
+        except (FileNotFoundError, ValueError):
+            pass
+        with timings.phase("refresh query index"):
+            index.refresh()
+        return index
+
+    def refresh(self) -> list:
+        # Re-read only the files whose stamp changed. Returns the refreshed ports
+        baseline_path = os.path.join(self.root, VERSION_BASELINE_PATH)
+        stamp = _stamp(baseline_path)
+        if self.data["baseline"] is None or self.data["baseline"]["stamp"] != stamp:
+            with open(baseline_path, 'r') as f:
+                self.data["baseline"] = {"stamp": stamp, "baselines": json.loads(f.read())}
+            self.__dirty = True
+
+        refreshed = []
+        ports = self.data["ports"]
+        present = set()
+        for path in glob.glob(os.path.join(self.root, VERSIONS_DIR_PATH, "*-", "*.json")):
+            port = os.path.splitext(os.path.basename(path))[0]
+            present.add(port)
+            stamp = _stamp(path)
+            if port in ports and ports[port]["stamp"] == stamp:
+                continue
+            with open(path, 'r') as f:
+                versions = json.loads(f.read())["versions"]
+            entries = [[entry_version(entry), entry.get("port-version", 0), entry.get("git-tree")]
+                       for entry in versions]
+            ports[port] = {"stamp": stamp, "versions": sorted(entries, key=_sort_key)}
+            refreshed.append(port)
+
+        for port in set(ports) - present:
+            del ports[port]
+            refreshed.append(port)
+
+        if refreshed:
+            self.__dirty = True
+        for port in refreshed:
+            self.__keys.pop(port, None)
+        return refreshed
+
+    def save(self) -> bool:
+        if not self.__dirty:
+            return False
+        atomic_write(self.path, json.dumps(self.data, separators=(",", ":")))
+        self.__dirty = False
+        return True
+
+    def ports(self) -> list:
+        return sorted(self.data["ports"])
+
+    def entries(self, port: str) -> list:
+        try:
+            return self.data["ports"][port]["versions"]
+        except KeyError:
+            return []
+
+    def latest(self, port: str):
+        entries = self.entries(port)
+        return entries[-1] if entries else None
+
+    def versions(self, port: str, since: str = None, until: str = None) -> list:
+        # Entries with since <= version <= until, found by bisection
+        entries = self.entries(port)
+        if port not in self.__keys:
+            self.__keys[port] = [_sort_key(entry) for entry in entries]
+        keys = self.__keys[port]
+        low = 0
+        high = len(entries)
+        if since is not None:
+            low = bisect.bisect_left(keys, _sort_key([since, -1, None]))
+        if until is not None:
+            high = bisect.bisect_right(keys, _sort_key([until, float("inf"), None]))
+        return entries[low:high]
+
+    def find(self, port: str, version: str, port_version: int = None):
+        # The given port-version of 'version', or its most recent one
+        entries = self.versions(port, version, version)
+        if port_version is not None:
+            entries = [entry for entry in entries if entry[1] == port_version]
+        return entries[-1] if entries else None
+
+    def baseline(self, port: str, baseline: str = "default"):
+        pin = self.data["baseline"]["baselines"].get(baseline, {}).get(port)
+        if pin is None:
+            return None
+        return self.find(port, pin["baseline"], pin.get("port-version", 0))
@@ -0,0 +1,153 @@
+"""Opt-in wall and CPU time of the phases and subprocesses of the scripts.
+
+Recording is off unless ``--timings`` is given or ``REGISTRY_TIMINGS`` is set.
+Its value is either ``table`` (a summary printed to stderr on exit) or the
+path of a Chrome trace JSON file (chrome://tracing, Perfetto). When off,
+``phase()`` and ``process()`` hand out a shared no-op context and ``run()``
+is ``subprocess.run``, so instrumented code costs next to nothing.
+"""
+import atexit
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+TIMINGS_ENV = "REGISTRY_TIMINGS"
+TABLE_OUTPUT = "table"
+
+_NULL_PHASE = contextlib.nullcontext()
+_NULL_PROCESS = contextlib.nullcontext(types.SimpleNamespace(returncode=None))
+
+
+def _children_cpu() -> float:
+    # CPU time of the waited-for children; always 0 on Windows
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+class Timings(object):
+
+    def __init__(self) -> None:
+        self.output = None
+        self.events = []
+        self.__lock = threading.Lock()
+        self.__origin = time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.output is not None
+
+    def enable(self, output: str = TABLE_OUTPUT) -> None:
+        # The report is written once, when the interpreter exits
+        if not self.enabled:
+            atexit.register(self.report)
+        self.output = output or TABLE_OUTPUT
+
+    def __record(self, kind: str, name: str, start: float, wall: float, cpu: float, args: dict) -> None:
+        event = {"kind": kind, "name": name, "start": start - self.__origin, "wall": wall, "cpu": cpu,
+                 "thread": threading.get_ident(), "args": args}
+        with self.__lock:
+            self.events.append(event)
+
+    def phase(self, name: str, **args):
+        if self.output is None:
+            return _NULL_PHASE
+        return self.__phase(name, args)
+
+    @contextlib.contextmanager
+    def __phase(self, name: str, args: dict):
+        start = time.perf_counter()
+        # Thread CPU time, phases running in a pool are not mixed up
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.__record("phase", name, start, time.perf_counter() - start, time.thread_time() - cpu, args)
+
+    def process(self, argv: list):
+        # Context around a subprocess; the caller sets 'returncode' on the
+        # yielded record once the process is done
+        if self.output is None:
+            return _NULL_PROCESS
+        return self.__process([str(arg) for arg in argv])
+
+    @contextlib.contextmanager
+    def __process(self, argv: list):
+        record = types.SimpleNamespace(returncode=None)
+        start = time.perf_counter()
+        cpu = _children_cpu()
+        try:
+            yield record
+        finally:
+            self.__record("process", os.path.basename(argv[0]) + (" " + argv[1] if len(argv) > 1 else ""),
+                          start, time.perf_counter() - start, _children_cpu() - cpu,
+                          {"argv": argv, "returncode": record.returncode})
+
+    def run(self, argv: list, **kwargs) -> subprocess.CompletedProcess:
+        # subprocess.run, timed
+        if self.output is None:
+            return subprocess.run(argv, **kwargs)
+        with self.__process([str(arg) for arg in argv]) as record:
+            try:
+                result = subprocess.run(argv, **kwargs)
+            except subprocess.CalledProcessError as e:
+                record.returncode = e.returncode
+                raise
+            record.returncode = result.returncode
+        return result
+
+    def summary(self) -> str:
+        # Phases are aggregated by name, processes listed one by one
+        phases = {}
+        for event in self.events:
+            if event["kind"] == "phase":
+                count, wall, cpu = phases.get(event["name"], (0, 0.0, 0.0))
+                phases[event["name"]] = (count + 1, wall + event["wall"], cpu + event["cpu"])
+        lines = [f"{'phase':<40} {'count':>6} {'wall (s)':>10} {'cpu (s)':>10}"]
+        for name, (count, wall, cpu) in sorted(phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<40} {count:>6} {wall:>10.4f} {cpu:>10.4f}")
+        processes = [event for event in self.events if event["kind"] == "process"]
+        if processes:
+            lines.append("")
+            lines.append(f"{'process':<60} {'exit':>6} {'wall (s)':>10} {'cpu (s)':>10}")
+            for event in processes:
+                command = " ".join(event["args"]["argv"]).replace("\n", " ")
+                if len(command) > 60:
+                    command = command[:57] + "..."
+                returncode = event["args"]["returncode"]
+                lines.append(f"{command:<60} {'?' if returncode is None else returncode:>6}"
+                             f" {event['wall']:>10.4f} {event['cpu']:>10.4f}")
+        return "\n".join(lines)
+
+    def trace(self) -> dict:
+        # Complete ('X') events, timestamps in microseconds
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for event in self.events:
+            tid = threads.setdefault(event["thread"], len(threads))
+            args = dict(event["args"], cpu=event["cpu"])
+            events.append({"name": event["name"], "cat": event["kind"], "ph": "X", "pid": pid, "tid": tid,
+                           "ts": round(event["start"] * 1e6, 3), "dur": round(event["wall"] * 1e6, 3),
+                           "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def report(self) -> None:
+        if self.output is None:
+            return
+        if self.output == TABLE_OUTPUT:
+            print(self.summary(), file=sys.stderr)
+        else:
+            with open(self.output, 'w') as f:
+                f.write(json.dumps(self.trace()))
+            print(f"Timings written to {self.output}", file=sys.stderr)
+
+
+timings = Timings()
+
+if os.environ.get(TIMINGS_ENV):
+    timings.enable(os.environ[TIMINGS_ENV])
@@ -0,0 +1,170 @@
+"""Notification of ref changes in local bare mirrors.
+
+A push creates or renames files under ``refs/`` of the mirror, or rewrites
+its ``packed-refs``. On Linux those are watched through inotify (called with
+ctypes, no dependency), so nothing is read until git actually writes a ref.
+Elsewhere, or when inotify is unavailable, the mtime and size of the same
+files are polled instead.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import sys
+import time
+
+from registry.index import parse_version
+from registry.timings import timings
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct("iIII")
+REFS_FILES = ("packed-refs",)
+
+
+def git_dir(mirror: str) -> str:
+    # Where the refs are: the mirror itself if bare, its .git otherwise
+    dot_git = os.path.join(mirror, ".git")
+    return dot_git if os.path.isdir(dot_git) else mirror
+
+
+def mirror_tags(mirror: str) -> dict:
+    # {tag: commit id}, annotated tags being peeled to their commit
+    result = timings.run(["git", "-C", mirror, "for-each-ref", "refs/tags",
+                          "--format=%(refname:short) %(objectname) %(*objectname)"],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    tags = {}
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        tags[fields[0]] = fields[-1]
+    return tags
+
+
+def tag_version(tag: str):
+    # 'v1.2.3' and '1.2.3' name version 1.2.3; None for other tags
+    version = tag[1:] if tag[:1] in ("v", "V") else tag
+    return version if parse_version(version) is not None else None
+
+
+class InotifyWatcher(object):
+
+    def __init__(self, mirrors: list) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.__add_watch = libc.inotify_add_watch
+        self.__add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (mirror, watched directory)
+        self.watches = {}
+        self.roots = {mirror: git_dir(mirror) for mirror in mirrors}
+        for mirror, root in self.roots.items():
+            self.__watch(mirror, root)
+            for directory, _, _ in os.walk(os.path.join(root, "refs")):
+                self.__watch(mirror, directory)
+
+    def __watch(self, mirror: str, directory: str) -> None:
+        wd = self.__add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {directory}")
+        self.watches[wd] = (mirror, directory)
+
+    def wait(self, timeout: float = None) -> set:
+        # Mirrors whose refs changed, empty after 'timeout' seconds without change
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        position = 0
+        while position < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            name = data[position + EVENT_HEADER.size:position + EVENT_HEADER.size + length].rstrip(b"\0")
+            position += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                changed.update(mirror for mirror, _ in self.watches.values())
+                continue
+            if wd not in self.watches:
+                continue
+            mirror, directory = self.watches[wd]
+            name = os.fsdecode(name)
+            if directory == self.roots[mirror]:
+                # Only packed-refs and the creation of refs/ matter at the top
+                if name == "refs" and mask & IN_ISDIR:
+                    self.__watch(mirror, os.path.join(directory, name))
+                if name not in REFS_FILES:
+                    continue
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.__watch(mirror, os.path.join(directory, name))
+            # Ref updates go through '<ref>.lock' renamed over '<ref>'
+            if name.endswith(".lock"):
+                continue
+            changed.add(mirror)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+
+    def __init__(self, mirrors: list, interval: float = 2.0) -> None:
+        self.interval = interval
+        self.stamps = {mirror: self.__stamp(mirror) for mirror in mirrors}
+
+    @staticmethod
+    def __stamp(mirror: str) -> list:
+        # mtime and size of packed-refs and of every loose ref
+        stamp = []
+        root = git_dir(mirror)
+        paths = [os.path.join(root, name) for name in REFS_FILES]
+        for directory, _, files in os.walk(os.path.join(root, "refs")):
+            paths.extend(os.path.join(directory, name) for name in files if not name.endswith(".lock"))
+        for path in sorted(paths):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        return stamp
+
+    def wait(self, timeout: float = None) -> set:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for mirror, stamp in self.stamps.items():
+                current = self.__stamp(mirror)
+                if current != stamp:
+                    self.stamps[mirror] = current
+                    changed.add(mirror)
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            delay = self.interval if deadline is None else min(self.interval, max(deadline - time.monotonic(), 0))
+            time.sleep(delay)
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(mirrors: list, poll_interval: float = 2.0):
+    # inotify when available, polling otherwise
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(mirrors)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(mirrors, poll_interval)
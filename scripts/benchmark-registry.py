@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
+import pathlib
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PORTFILE_TEMPLATE = """# Retrieve the sources from github at a specific revision
+vcpkg_from_github(
+  OUT_SOURCE_PATH SOURCE_PATH
+  REPO onbings/{port}
+  REF {ref}
+  SHA512 {sha512}
+  HEAD_REF main
+)
+
+vcpkg_configure_cmake(
+  SOURCE_PATH "${{SOURCE_PATH}}"
+  PREFER_NINJA
+)
+
+vcpkg_install_cmake()
+vcpkg_fixup_cmake_targets(CONFIG_PATH share TARGET_PATH "share/{port}")
+vcpkg_copy_pdbs()
+
+file(REMOVE_RECURSE "${{CURRENT_PACKAGES_DIR}}/debug/include")
+file(WRITE ${{CURRENT_PACKAGES_DIR}}/share/{port}/copyright "")
+"""
+
+#
+# Description
+#   This function loads a script of this repository as a module
+#   (their names contain dashes so they cannot be imported)
+#
+# Parameters
+#   path - The path to the script
+#
+# Returns
+#   The module
+#
+def load_script(path) :
+
+    spec = importlib.util.spec_from_file_location(pathlib.Path(path).stem.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+#
+# Description
+#   This function returns a random hexadecimal id
+#
+# Parameters
+#   rng    - The random generator
+#   length - The number of hexadecimal digits
+#
+# Returns
+#   The id
+#
+def random_id(rng, length) :
+
+    return hashlib.sha512(str(rng.random()).encode()).hexdigest()[:length]
+
+#
+# Description
+#   This function generates a synthetic registry in a new git repository:
+#   ports/<port>/{vcpkg.json,portfile.cmake}, one version file per port
+#   and the default baseline. Each port depends on a few earlier ones
+#
+# Parameters
+#   root     - The directory to create the registry in
+#   ports    - The number of ports
+#   versions - The number of versions per port
+#   seed     - The random seed
+#
+# Returns
+#   The list of port names
+#
+def generate_registry(root, ports, versions, seed) :
+
+    rng = random.Random(seed)
+    names = [ "port{:04d}".format(i) for i in range(ports) ]
+    baseline = {}
+
+    for i, name in enumerate(names) :
+        dependencies = sorted(rng.sample(names[:i], min(i, 3)))
+        dependencies.append({ "name" : "grpc", "platform" : "!wasm32" })
+
+        entries = []
+        for j in range(versions) :
+            version = "{}.{}.{}.{}".format(1 + j // 1000, (j // 100) % 10, (j // 10) % 10, j % 10)
+            entries.append({ "git-tree" : random_id(rng, 40), "version" : version, "port-version" : 0 })
+        entries.reverse()
+        latest = entries[0]["version"]
+
+        port_dir = os.path.join(root, "ports", name)
+        os.makedirs(port_dir)
+        with open(os.path.join(port_dir, "vcpkg.json"), 'w') as f :
+            f.write(json.dumps({ "name" : name, "version" : latest, "description" : "Synthetic port",
+                                 "dependencies" : dependencies, "port-version" : 0 }, indent=2))
+        with open(os.path.join(port_dir, "portfile.cmake"), 'w') as f :
+            f.write(PORTFILE_TEMPLATE.format(port=name, ref=random_id(rng, 40), sha512=random_id(rng, 128)))
+
+        version_dir = os.path.join(root, "versions", "{}-".format(name[0]))
+        os.makedirs(version_dir, exist_ok=True)
+        with open(os.path.join(version_dir, "{}.json".format(name)), 'w') as f :
+            f.write(json.dumps({ "versions" : entries }, indent=2))
+
+        baseline[name] = { "baseline" : latest, "port-version" : 0 }
+
+    with open(os.path.join(root, "versions", "baseline.json"), 'w') as f :
+        f.write(json.dumps({ "default" : baseline }, indent=2))
+
+    git = [ "git", "-C", root, "-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost" ]
+    subprocess.run([ "git", "init", "-q", root ], check=True)
+    subprocess.run(git + [ "add", "-A" ], check=True)
+    subprocess.run(git + [ "commit", "-q", "-m", "Synthetic registry" ], check=True)
+    subprocess.run([ "git", "-C", root, "config", "user.name", "benchmark" ], check=True)
+    subprocess.run([ "git", "-C", root, "config", "user.email", "benchmark@localhost" ], check=True)
+
+    return names
+
+#
+# Description
+#   This function generates a directory tree shaped like a vcpkg buildtrees folder
+#
+# Parameters
+#   root  - The directory to create
+#   ports - The number of port directories
+#   files - The number of files per port directory
+#
+def generate_buildtrees(root, ports, files) :
+
+    for i in range(ports) :
+        for j in range(files) :
+            directory = os.path.join(root, "port{:04d}".format(i), "x64-linux-rel", "src{}".format(j % 10))
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, "file{}.o".format(j)), 'wb') as f :
+                f.write(b"\0" * 512)
+
+#
+# Description
+#   This function times a function
+#
+# Parameters
+#   results - The dictionary results are stored into
+#   name    - The name of the measure
+#   runs    - The number of runs
+#   func    - The function, called with the run number
+#   setup   - A function called before each run, not timed (None for none)
+#
+def measure(results, name, runs, func, setup=None) :
+
+    durations = []
+    for run in range(runs) :
+        if setup :
+            setup(run)
+        start = time.perf_counter()
+        func(run)
+        durations.append(time.perf_counter() - start)
+
+    results[name] = { "runs" : runs, "min" : min(durations), "mean" : statistics.mean(durations),
+                      "median" : statistics.median(durations), "max" : max(durations) }
+    print("-- {:<40} {:>10.6f} s (median of {})".format(name, results[name]["median"], runs), file=sys.stderr)
+
+#
+# Description
+#   This function runs every benchmark
+#
+# Parameters
+#   args - The parsed command line arguments
+#
+# Returns
+#   The results as a dictionary
+#
+def run_benchmarks(args) :
+
+    repo_root = str(pathlib.Path(__file__).parent.parent.absolute())
+    sys.path.insert(0, repo_root)
+    update_port = load_script(os.path.join(repo_root, "update-port.py"))
+    clear_cache = load_script(os.path.join(repo_root, "scripts", "clear-cache.py"))
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="registry-benchmark-")
+    current_dir = os.getcwd()
+
+    try :
+        registry = os.path.join(work_dir, "registry")
+        start = time.perf_counter()
+        names = generate_registry(registry, args.ports, args.versions, args.seed)
+        print("-- Registry of {} ports x {} versions generated in {:.2f} s".format(
+              args.ports, args.versions, time.perf_counter() - start), file=sys.stderr)
+
+        os.chdir(registry)
+        rng = random.Random(args.seed)
+        port = names[-1]
+        version_path = update_port.version_file_path(port)
+
+        # Quiet the progress messages of update-port.py
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull) :
+            measure(results, "read_current_port_version", args.runs,
+                    lambda run: update_port.read_current_port_version(port, "1.0.{}.{}".format(rng.randrange(10), rng.randrange(10))))
+
+            measure(results, "update_port_version", args.runs,
+                    lambda run: update_port.update_port_version(port, "9.0.0.{}".format(run), version_path))
+
+            measure(results, "update_baseline", args.runs,
+                    lambda run: update_port.update_baseline("default", port, "9.0.0.{}".format(run), 0))
+
+            measure(results, "update_port+update_versions", args.runs,
+                    lambda run: (update_port.update_port(port, "9.1.0.{}".format(run), random_id(rng, 40)),
+                                 update_port.update_versions("default", port, "9.1.0.{}".format(run), "ref")))
+
+            batch = names[:args.batch]
+            measure(results, "update_ports[{}]".format(len(batch)), args.runs,
+                    lambda run: update_port.update_ports([ update_port.PortUpdate(name, "9.2.0.{}".format(run), random_id(rng, 40))
+                                                          for name in batch ]))
+
+        os.chdir(current_dir)
+
+        buildtrees = os.path.join(work_dir, "buildtrees")
+        measure(results, "clear-cache fast_remove_tree", args.runs,
+                lambda run: clear_cache.fast_remove_tree(buildtrees, args.jobs),
+                setup=lambda run: generate_buildtrees(buildtrees, args.ports, args.files))
+    finally :
+        os.chdir(current_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+#
+# Description
+#   This is the entry point of the script
+#
+# Parameters
+#   argv - The arguments passed on the command line
+#
+# Returns
+#   0 - The operation was successful
+#  !0 - The operation failed
+#
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="This script measures how update-port.py and clear-cache.py scale on a synthetic registry")
+
+    parser.add_argument("--ports",    dest="ports",    help="Number of generated ports",                         type=int, default=20)
+    parser.add_argument("--versions", dest="versions", help="Number of versions per port",                       type=int, default=500)
+    parser.add_argument("--files",    dest="files",    help="Number of files per port in the generated buildtrees", type=int, default=200)
+    parser.add_argument("--batch",    dest="batch",    help="Number of ports updated by the batch measure",       type=int, default=4)
+    parser.add_argument("--runs",     dest="runs",     help="Number of runs of each measure",                     type=int, default=5)
+    parser.add_argument("--jobs",     dest="jobs",     help="Number of threads used by clear-cache.py",           type=int)
+    parser.add_argument("--seed",     dest="seed",     help="Random seed of the generator",                       type=int, default=0)
+    parser.add_argument("--output",   dest="output",   help="Write the JSON results to this file instead of stdout")
+
+    args = parser.parse_args(argv)
+
+    repo_root = str(pathlib.Path(__file__).parent.parent.absolute())
+    commit = subprocess.run([ "git", "-C", repo_root, "rev-parse", "HEAD" ], stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+
+    report = {
+        "commit"     : commit or None,
+        "python"     : platform.python_version(),
+        "platform"   : platform.platform(),
+        "parameters" : { key : value for key, value in vars(args).items() if key != "output" },
+        "results"    : run_benchmarks(args),
+    }
+
+    content = json.dumps(report, indent=2)
+    if args.output :
+        with open(args.output, 'w') as f :
+            f.write(content + "\n")
+    else :
+        print(content)
+
+    return 0
+
+#
+# Description
+#   The script main wrapper
+#
+if __name__ == "__main__":
+    try :
+      sys.exit(main(sys.argv[1:]))
+    except Exception as e :
+      print(e)
+      sys.exit(1)
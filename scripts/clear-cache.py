@@ -2,12 +2,25 @@
 
 import argparse
 from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import errno
+import hashlib
+import json
 import os
 import pathlib
+import re
 import shutil
 import stat
+import subprocess
 import sys
+import time
+import zipfile
+
+# The script runs from the registry and shares its helpers
+sys.path.insert(0, str(pathlib.Path(__file__).absolute().parent.parent))
+from registry.deps import DependencyGraph, manifest_dependencies
+from registry.index import atomic_write
+from registry.timings import TIMINGS_ENV, timings
 
 #
 # Description
@@ -33,26 +46,1043 @@ def remove_read_only_handler(func, path, exc):
 
 #
 # Description
-#   This function removes the specified directory
+#   This function removes a single file or symbolic link,
+#   going through remove_read_only_handler on failure
+#
+# Parameters
+#   _path - The path to the file
+#
+def remove_file(_path):
+
+    try :
+        os.unlink(_path)
+    except OSError :
+        remove_read_only_handler(os.unlink, _path, sys.exc_info())
+
+#
+# Description
+#   This function unlinks the files of one directory
+#
+# Parameters
+#   _path - The path to the directory
+#
+# Returns
+#   The list of its sub-directories, left to be scanned
+#
+def remove_directory_files(_path):
+
+    sub_directories = []
+
+    with os.scandir(_path) as it :
+        for entry in it :
+            if entry.is_dir(follow_symlinks=False) :
+                sub_directories.append(entry.path)
+            else :
+                remove_file(entry.path)
+
+    return sub_directories
+
+#
+# Description
+#   This function removes a directory tree using a thread pool.
+#   Each directory is scanned (os.scandir) and its files unlinked
+#   by a worker, sub-directories being queued as they are found.
+#   The then empty directories are removed deepest first.
 #
 # Parameters
 #   _path - The path to the directory to remove
+#   _jobs - The number of workers (None for the default)
+#
+def fast_remove_tree(_path, _jobs=None):
+
+    directories = []
+
+    with ThreadPoolExecutor(max_workers=_jobs) as executor :
+        pending = { executor.submit(remove_directory_files, _path) : (0, _path) }
+
+        while pending :
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done :
+                depth, directory = pending.pop(future)
+                directories.append((depth, directory))
+                for sub_directory in future.result() :
+                    pending[executor.submit(remove_directory_files, sub_directory)] = (depth + 1, sub_directory)
+
+    for depth, directory in sorted(directories, reverse=True) :
+        try :
+            os.rmdir(directory)
+        except OSError :
+            remove_read_only_handler(os.rmdir, directory, sys.exc_info())
+
+# Directories moved aside are named <name>.deleting-<pid>-<time>
+TRASH_PATTERN = re.compile(r"^(.*)\.deleting-(\d+)-(\d+)$")
+
+# Younger moved aside directories may still be
+# in the hands of their detached process
+STALE_TRASH_AGE = 10 * 60
+
+#
+# Description
+#   This function returns the path a directory is moved to
+#   before being deleted
+#
+# Parameters
+#   _path - The path to the directory
+#
+# Returns
+#   The path of the moved aside directory
+#
+def get_trash_path(_path):
+
+    return "{}.deleting-{}-{}".format(os.path.normpath(_path), os.getpid(), int(time.time()))
+
+#
+# Description
+#   This function deletes an already moved aside directory
+#   from a detached process
+#
+# Parameters
+#   _trash_path - The path to the moved aside directory
+#   _jobs       - The number of workers of the detached process
+#
+def spawn_detached_removal(_trash_path, _jobs=None):
+
+    cmd = [ sys.executable, os.path.abspath(__file__), "--remove-detached", _trash_path ]
+    if _jobs :
+        cmd.extend([ "--jobs", str(_jobs) ])
+
+    kwargs = {}
+    if sys.platform == "win32" :
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else :
+        kwargs["start_new_session"] = True
+
+    subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+
+#
+# Description
+#   This function moves the directory aside and deletes it
+#   from a detached process, so that vcpkg can use the
+#   original location immediately
+#
+# Parameters
+#   _path - The path to the directory to remove
+#   _jobs - The number of workers of the detached process
+#
+# Returns
+#   The path the directory was moved to
+#
+def remove_directory_in_background(_path, _jobs=None):
+
+    # Same parent, so the rename is atomic
+    trash_path = get_trash_path(_path)
+    os.rename(_path, trash_path)
+    spawn_detached_removal(trash_path, _jobs)
+
+    return trash_path
+
+#
+# Description
+#   This function removes the moved aside directories a
+#   previous run left behind, because its detached process
+#   died or the machine rebooted before it was done.
+#   Each one is renamed first, so that two runs never
+#   delete the same directory
+#
+# Parameters
+#   _directory  - The directory the moved aside directories are in
+#   _name       - Only sweep the ones of this directory name (None for all)
+#   _jobs       - The number of workers used to remove them
+#   _background - Remove them from a detached process
+#
+# Returns
+#   The number of directories swept
+#
+def sweep_stale_trash(_directory, _name=None, _jobs=None, _background=False):
+
+    if not os.path.isdir(_directory) :
+        return 0
+
+    stale = []
+    now = time.time()
+    with os.scandir(_directory) as it :
+        for entry in it :
+            match = TRASH_PATTERN.match(entry.name)
+            if not match or not entry.is_dir(follow_symlinks=False) :
+                continue
+            if _name is not None and match.group(1) != _name :
+                continue
+            if now - int(match.group(3)) < STALE_TRASH_AGE :
+                continue
+            stale.append((entry.path, match.group(1)))
+
+    swept = 0
+    for path, name in sorted(stale) :
+        trash_path = get_trash_path(os.path.join(_directory, name))
+        try :
+            os.rename(path, trash_path)
+        except FileNotFoundError :
+            # Claimed by another run
+            continue
+        print("-- Removing stale directory : {}".format(path))
+        if _background :
+            spawn_detached_removal(trash_path, _jobs)
+        else :
+            fast_remove_tree(trash_path, _jobs)
+        swept += 1
+
+    return swept
+
+#
+# Description
+#   This function removes the specified directory
+#
+# Parameters
+#   _path       - The path to the directory to remove
+#   _jobs       - The number of workers used to remove it
+#   _background - Move the directory aside and remove it from a detached process
 #
 # Returns
 #    0 - The operation was successful
 #   !0 - The operation failed
 #
-def remove_directory(_path):
+def remove_directory(_path, _jobs=None, _background=False):
 
     print("-- Removing directory : {}".format(_path))
 
+    # Leftovers of an interrupted background removal
+    sweep_stale_trash(os.path.dirname(os.path.normpath(_path)) or ".", os.path.basename(os.path.normpath(_path)),
+                      _jobs, _background)
+
     # Does the directory exists
     if os.path.exists(_path) :
-        shutil.rmtree(_path, ignore_errors=False, onerror=remove_read_only_handler)
-        print("--                    : OK")
+        if _background :
+            trash_path = remove_directory_in_background(_path, _jobs)
+            print("--                    : Moved to {}, removing in background".format(trash_path))
+        else :
+            fast_remove_tree(_path, _jobs)
+            print("--                    : OK")
     else :
         print("--                    : Not existing")
 
+#
+# Description
+#   This function removes the moved aside directories left
+#   behind by previous runs in every location this script
+#   cleans
+#
+# Parameters
+#   _vcpkg_root - The path to the vcpkg root directory (None to skip it)
+#   _jobs       - The number of workers used to remove them
+#   _background - Remove them from a detached process
+#
+def sweep_all_stale_trash(_vcpkg_root, _jobs=None, _background=False):
+
+    if _vcpkg_root :
+        # buildtrees, downloads and packages, then the
+        # per-port directories inside buildtrees and packages
+        sweep_stale_trash(_vcpkg_root, None, _jobs, _background)
+        sweep_stale_trash(os.path.join(_vcpkg_root, "buildtrees"), None, _jobs, _background)
+        sweep_stale_trash(os.path.join(_vcpkg_root, "packages"), None, _jobs, _background)
+
+    for path in [ get_nuget_packages_path(), get_binary_cache_path() ] :
+        if path :
+            path = os.path.normpath(path)
+            sweep_stale_trash(os.path.dirname(path), os.path.basename(path), _jobs, _background)
+
+#
+# Description
+#   This function returns the home directory of the user
+#
+# Returns
+#   The home directory
+#
+def get_home_dir():
+
+    if "USERPROFILE" in os.environ :
+        return os.environ["USERPROFILE"]
+
+    return os.environ["HOME"]
+
+#
+# Description
+#   This function returns the directory where NuGet extracts
+#   the packages (<home_dir>/.nuget/packages)
+#
+# Returns
+#   The packages directory (None when there is no home directory,
+#   as for some CI and service accounts)
+#
+def get_nuget_packages_path():
+
+    try :
+        return os.path.join(get_home_dir(), ".nuget", "packages")
+    except KeyError :
+        return None
+
+#
+# Description
+#   This function returns the binary cache directory vcpkg uses
+#   (the first of the variables below which is defined)
+#
+# Returns
+#   The binary cache directory (None if it cannot be determined)
+#
+def get_binary_cache_path():
+
+    # Search in order
+    binary_cache_paths = OrderedDict([
+      ("VCPKG_DEFAULT_BINARY_CACHE", ""),
+      ("LOCALAPPDATA"              , "vcpkg"),
+      ("APPDATA"                   , "vcpkg"),
+      ("XDG_CACHE_HOME"            , "vcpkg"),
+      ("HOME"                      , os.path.join(".cache", "vcpkg"))
+    ])
+
+    for var,subdir in binary_cache_paths.items() :
+        if var in os.environ :
+            return os.path.join(os.environ[var], subdir)
+
+    return None
+
+#
+# Description
+#   This function parses a size such as 1024, 500M or 20G
+#
+# Parameters
+#   _value - The size as a string
+#
+# Returns
+#   The size in bytes
+#
+def parse_size(_value):
+
+    units = { "K" : 1024, "M" : 1024 ** 2, "G" : 1024 ** 3, "T" : 1024 ** 4 }
+    value = _value.strip().upper().rstrip("B")
+
+    if value and value[-1] in units :
+        return int(float(value[:-1]) * units[value[-1]])
+
+    return int(value)
+
+#
+# Description
+#   This function lists the archives of the binary cache
+#
+# Parameters
+#   _path - The path to the binary cache
+#
+# Returns
+#   A list of (last use time, size, path, inode), the last use time
+#   being the most recent of the access and modification times and
+#   inode the (device, inode) of a file having several hard links
+#   (see --dedupe), its path otherwise. Hidden files (such as the
+#   dedupe index) are not listed
+#
+def scan_cache_entries(_path):
+
+    entries = []
+    directories = [ _path ]
+
+    while directories :
+        with os.scandir(directories.pop()) as it :
+            for entry in it :
+                if entry.is_dir(follow_symlinks=False) :
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith(".") :
+                    st = entry.stat(follow_symlinks=False)
+                    # The link count is not filled by scandir on Windows
+                    if st.st_nlink != 1 :
+                        st = os.stat(entry.path, follow_symlinks=False)
+                    inode = (st.st_dev, st.st_ino) if st.st_nlink > 1 else entry.path
+                    entries.append((max(st.st_atime, st.st_mtime), st.st_size, entry.path, inode))
+
+    return entries
+
+#
+# Description
+#   This function evicts the least recently used archives of
+#   the binary cache until it fits under the given budget. Hard
+#   linked archives are counted once, and only free their size
+#   when their last link is removed
+#
+# Parameters
+#   _path     - The path to the binary cache
+#   _max_size - The maximum size in bytes of the cache (None for no limit)
+#   _max_age  - The maximum age in days of an archive (None for no limit)
+#   _dry_run  - Only report what would be freed
+#
+# Returns
+#   The number of bytes freed (or that would be freed)
+#
+def evict_binary_cache(_path, _max_size=None, _max_age=None, _dry_run=False):
+
+    print("-- Evicting from binary cache : {}".format(_path))
+
+    if not os.path.isdir(_path) :
+        print("--                            : Not existing")
+        return 0
+
+    entries = sorted(scan_cache_entries(_path))
+    links = {}
+    sizes = {}
+    for _, size, _, inode in entries :
+        links[inode] = links.get(inode, 0) + 1
+        sizes[inode] = size
+    total_size = sum(sizes.values())
+    oldest_allowed = time.time() - _max_age * 86400 if _max_age is not None else None
+
+    evicted = []
+    remaining_size = total_size
+
+    # Least recently used first
+    for last_use, size, path, inode in entries :
+        too_old = oldest_allowed is not None and last_use < oldest_allowed
+        too_big = _max_size is not None and remaining_size > _max_size
+        if not too_old and not too_big :
+            break
+        evicted.append((last_use, size, path))
+        links[inode] -= 1
+        if links[inode] == 0 :
+            remaining_size -= size
+
+    for last_use, size, path in evicted :
+        if _dry_run :
+            print("--   would remove {} ({} bytes, last used {})".format(path, size, time.strftime("%Y-%m-%d %H:%M", time.localtime(last_use))))
+        else :
+            remove_file(path)
+
+    freed = total_size - remaining_size
+    print("--                            : {} of {} archive(s), {} of {} bytes {}".format(
+          len(evicted), len(entries), freed, total_size, "would be freed" if _dry_run else "freed"))
+
+    return freed
+
+#
+# Description
+#   This function builds the dependency graph of the ports of
+#   the registry. Ports of other registries are kept as nodes,
+#   so that cleaning one of them can reach its registry dependents
+#
+# Parameters
+#   _registry_root - The path to the registry
+#
+# Returns
+#   A DependencyGraph
+#
+def get_dependency_graph(_registry_root):
+
+    dependencies = {}
+    ports_dir = os.path.join(_registry_root, "ports")
+
+    with os.scandir(ports_dir) as it :
+        for entry in it :
+            manifest_path = os.path.join(entry.path, "vcpkg.json")
+            if not os.path.isfile(manifest_path) :
+                continue
+            with open(manifest_path, 'r') as f :
+                dependencies[entry.name] = manifest_dependencies(json.loads(f.read()))
+
+    return DependencyGraph.from_edges(dependencies)
+
+#
+# Description
+#   This function returns the given port and, if requested,
+#   all the ports transitively depending on it
+#
+# Parameters
+#   _registry_root   - The path to the registry
+#   _ports           - The ports names
+#   _with_dependents - Add the dependents
+#
+# Returns
+#   A sorted list of port names
+#
+def get_ports_to_clean(_registry_root, _ports, _with_dependents):
+
+    ports = set(_ports)
+
+    if _with_dependents :
+        ports |= get_dependency_graph(_registry_root).transitive_dependents(ports)
+
+    return sorted(ports)
+
+#
+# Description
+#   This function returns the port a binary cache archive holds,
+#   read from the share/<port>/vcpkg_abi_info.txt it contains
+#
+# Parameters
+#   _path - The path to the archive
+#
+# Returns
+#   The port name (None if unknown)
+#
+def get_archive_port(_path):
+
+    try :
+        with zipfile.ZipFile(_path) as archive :
+            for name in archive.namelist() :
+                parts = name.split("/")
+                if len(parts) == 3 and parts[0] == "share" and parts[2] == "vcpkg_abi_info.txt" :
+                    return parts[1]
+    except (zipfile.BadZipFile, OSError) :
+        pass
+
+    return None
+
+#
+# Description
+#   This function removes the entries of the given ports from
+#   the buildtrees and packages folders and from the binary cache
+#
+# Parameters
+#   _vcpkg_root        - The path to the vcpkg root directory
+#   _binary_cache_path - The path to the binary cache (None to leave it alone)
+#   _ports             - The ports names
+#   _jobs              - The number of workers
+#   _background        - Remove directories from a detached process
+#
+def remove_ports(_vcpkg_root, _binary_cache_path, _ports, _jobs=None, _background=False):
+
+    for port in _ports :
+        remove_directory(os.path.join(_vcpkg_root, "buildtrees", port), _jobs, _background)
+
+    # packages are stored as <port>_<triplet>
+    packages_dir = os.path.join(_vcpkg_root, "packages")
+    if os.path.isdir(packages_dir) :
+        prefixes = tuple(port + "_" for port in _ports)
+        with os.scandir(packages_dir) as it :
+            package_dirs = [ entry.path for entry in it if entry.name.startswith(prefixes) and entry.is_dir() ]
+        for package_dir in sorted(package_dirs) :
+            remove_directory(package_dir, _jobs, _background)
+
+    if _binary_cache_path and os.path.isdir(_binary_cache_path) :
+        print("-- Removing from binary cache : {}".format(", ".join(_ports)))
+        archives = [ path for _, _, path, _ in scan_cache_entries(_binary_cache_path) if path.endswith(".zip") ]
+        with ThreadPoolExecutor(max_workers=_jobs) as executor :
+            archive_ports = executor.map(get_archive_port, archives)
+            removed = [ path for path, port in zip(archives, archive_ports) if port in _ports ]
+        for path in removed :
+            remove_file(path)
+        print("--                            : {} archive(s) removed".format(len(removed)))
+
+DEDUPE_INDEX_FILE_NAME = ".dedupe-index.json"
+DEDUPE_TMP_SUFFIX = ".dedupe-tmp"
+
+#
+# Description
+#   This function computes the SHA-256 of a file by chunks
+#
+# Parameters
+#   _path - The path to the file
+#
+# Returns
+#   The hexadecimal digest
+#
+def get_file_sha256(_path):
+
+    h = hashlib.sha256()
+    with open(_path, 'rb') as f :
+        for chunk in iter(lambda: f.read(1024 * 1024), b"") :
+            h.update(chunk)
+
+    return h.hexdigest()
+
+#
+# Description
+#   This function replaces byte-identical archives of the binary
+#   cache with hard links to a single copy. Only files sharing their
+#   size with another file are hashed, and hashes are kept in
+#   <cache>/.dedupe-index.json keyed by (inode, size, mtime) so that
+#   the next runs only hash new files. The links left behind by an
+#   interrupted run are removed first
+#
+# Parameters
+#   _path    - The path to the binary cache
+#   _jobs    - The number of hashing workers
+#   _dry_run - Only report what would be saved
+#
+# Returns
+#   The number of bytes saved (or that would be saved)
+#
+def dedupe_binary_cache(_path, _jobs=None, _dry_run=False):
+
+    print("-- Deduplicating binary cache : {}".format(_path))
+
+    if not os.path.isdir(_path) :
+        print("--                            : Not existing")
+        return 0
+
+    index_path = os.path.join(_path, DEDUPE_INDEX_FILE_NAME)
+    try :
+        with open(index_path, 'r') as f :
+            index = json.loads(f.read())
+    except (OSError, ValueError) :
+        index = {}
+
+    # Files already hard linked together share an inode
+    # and only need to be considered once
+    inodes = OrderedDict()
+    for _, _, path, _ in sorted(scan_cache_entries(_path), key=lambda entry: entry[2]) :
+        if path.endswith(DEDUPE_TMP_SUFFIX) :
+            if not _dry_run :
+                remove_file(path)
+            continue
+        st = os.stat(path)
+        inode = inodes.setdefault((st.st_dev, st.st_ino), { "size" : st.st_size, "mtime" : st.st_mtime_ns, "paths" : [] })
+        inode["paths"].append(path)
+
+    by_size = {}
+    for key, inode in inodes.items() :
+        by_size.setdefault((key[0], inode["size"]), []).append(key)
+    candidates = [ key for keys in by_size.values() if len(keys) > 1 for key in keys ]
+
+    def get_index_key(_key) :
+        return "{}:{}:{}:{}".format(_key[0], _key[1], inodes[_key]["size"], inodes[_key]["mtime"])
+
+    to_hash = [ key for key in candidates if get_index_key(key) not in index ]
+    with ThreadPoolExecutor(max_workers=_jobs) as executor :
+        for key, digest in zip(to_hash, executor.map(lambda key: get_file_sha256(inodes[key]["paths"][0]), to_hash)) :
+            index[get_index_key(key)] = digest
+
+    groups = OrderedDict()
+    for key in candidates :
+        groups.setdefault((key[0], index[get_index_key(key)]), []).append(key)
+
+    saved = 0
+    linked = 0
+    for keys in groups.values() :
+        if len(keys) < 2 :
+            continue
+        # The copy having the most links is kept
+        keys.sort(key=lambda key: -len(inodes[key]["paths"]))
+        source = inodes[keys[0]]["paths"][0]
+        for key in keys[1:] :
+            for path in inodes[key]["paths"] :
+                if not _dry_run :
+                    tmp_path = path + DEDUPE_TMP_SUFFIX
+                    try :
+                        os.unlink(tmp_path)
+                    except FileNotFoundError :
+                        pass
+                    os.link(source, tmp_path)
+                    os.replace(tmp_path, path)
+                linked += 1
+            saved += inodes[key]["size"]
+            del index[get_index_key(key)]
+
+    if not _dry_run :
+        # Only keep the files still present
+        live = { get_index_key(key) for key in inodes }
+        atomic_write(index_path, json.dumps({ key : value for key, value in index.items() if key in live }))
+
+    print("--                            : {} file(s) hashed, {} file(s) {}linked, {} bytes {}".format(
+          len(to_hash), linked, "would be " if _dry_run else "", saved, "would be saved" if _dry_run else "saved"))
+
+    return saved
+
+#
+# Description
+#   This function computes the disk usage of a directory tree
+#
+# Parameters
+#   _path - The path to the directory (or file)
+#
+# Returns
+#   A tuple (size, number of files, set of (device, inode, size)
+#   of the files having several hard links)
+#
+def get_directory_usage(_path):
+
+    size = 0
+    files = 0
+    linked = set()
+
+    if not os.path.isdir(_path) :
+        st = os.stat(_path, follow_symlinks=False)
+        return (st.st_size, 1, set())
+
+    directories = [ _path ]
+
+    while directories :
+        try :
+            it = os.scandir(directories.pop())
+        except OSError :
+            continue
+        with it :
+            for entry in it :
+                if entry.is_dir(follow_symlinks=False) :
+                    directories.append(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                files += 1
+                # Hard linked files (see --dedupe) are only counted once
+                if st.st_nlink > 1 and st.st_ino :
+                    linked.add((st.st_dev, st.st_ino, st.st_size))
+                else :
+                    size += st.st_size
+
+    return (size, files, linked)
+
+#
+# Description
+#   This function reports the disk usage of the caches vcpkg uses,
+#   overall and per port. Every top level entry of every location
+#   is scanned by its own worker
+#
+# Parameters
+#   _vcpkg_root - The path to the vcpkg root directory (None to skip its folders)
+#   _jobs       - The number of workers
+#
+# Returns
+#   A dictionary { "categories" : { name : { path, exists, size, files } },
+#                  "ports"      : { port : { buildtrees, packages } } }
+#
+def get_usage_report(_vcpkg_root, _jobs=None):
+
+    locations = OrderedDict()
+
+    if _vcpkg_root :
+        locations["buildtrees"] = os.path.join(_vcpkg_root, "buildtrees")
+        locations["downloads"]  = os.path.join(_vcpkg_root, "downloads")
+        locations["packages"]   = os.path.join(_vcpkg_root, "packages")
+
+    locations["binary-cache"]   = get_binary_cache_path()
+    locations["nuget-packages"] = get_nuget_packages_path()
+
+    tasks = []
+    with ThreadPoolExecutor(max_workers=_jobs) as executor :
+        for category, path in locations.items() :
+            if not path or not os.path.isdir(path) :
+                continue
+            with os.scandir(path) as it :
+                for entry in it :
+                    name = entry.name if entry.is_dir(follow_symlinks=False) else None
+                    tasks.append((category, name, executor.submit(get_directory_usage, entry.path)))
+
+    categories = OrderedDict()
+    for category, path in locations.items() :
+        categories[category] = { "path" : path, "exists" : bool(path) and os.path.isdir(path), "size" : 0, "files" : 0 }
+
+    linked = {}
+    ports = {}
+    for category, name, future in tasks :
+        size, files, entry_linked = future.result()
+        categories[category]["size"] += size
+        categories[category]["files"] += files
+        linked.setdefault(category, set()).update(entry_linked)
+
+        # buildtrees/<port> and packages/<port>_<triplet>
+        if name and category in ("buildtrees", "packages") :
+            port = name if category == "buildtrees" else name.split("_")[0]
+            usage = ports.setdefault(port, { "buildtrees" : 0, "packages" : 0 })
+            usage[category] += size + sum(link_size for _, _, link_size in entry_linked)
+
+    for category, entries in linked.items() :
+        categories[category]["size"] += sum(size for _, _, size in entries)
+
+    return { "categories" : categories, "ports" : OrderedDict(sorted(ports.items())) }
+
+#
+# Description
+#   This function formats a number of bytes
+#
+# Parameters
+#   _size - The number of bytes
+#
+# Returns
+#   The human readable size
+#
+def format_size(_size):
+
+    for unit in [ "B", "KiB", "MiB", "GiB" ] :
+        if _size < 1024 :
+            return "{:.1f} {}".format(_size, unit)
+        _size /= 1024.0
+
+    return "{:.1f} TiB".format(_size)
+
+#
+# Description
+#   This function prints the disk usage report as a table
+#
+# Parameters
+#   _report - The report returned by get_usage_report
+#
+def print_usage_report(_report):
+
+    print("{:<16} {:>12} {:>10}  {}".format("Category", "Size", "Files", "Path"))
+    for category, usage in _report["categories"].items() :
+        size = format_size(usage["size"]) if usage["exists"] else "-"
+        print("{:<16} {:>12} {:>10}  {}".format(category, size, usage["files"], usage["path"] or "-"))
+
+    if _report["ports"] :
+        print("")
+        print("{:<24} {:>12} {:>12} {:>12}".format("Port", "buildtrees", "packages", "Total"))
+        for port, usage in sorted(_report["ports"].items(), key=lambda item: -(item[1]["buildtrees"] + item[1]["packages"])) :
+            print("{:<24} {:>12} {:>12} {:>12}".format(port, format_size(usage["buildtrees"]), format_size(usage["packages"]),
+                                                      format_size(usage["buildtrees"] + usage["packages"])))
+
+BUILD_HISTORY_FILE_NAME = "build-history.jsonl"
+LOG_CHUNK_SIZE = 1024 * 1024
+LOG_MAX_LINE = 64 * 1024
+
+#
+# Description
+#   This function splits the name of a vcpkg build log
+#   (e.g. config-x64-linux-dbg-out.log, stdout-x64-linux.log)
+#
+# Parameters
+#   _name - The file name
+#
+# Returns
+#   A tuple (phase, triplet, configuration), None if not a log.
+#   The triplet and the configuration may be empty
+#
+def parse_log_name(_name):
+
+    if not _name.endswith(".log") :
+        return None
+
+    parts = _name[:-len(".log")].split("-")
+    phase = parts.pop(0)
+    if parts and parts[-1] in ("out", "err") :
+        parts.pop()
+    configuration = parts.pop() if parts and parts[-1] in ("dbg", "rel") else ""
+
+    return (phase, "-".join(parts), configuration)
+
+#
+# Description
+#   This function counts the warnings and the errors of a build
+#   log. It is read by chunks and overlong lines are truncated,
+#   so that memory stays bounded whatever the size of the log
+#
+# Parameters
+#   _path - The path to the log
+#
+# Returns
+#   A tuple (warnings, errors)
+#
+def count_log_messages(_path):
+
+    warnings = 0
+    errors = 0
+
+    def count_line(_line) :
+        nonlocal warnings, errors
+        line = _line.lower()
+        if b"warning:" in line or line.startswith(b"cmake warning") :
+            warnings += 1
+        elif b"error:" in line or line.startswith(b"cmake error") or line.startswith(b"failed:") :
+            errors += 1
+
+    pending = b""
+    with open(_path, 'rb') as f :
+        for chunk in iter(lambda: f.read(LOG_CHUNK_SIZE), b"") :
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()[:LOG_MAX_LINE]
+            for line in lines :
+                count_line(line)
+    if pending :
+        count_line(pending)
+
+    return (warnings, errors)
+
+#
+# Description
+#   This function analyzes the build logs of a port. vcpkg runs
+#   the phases one after the other and does not timestamp the logs,
+#   so a phase is considered to end when its last log was written
+#   and to start when the previous phase ended. The first phase
+#   only has a duration where the file creation time is known
+#
+# Parameters
+#   _port_dir - The path to buildtrees/<port>
+#
+# Returns
+#   A list of records, one per triplet :
+#   { port, triplet, phases : { phase : seconds }, duration, warnings, errors, logs }
+#
+def analyze_port_logs(_port_dir):
+
+    port = os.path.basename(_port_dir)
+    triplets = {}
+
+    with os.scandir(_port_dir) as it :
+        for entry in it :
+            if not entry.is_file() :
+                continue
+            parsed = parse_log_name(entry.name)
+            if parsed is None :
+                continue
+            phase, triplet, configuration = parsed
+            st = entry.stat()
+            if os.name == "nt" :
+                created = st.st_ctime
+            else :
+                created = getattr(st, "st_birthtime", None)
+            warnings, errors = count_log_messages(entry.path)
+
+            record = triplets.setdefault(triplet, { "phases" : {}, "created" : [], "warnings" : 0, "errors" : 0, "logs" : 0 })
+            name = phase + "-" + configuration if configuration else phase
+            record["phases"][name] = max(record["phases"].get(name, 0), st.st_mtime)
+            if created :
+                record["created"].append(created)
+            record["warnings"] += warnings
+            record["errors"] += errors
+            record["logs"] += 1
+
+    records = []
+    for triplet, record in sorted(triplets.items()) :
+        ends = sorted(record["phases"].items(), key=lambda item: item[1])
+        start = min(record["created"]) if record["created"] else None
+        phases = OrderedDict()
+        previous = start
+        for name, end in ends :
+            phases[name] = round(end - previous, 3) if previous is not None else None
+            previous = end
+        duration = round(ends[-1][1] - (start if start is not None else ends[0][1]), 3)
+        records.append({ "port" : port, "triplet" : triplet, "phases" : phases, "duration" : duration,
+                         "warnings" : record["warnings"], "errors" : record["errors"], "logs" : record["logs"] })
+
+    return records
+
+#
+# Description
+#   This function analyzes the build logs of the buildtrees folder,
+#   every port by its own worker
+#
+# Parameters
+#   _buildtrees_path - The path to the buildtrees folder
+#   _ports           - Only analyze these ports (None for every port)
+#   _jobs            - The number of workers
+#
+# Returns
+#   The list of records (see analyze_port_logs)
+#
+def analyze_build_logs(_buildtrees_path, _ports=None, _jobs=None):
+
+    if not os.path.isdir(_buildtrees_path) :
+        return []
+
+    with os.scandir(_buildtrees_path) as it :
+        port_dirs = sorted(entry.path for entry in it if entry.is_dir(follow_symlinks=False) and (_ports is None or entry.name in _ports))
+
+    records = []
+    with ThreadPoolExecutor(max_workers=_jobs) as executor :
+        for port_records in executor.map(analyze_port_logs, port_dirs) :
+            records.extend(port_records)
+
+    return records
+
+#
+# Description
+#   This function appends records to the build history,
+#   one JSON object per line, stamped with the current time
+#
+# Parameters
+#   _history_path - The path to the history file
+#   _records      - The records (see analyze_port_logs)
+#
+def append_build_history(_history_path, _records):
+
+    now = int(time.time())
+    with open(_history_path, 'a') as f :
+        for record in _records :
+            f.write(json.dumps(OrderedDict([ ("time", now) ] + list(record.items())), separators=(",", ":")) + "\n")
+
+    print("-- Build history : {} record(s) appended to {}".format(len(_records), _history_path))
+
+#
+# Description
+#   This function analyzes the build logs of the buildtrees folder
+#   and appends the results to the build history
+#
+# Parameters
+#   _vcpkg_root   - The path to the vcpkg root directory
+#   _history_path - The path to the history file (None for <vcpkg_root>/build-history.jsonl)
+#   _ports        - Only analyze these ports (None for every port)
+#   _jobs         - The number of workers
+#
+def record_build_logs(_vcpkg_root, _history_path, _ports=None, _jobs=None):
+
+    with timings.phase("analyze build logs") :
+        records = analyze_build_logs(os.path.join(_vcpkg_root, "buildtrees"), _ports, _jobs)
+    append_build_history(_history_path or os.path.join(_vcpkg_root, BUILD_HISTORY_FILE_NAME), records)
+
+#
+# Description
+#   This function reads the build history line by line and reports
+#   the slowest port builds of the latest run of each port and
+#   triplet, and the builds slower than the median of their
+#   previous runs by more than the threshold
+#
+# Parameters
+#   _history_path - The path to the history file
+#   _top          - The number of slowest builds reported
+#   _threshold    - The relative slowdown reported as a regression (e.g. 0.25)
+#   _runs         - The number of previous runs the median is computed on
+#
+# Returns
+#   A dictionary { "slowest" : [ record ], "regressions" : [ record + previous_median ] }
+#
+def get_build_history_report(_history_path, _top=10, _threshold=0.25, _runs=10):
+
+    latest = {}
+    previous = {}
+
+    with open(_history_path, 'r') as f :
+        for line in f :
+            line = line.strip()
+            if not line :
+                continue
+            record = json.loads(line)
+            key = (record["port"], record["triplet"])
+            if key in latest and latest[key]["duration"] is not None :
+                durations = previous.setdefault(key, [])
+                durations.append(latest[key]["duration"])
+                # Only the last runs are kept, memory stays bounded
+                del durations[:-_runs]
+            latest[key] = record
+
+    timed = [ record for record in latest.values() if record["duration"] is not None ]
+    slowest = sorted(timed, key=lambda record: -record["duration"])[:_top]
+
+    regressions = []
+    for key, record in sorted(latest.items()) :
+        durations = sorted(previous.get(key, []))
+        if not durations or record["duration"] is None :
+            continue
+        median = durations[len(durations) // 2]
+        # Sub-second builds are noise
+        if median >= 1 and record["duration"] > median * (1 + _threshold) :
+            regressions.append(OrderedDict(list(record.items()) + [ ("previous_median", median) ]))
+
+    return { "slowest" : slowest, "regressions" : regressions }
+
+#
+# Description
+#   This function prints the build history report as tables
+#
+# Parameters
+#   _report - The report returned by get_build_history_report
+#
+def print_build_history_report(_report):
+
+    print("{:<24} {:<24} {:>10} {:>9} {:>7}".format("Port", "Triplet", "Duration", "Warnings", "Errors"))
+    for record in _report["slowest"] :
+        print("{:<24} {:<24} {:>9.1f}s {:>9} {:>7}".format(record["port"], record["triplet"] or "-", record["duration"],
+                                                          record["warnings"], record["errors"]))
+
+    if _report["regressions"] :
+        print("")
+        print("{:<24} {:<24} {:>10} {:>10}".format("Regression", "Triplet", "Duration", "Median"))
+        for record in _report["regressions"] :
+            print("{:<24} {:<24} {:>9.1f}s {:>9.1f}s".format(record["port"], record["triplet"] or "-", record["duration"],
+                                                            record["previous_median"]))
+
 #
 # Description
 #   This is the entry point of the script
@@ -77,14 +1107,65 @@ def main(argv):
     parser.add_argument("--download-folder", dest="download_folder", help="Clean the download folder in your vcpkg repository", action="store_true")
     parser.add_argument("--package-folder",  dest="package_folder",  help="Clean the package folder in your vcpkg repository",  action="store_true")
     parser.add_argument("--vcpkg-root",      dest="vcpkg_root",      help="The path to your vpckg root directory")
+    parser.add_argument("--report",          dest="report",          help="Only report how much each folder and each port would free",  action="store_true")
+    parser.add_argument("--json",            dest="json",            help="With --report, print the report as JSON",            action="store_true")
+    parser.add_argument("--port",            dest="ports",           help="Only clean the buildtrees, packages and binary cache entries of this port", action="append", metavar="PORT")
+    parser.add_argument("--with-dependents", dest="with_dependents", help="With --port, also clean the registry ports depending on it", action="store_true")
+    parser.add_argument("--registry-root",   dest="registry_root",   help="The path to the registry the dependencies are read from (default: parent of this script)")
+    parser.add_argument("--max-size",        dest="max_size",        help="Evict least recently used binary cache archives until the cache fits in this size (e.g. 20G)", type=parse_size)
+    parser.add_argument("--max-age",         dest="max_age",         help="Evict binary cache archives not used for this many days", type=float)
+    parser.add_argument("--dedupe",          dest="dedupe",          help="Replace identical binary cache archives by hard links", action="store_true")
+    parser.add_argument("--dry-run",         dest="dry_run",         help="Only report what the eviction or the dedupe would free", action="store_true")
+    parser.add_argument("--jobs",            dest="jobs",            help="The number of threads used to delete files",         type=int)
+    parser.add_argument("--background",      dest="background",      help="Move directories aside and delete them in a detached process", action="store_true")
+    parser.add_argument("--analyze-logs",    dest="analyze_logs",    help="Record the phase durations, warnings and errors of the build logs before cleaning", action="store_true")
+    parser.add_argument("--build-history",   dest="build_history",   help="The history the build logs are recorded into (default: <vcpkg-root>/{})".format(BUILD_HISTORY_FILE_NAME))
+    parser.add_argument("--build-history-report", dest="build_history_report", help="Only report the slowest builds and the regressions of the build history", action="store_true")
+    parser.add_argument("--top",             dest="top",             help="With --build-history-report, the number of slowest builds reported", type=int, default=10)
+    parser.add_argument("--regression-threshold", dest="regression_threshold", help="With --build-history-report, the relative slowdown reported (default: 0.25)", type=float, default=0.25)
+    parser.add_argument("--timings",         dest="timings",         help="Print the time spent in each phase, or write it as a Chrome trace to this file (default: ${})".format(TIMINGS_ENV), nargs="?", const="table", metavar="TRACE.json")
+
+    # Used by --background to run the detached deletion
+    parser.add_argument("--remove-detached", dest="remove_detached", help=argparse.SUPPRESS)
 
     args = parser.parse_args(argv)
 
+    if args.timings :
+        timings.enable(args.timings)
+
+    if args.remove_detached :
+        fast_remove_tree(args.remove_detached, args.jobs)
+        return 0
+
     # Get current directory
     current_dir = str(pathlib.Path(__file__).parent.absolute())
 
+    # Report only, the vcpkg root folders are
+    # skipped if it cannot be found
+    if args.report :
+        with timings.phase("usage report") :
+            report = get_usage_report(args.vcpkg_root or os.environ.get("VCPKG_ROOT"), args.jobs)
+        if args.json :
+            print(json.dumps(report, indent=2))
+        else :
+            print_usage_report(report)
+        return 0
+
+    # Report only, from the build history
+    if args.build_history_report :
+        vcpkg_root = args.vcpkg_root or os.environ.get("VCPKG_ROOT")
+        if not args.build_history and not vcpkg_root :
+            raise ValueError("The build history is found through --build-history, --vcpkg-root or VCPKG_ROOT")
+        report = get_build_history_report(args.build_history or os.path.join(vcpkg_root, BUILD_HISTORY_FILE_NAME),
+                                          args.top, args.regression_threshold)
+        if args.json :
+            print(json.dumps(report, indent=2))
+        else :
+            print_build_history_report(report)
+        return 0
+
     # Check arguments
-    if args.all or args.build_folder or args.download_folder :
+    if args.all or args.build_folder or args.download_folder or args.ports or args.analyze_logs :
         if args.vcpkg_root :
             vcpkg_root = args.vcpkg_root
         elif "VCPKG_ROOT" in os.environ :
@@ -93,6 +1174,30 @@ def main(argv):
             raise ValueError("You requested to clean build_folder and/or download_folder which are relatives to vcpkg_root\n"
                              "You did not specify where to vcpkg root is located so they cannot be found\n"
                              "This can be done either through --vcpkg-root option or VCPKG_ROOT environment variable")
+        args.vcpkg_root = vcpkg_root
+
+    # A previous background removal may have been interrupted
+    with timings.phase("sweep stale directories") :
+        sweep_all_stale_trash(args.vcpkg_root, args.jobs, args.background)
+
+    # Only the entries of some ports are cleaned,
+    # other ports keep their cached builds
+    if args.ports :
+        registry_root = args.registry_root or os.path.dirname(current_dir)
+        with timings.phase("resolve ports") :
+            ports = get_ports_to_clean(registry_root, args.ports, args.with_dependents)
+        print("-- Cleaning ports : {}".format(", ".join(ports)))
+        if args.analyze_logs :
+            record_build_logs(args.vcpkg_root, args.build_history, set(ports), args.jobs)
+        with timings.phase("remove ports") :
+            remove_ports(args.vcpkg_root, get_binary_cache_path(), ports, args.jobs, args.background)
+        print("-- Success")
+        return 0
+
+    # The build logs are the only record of how long
+    # each port took to build, keep it before they go
+    if args.analyze_logs :
+        record_build_logs(args.vcpkg_root, args.build_history, None, args.jobs)
 
     # Enforce all if requested
     if args.all :
@@ -107,46 +1212,54 @@ def main(argv):
     #   - binaries
     #   - logs
     if args.build_folder :
-        remove_directory(os.path.join(args.vcpkg_root, "buildtrees"))
+        with timings.phase("remove buildtrees") :
+            remove_directory(os.path.join(args.vcpkg_root, "buildtrees"), args.jobs, args.background)
 
     # downloads folder is used by vcpkg
     # to download artifacts from various places
     # It mainly contains zipped sources
     if args.download_folder :
-        remove_directory(os.path.join(args.vcpkg_root, "downloads"))
+        with timings.phase("remove downloads") :
+            remove_directory(os.path.join(args.vcpkg_root, "downloads"), args.jobs, args.background)
 
     # package folder is used by vcpkg
     # to install build artifacts
     if args.download_folder :
-        remove_directory(os.path.join(args.vcpkg_root, "packages"))
+        with timings.phase("remove packages") :
+            remove_directory(os.path.join(args.vcpkg_root, "packages"), args.jobs, args.background)
+
+    # Identical archives stored under several ABI hashes
+    # are turned into hard links of a single copy
+    if args.dedupe :
+        binary_cache_path = get_binary_cache_path()
+        if binary_cache_path :
+            with timings.phase("dedupe binary cache") :
+                dedupe_binary_cache(binary_cache_path, args.jobs, args.dry_run)
 
     # binary cache is where vcpkg store compiled ports
-    # identified by there compiler hash version
-    if args.binary_cache :
+    # identified by there compiler hash version.
+    # With a size or age budget, only the least recently
+    # used archives are evicted instead of wiping everything
+    if args.max_size is not None or args.max_age is not None :
+        binary_cache_path = get_binary_cache_path()
+        if binary_cache_path :
+            with timings.phase("evict binary cache") :
+                evict_binary_cache(binary_cache_path, args.max_size, args.max_age, args.dry_run)
+
+    elif args.binary_cache :
 
         # If binary caching is used in conjunction with
         # VCPKG_USE_NUGET_CACHE it can store nuget into
         # <home_dir>/.nuget/packages
-        if "USERPROFILE" in os.environ :
-            home_dir = os.environ["USERPROFILE"]
-        else :
-            home_dir = os.environ["HOME"]
-
-        remove_directory(os.path.join(home_dir, ".nuget", "packages"))
-
-        # Search in order
-        binary_cache_paths = OrderedDict([
-          ("VCPKG_DEFAULT_BINARY_CACHE", ""),
-          ("LOCALAPPDATA"              , "vcpkg"),
-          ("APPDATA"                   , "vcpkg"),
-          ("XDG_CACHE_HOME"            , "vcpkg"),
-          ("HOME"                      , os.path.join(".cache", "vcpkg"))
-        ])
-
-        for var,subdir in binary_cache_paths.items() :
-            if var in os.environ :
-                remove_directory(os.path.join(os.environ[var], subdir))
-                break
+        nuget_packages_path = get_nuget_packages_path()
+        if nuget_packages_path :
+            with timings.phase("remove nuget packages") :
+                remove_directory(nuget_packages_path, args.jobs, args.background)
+
+        binary_cache_path = get_binary_cache_path()
+        if binary_cache_path :
+            with timings.phase("remove binary cache") :
+                remove_directory(binary_cache_path, args.jobs, args.background)
 
     print("-- Success")
 
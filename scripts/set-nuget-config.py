@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import base64
+import json
 import os
 import pathlib
+import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+# The script runs from the registry and shares its helpers
+sys.path.insert(0, str(pathlib.Path(__file__).absolute().parent.parent))
+from registry.timings import TIMINGS_ENV, timings
 
 class NuGetCli(object) :
 
@@ -114,7 +123,737 @@ class NuGetCli(object) :
         if self.verbose :
             print("[cmd] >> {}".format(cmd))
 
-        return subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return timings.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+#
+# Description
+#   This function runs DPAPI the way NuGet does (current
+#   user scope, "NuGet" as entropy)
+#
+# Parameters
+#   data    - The bytes to encrypt or decrypt
+#   decrypt - Decrypt instead of encrypt
+#
+# Returns
+#   The resulting bytes (None if DPAPI is not available, i.e. not on Windows, or failed)
+#
+def nuget_dpapi(data, decrypt) :
+
+    if sys.platform != "win32" :
+        return None
+
+    import ctypes
+    from ctypes import wintypes
+
+    class DataBlob(ctypes.Structure) :
+        _fields_ = [ ("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char)) ]
+
+    def to_blob(data) :
+        buffer = ctypes.create_string_buffer(data, len(data))
+        return DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char))), buffer
+
+    data_in, data_buffer = to_blob(data)
+    entropy, entropy_buffer = to_blob(b"NuGet")
+    data_out = DataBlob()
+
+    function = ctypes.windll.crypt32.CryptUnprotectData if decrypt else ctypes.windll.crypt32.CryptProtectData
+    if not function(ctypes.byref(data_in), None, ctypes.byref(entropy), None, None, 0, ctypes.byref(data_out)) :
+        return None
+
+    try :
+        return ctypes.string_at(data_out.pbData, data_out.cbData)
+    finally :
+        ctypes.windll.kernel32.LocalFree(data_out.pbData)
+
+#
+# Description
+#   This function encrypts a value the way NuGet does (DPAPI, base64 encoded)
+#
+# Parameters
+#   value - The value to encrypt
+#
+# Returns
+#   The encrypted value (None if DPAPI is not available, i.e. not on Windows)
+#
+def nuget_encrypt(value) :
+
+    encrypted = nuget_dpapi(value.encode("utf-8"), False)
+
+    return base64.b64encode(encrypted).decode("ascii") if encrypted is not None else None
+
+#
+# Description
+#   This function decrypts a value encrypted by NuGet
+#
+# Parameters
+#   value - The encrypted value (None if there is none)
+#
+# Returns
+#   The decrypted value (None if it cannot be decrypted)
+#
+def nuget_decrypt(value) :
+
+    if not value :
+        return None
+
+    try :
+        decrypted = nuget_dpapi(base64.b64decode(value), True)
+    except ValueError :
+        return None
+
+    try :
+        return decrypted.decode("utf-8") if decrypted is not None else None
+    except UnicodeDecodeError :
+        return None
+
+#
+# Description
+#   The parser target of NuGetConfigFile: a TreeBuilder keeping
+#   the comments, including the ones around the root element
+#   which TreeBuilder alone drops
+#
+class CommentKeepingTreeBuilder(ElementTree.TreeBuilder) :
+
+    def __init__(self) :
+        super().__init__(insert_comments=True)
+        self.depth = 0
+        self.root_seen = False
+        self.prolog = []
+        self.epilog = []
+
+    def start(self, tag, attrs) :
+        self.depth += 1
+        self.root_seen = True
+        return super().start(tag, attrs)
+
+    def end(self, tag) :
+        self.depth -= 1
+        return super().end(tag)
+
+    def comment(self, text) :
+        if self.depth == 0 :
+            (self.epilog if self.root_seen else self.prolog).append(text)
+            return None
+        return super().comment(text)
+
+class NuGetConfigFile(object) :
+
+    #
+    # Description
+    #   The class constructor. The file is parsed right away,
+    #   an empty configuration is used if it does not exist
+    #
+    # Parameters
+    #   path    - The path to the NuGet.Config file
+    #   verbose - Print the changes made
+    #
+    # Exceptions
+    #   throw xml.etree.ElementTree.ParseError if the file is not valid XML
+    #
+    def __init__(self, path, verbose) :
+        self.path = path
+        self.verbose = verbose
+
+        # Comments are kept, a user's NuGet.Config may hold notes
+        self.prolog = []
+        self.epilog = []
+        if os.path.isfile(path) :
+            builder = CommentKeepingTreeBuilder()
+            self.tree = ElementTree.parse(path, ElementTree.XMLParser(target=builder))
+            self.prolog = builder.prolog
+            self.epilog = builder.epilog
+        else :
+            self.tree = ElementTree.ElementTree(ElementTree.Element("configuration"))
+
+        self.original = self.serialize()
+
+    #
+    # Description
+    #   This function encodes a name as an XML element name,
+    #   like .NET XmlConvert.EncodeLocalName does
+    #
+    # Parameters
+    #   name - The name to encode
+    #
+    # Returns
+    #   The encoded name
+    #
+    @staticmethod
+    def encode_name(name) :
+
+        def encode(match) :
+            return "_x{:04X}_".format(ord(match.group(0)))
+
+        encoded = re.sub(r"_(?=x[0-9A-Fa-f]{4}_)|[^A-Za-z0-9_.\-]", encode, name)
+        if encoded and not re.match(r"[A-Za-z_]", encoded[0]) :
+            encoded = "_x{:04X}_".format(ord(name[0])) + encoded[1:]
+
+        return encoded
+
+    #
+    # Description
+    #   This function returns a child section, creating it if needed
+    #
+    # Parameters
+    #   parent - The parent element
+    #   name   - The section name
+    #
+    # Returns
+    #   The section element
+    #
+    def get_section(self, parent, name) :
+
+        section = parent.find(name)
+        if section is None :
+            section = ElementTree.SubElement(parent, name)
+
+        return section
+
+    #
+    # Description
+    #   This function returns the <add key="..." value="..."/> items of a key
+    #
+    # Parameters
+    #   section - The section element
+    #   key     - The item key
+    #
+    # Returns
+    #   The list of items
+    #
+    def find_items(self, section, key) :
+
+        return [ item for item in section.findall("add") if item.get("key") == key ]
+
+    #
+    # Description
+    #   This function returns the value of an <add key="..." value="..."/>
+    #   item, without creating its section
+    #
+    # Parameters
+    #   parent - The element the section is looked up from
+    #   path   - The path of the section below parent
+    #   key    - The item key
+    #
+    # Returns
+    #   The value (None if there is no such item)
+    #
+    def find_item(self, parent, path, key) :
+
+        section = parent.find(path)
+        items = self.find_items(section, key) if section is not None else []
+
+        return items[0].get("value") if items else None
+
+    #
+    # Description
+    #   This function sets the value of an <add key="..." value="..."/> item
+    #
+    # Parameters
+    #   section - The section element
+    #   key     - The item key
+    #   value   - The item value (None to remove the item)
+    #
+    def set_item(self, section, key, value) :
+
+        items = self.find_items(section, key)
+
+        if value is None :
+            for item in items :
+                section.remove(item)
+            return
+
+        if items :
+            items[0].set("value", value)
+        else :
+            ElementTree.SubElement(section, "add", { "key" : key, "value" : value })
+
+    #
+    # Description
+    #   This function adds or updates a source with its credentials,
+    #   as 'nuget sources add/update' does
+    #
+    # Parameters
+    #   name              - The repository user friendly name
+    #   url               - The repository url
+    #   user              - The Artifactory user
+    #   api_key           - The API key of this user
+    #   password_in_clear - Store the password in clear
+    #
+    # Returns
+    #   False if the password must be encrypted but encryption is not available
+    #
+    def set_source(self, name, url, user, api_key, password_in_clear) :
+
+        root = self.tree.getroot()
+        current = self.find_item(root, "packageSourceCredentials/{}".format(self.encode_name(name)), "Password")
+
+        # Encryption is salted: an encrypted password that is already
+        # the right one is kept, so that the file is not rewritten
+        if password_in_clear :
+            password = api_key
+        elif nuget_decrypt(current) == api_key :
+            password = current
+        else :
+            password = nuget_encrypt(api_key)
+        if password is None :
+            return False
+
+        self.set_item(self.get_section(root, "packageSources"), name, url)
+
+        credentials = self.get_section(self.get_section(root, "packageSourceCredentials"), self.encode_name(name))
+        self.set_item(credentials, "Username", user)
+        self.set_item(credentials, "ClearTextPassword", api_key if password_in_clear else None)
+        self.set_item(credentials, "Password", None if password_in_clear else password)
+
+        return True
+
+    #
+    # Description
+    #   This function sets the API key of a source, as
+    #   'nuget setapikey' does (the key is always encrypted)
+    #
+    # Parameters
+    #   url     - The repository url
+    #   user    - The Artifactory user
+    #   api_key - The API key of this user
+    #
+    # Returns
+    #   False if encryption is not available
+    #
+    def set_api_key(self, url, user, api_key) :
+
+        root = self.tree.getroot()
+        value = "{}:{}".format(user, api_key)
+
+        # Encryption is salted, the key is only encrypted again if it changed
+        if nuget_decrypt(self.find_item(root, "apikeys", url)) == value :
+            return True
+
+        encrypted = nuget_encrypt(value)
+        if encrypted is None :
+            return False
+
+        self.set_item(self.get_section(root, "apikeys"), url, encrypted)
+
+        return True
+
+    #
+    # Description
+    #   This function serializes the configuration
+    #   the way NuGet formats it
+    #
+    # Returns
+    #   The XML document
+    #
+    def serialize(self) :
+
+        root = self.tree.getroot()
+        ElementTree.indent(root, space="  ")
+
+        prolog = "".join("<!--{}-->\n".format(text) for text in self.prolog)
+        epilog = "".join("<!--{}-->\n".format(text) for text in self.epilog)
+
+        return '<?xml version="1.0" encoding="utf-8"?>\n' + prolog + ElementTree.tostring(root, encoding="unicode") + "\n" + epilog
+
+    #
+    # Description
+    #   This function writes the file if anything changed. The file
+    #   is written next to its destination then renamed over it
+    #
+    # Returns
+    #   True if the file was written
+    #
+    def save(self) :
+
+        content = self.serialize()
+        if content == self.original :
+            if self.verbose :
+                print("[file] >> {} is up to date".format(self.path))
+            return False
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".NuGet.Config.", dir=directory)
+        try :
+            with os.fdopen(fd, 'w', encoding="utf-8") as f :
+                f.write(content)
+            os.replace(tmp_path, self.path)
+        except BaseException :
+            os.unlink(tmp_path)
+            raise
+
+        if self.verbose :
+            print("[file] >> {} written".format(self.path))
+
+        self.original = content
+        return True
+
+#
+# Description
+#   This function returns the file where resolved tools are cached
+#
+# Returns
+#   The path to the cache file
+#
+def get_tools_cache_path() :
+
+    if "LOCALAPPDATA" in os.environ :
+        cache_dir = os.environ["LOCALAPPDATA"]
+    elif "XDG_CACHE_HOME" in os.environ :
+        cache_dir = os.environ["XDG_CACHE_HOME"]
+    else :
+        cache_dir = os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(cache_dir, "onbings-vcpkg-registry", "tools.json")
+
+#
+# Description
+#   This function returns the key a resolved tool is cached under:
+#   the vcpkg executable (path, modification time and size) and mono
+#
+# Parameters
+#   vcpkg - The path to the vcpkg executable
+#   mono  - The path to mono executable (None if not found)
+#
+# Returns
+#   The cache key
+#
+def get_tools_cache_key(vcpkg, mono) :
+
+    st = os.stat(vcpkg)
+
+    return "{}|{}|{}|{}".format(os.path.abspath(vcpkg), st.st_mtime_ns, st.st_size, mono or "")
+
+#
+# Description
+#   This function returns the nuget.exe vcpkg uses. The path given
+#   by 'vcpkg fetch nuget' is cached and reused as long as vcpkg and
+#   mono did not change and the file still exists
+#
+# Parameters
+#   vcpkg   - The path to the vcpkg executable
+#   mono    - The path to mono executable (None if not found)
+#   verbose - Print where the path comes from
+#
+# Returns
+#   The path to nuget.exe
+#
+def fetch_nuget(vcpkg, mono, verbose) :
+
+    cache_path = get_tools_cache_path()
+    key = get_tools_cache_key(vcpkg, mono)
+
+    try :
+        with open(cache_path, 'r') as f :
+            cache = json.loads(f.read())
+    except (OSError, ValueError) :
+        cache = {}
+
+    nuget = cache.get(key, {}).get("nuget")
+    if nuget and os.path.isfile(nuget) :
+        if verbose :
+            print("[cache] >> nuget from {}".format(cache_path))
+        return nuget
+
+    # If nuget is not yet downloaded this command might fail
+    for i in range(0, 2) :
+        result = timings.run([vcpkg, "fetch", "nuget"], stdout=subprocess.PIPE, check=True)
+        nuget = result.stdout.decode('utf-8').strip()
+
+        # Check that command is valid
+        if os.path.exists(nuget) :
+            break
+
+    # Entries of other vcpkg versions are stale
+    cache = { key : { "nuget" : nuget } }
+    try :
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as f :
+            f.write(json.dumps(cache, indent=2))
+    except OSError :
+        pass
+
+    return nuget
+
+#
+# Description
+#   This function locates vcpkg and the nuget.exe it uses
+#
+# Parameters
+#   vcpkg_root - The path to the vcpkg root directory (None to use VCPKG_ROOT)
+#   verbose    - Print all command submitted
+#
+# Returns
+#   A NuGetCli instance
+#
+def get_nuget_cli(vcpkg_root, verbose) :
+
+    # Objectives
+    #  We are going to set a repository to serve
+    #  as a binary cache for vcpkg. As such, it's
+    #  worth it to
+    #    1°) Check that vcpkg is properly configured (i.e. vcpkg executable exists)
+    #    2°) Get the nuget.exe that vcpkg is going to use (vpckg fetch nuget)
+    #        - For portability under Linux, check if mono is installed
+    #    3°) Use nuget.exe itself to configure our repository
+
+    #===============
+    #== GET VCPKG ==
+    #===============
+
+    if not vcpkg_root :
+        if "VCPKG_ROOT" in os.environ :
+            vcpkg_root = os.environ["VCPKG_ROOT"]
+        else :
+            raise ValueError("You did not specify where vcpkg root is located\n"
+                             "This can be done either through --vcpkg-root option or"
+                             " VCPKG_ROOT environment variable")
+
+    # Check that vcpkg can be found
+    vcpkg = shutil.which("vcpkg", path=vcpkg_root)
+
+    if not vcpkg :
+        raise RuntimeError("No vcpkg executable found at {}. Is vcpkg bootstrapped ?".format(vcpkg_root))
+
+    #===============
+    #== Get nuget ==
+    #===============
+
+    # NuGet requires mono under linux
+    mono = shutil.which("mono")
+
+    # Display a warning if not found. Probably suspicious
+    if not mono and sys.platform == "linux" :
+        print("WARNING : It seems you are on Linux machine and mono was not found."
+              " mono is required in order for NuGet to work")
+
+    nuget = fetch_nuget(vcpkg, mono, verbose)
+
+    if verbose :
+        print("NuGet executable found at {}".format(nuget))
+
+    return NuGetCli(mono, nuget, verbose)
+
+#
+# Description
+#   This function adds or updates a repository in NuGet.Config
+#
+# Parameters
+#   nuget_config_file - The path to the NuGet.Config file
+#   nuget_tools       - The NuGetTools used when nuget.exe is needed
+#   name              - The repository user friendly name
+#   url               - The repository url
+#   user              - The Artifactory user
+#   api_key           - The API key of this user
+#   password_in_clear - Store the password in clear
+#   backend           - "auto", "file" or "cli" (see --backend)
+#   verbose           - Print all command submitted
+#
+def add_repository(nuget_config_file, nuget_tools, name, url, user, api_key, password_in_clear, backend, verbose) :
+
+    print("-- Adding repository {} ({})".format(name, url))
+
+    # The configuration file is edited directly when possible,
+    # which avoids starting mono + nuget.exe up to three times.
+    # The API key is always encrypted by NuGet, which can only be
+    # reproduced on Windows: elsewhere nuget.exe still sets it
+    source_set = False
+    api_key_set = False
+
+    if backend != "cli" :
+        try :
+            with timings.phase("edit NuGet.Config") :
+                config_file = NuGetConfigFile(nuget_config_file, verbose)
+                source_set = config_file.set_source(name, url, user, api_key, password_in_clear)
+                if source_set :
+                    api_key_set = config_file.set_api_key(url, user, api_key)
+                    config_file.save()
+        except (ElementTree.ParseError, OSError) as e :
+            if backend == "file" :
+                raise
+            print("WARNING : Cannot edit {} directly ({}), using nuget.exe".format(nuget_config_file, e))
+            source_set = False
+
+        if not source_set and backend == "file" :
+            raise RuntimeError("The password cannot be encrypted on this platform, use --password-in-clear or --backend cli")
+
+    if source_set and not api_key_set and backend == "file" :
+        print("WARNING : The API key cannot be encrypted on this platform and was not set")
+        api_key_set = True
+
+    if not source_set or not api_key_set :
+        nuget_cli = nuget_tools.get_cli()
+
+        if not source_set :
+            try :
+                nuget_cli.sources  ("add", name, url, user, api_key, password_in_clear)
+            except subprocess.CalledProcessError as e :
+                nuget_cli.sources  ("update", name, url, user, api_key, password_in_clear)
+
+        nuget_cli.setapikey(name, user, api_key)
+
+class NuGetTools(object) :
+
+    #
+    # Description
+    #   The class constructor. nuget.exe is only located
+    #   the first time it is needed, then reused
+    #
+    # Parameters
+    #   vcpkg_root - The path to the vcpkg root directory (None to use VCPKG_ROOT)
+    #   verbose    - Print all command submitted
+    #
+    def __init__(self, vcpkg_root, verbose) :
+        self.vcpkg_root = vcpkg_root
+        self.verbose = verbose
+        self.cli = None
+
+    #
+    # Description
+    #   This function returns the NuGetCli to use
+    #
+    # Returns
+    #   A NuGetCli instance
+    #
+    def get_cli(self) :
+
+        if self.cli is None :
+            self.cli = get_nuget_cli(self.vcpkg_root, self.verbose)
+
+        return self.cli
+
+#
+# Description
+#   This function reads a binary sources configuration file:
+#
+#   {
+#     "local" : { "path" : "/var/cache/vcpkg", "mode" : "readwrite" },
+#     "nuget" : [
+#       { "name" : "artifactory", "url" : "https://...", "user" : "me",
+#         "api_key_env" : "ARTIFACTORY_API_KEY", "mode" : "read", "priority" : 10 }
+#     ]
+#   }
+#
+#   The API key is given either as "api_key" or as the name of the
+#   environment variable holding it ("api_key_env")
+#
+# Parameters
+#   path - The path to the configuration file
+#
+# Returns
+#   A dictionary { "local" : local tier or None, "nuget" : [ nuget tiers ] }
+#
+# Exceptions
+#   throw ValueError if the configuration is not valid
+#
+def read_binary_sources_config(path) :
+
+    with open(path, 'r') as f :
+        config = json.loads(f.read())
+
+    nuget = []
+    for source in config.get("nuget", []) :
+        missing = [ field for field in ("name", "url", "user") if field not in source ]
+        if missing :
+            raise ValueError("NuGet source {} misses {}".format(source.get("name", source.get("url")), ", ".join(missing)))
+
+        if "api_key_env" in source :
+            source["api_key"] = os.environ.get(source["api_key_env"])
+        if not source.get("api_key") :
+            raise ValueError("NuGet source {} has no API key".format(source["name"]))
+
+        if source.get("mode", "readwrite") not in ("read", "write", "readwrite") :
+            raise ValueError("NuGet source {} has an invalid mode {}".format(source["name"], source["mode"]))
+
+        nuget.append(source)
+
+    # Highest priority first, configuration order otherwise
+    nuget.sort(key=lambda source: -source.get("priority", 0))
+
+    return { "local" : config.get("local"), "nuget" : nuget }
+
+#
+# Description
+#   This function escapes a value of VCPKG_BINARY_SOURCES
+#   (',' ';' and '`' are escaped with '`')
+#
+# Parameters
+#   value - The value
+#
+# Returns
+#   The escaped value
+#
+def escape_binary_source(value) :
+
+    return re.sub(r"([`,;])", r"`\1", value)
+
+#
+# Description
+#   This function builds the VCPKG_BINARY_SOURCES value: the
+#   local files tier first so that repeated builds hit the
+#   local disk, then the NuGet tiers
+#
+# Parameters
+#   local - The local tier { "path", "mode" } (None for none)
+#   nuget - The NuGet tiers [ { "url", "mode" } ]
+#
+# Returns
+#   The VCPKG_BINARY_SOURCES value
+#
+def get_binary_sources(local, nuget) :
+
+    sources = [ "clear" ]
+
+    if local :
+        path = os.path.abspath(local["path"])
+        os.makedirs(path, exist_ok=True)
+        sources.append("files,{},{}".format(escape_binary_source(path), local.get("mode", "readwrite")))
+
+    for source in nuget :
+        sources.append("nuget,{},{}".format(escape_binary_source(source["url"]), source.get("mode", "readwrite")))
+
+    return ";".join(sources)
+
+#
+# Description
+#   This function sets a variable in an environment file
+#   (KEY=value lines, such as $GITHUB_ENV or a .env file).
+#   The line of the variable is replaced, so that running
+#   the script again does not pile up lines of which only
+#   the last one counts. Other lines are left as they are
+#
+# Parameters
+#   path  - The path to the environment file
+#   name  - The variable name
+#   value - The variable value
+#
+def set_env_file_variable(path, name, value) :
+
+    try :
+        with open(path, 'r') as f :
+            lines = f.read().splitlines()
+    except FileNotFoundError :
+        lines = []
+
+    pattern = re.compile(r"^\s*(export\s+)?{}=".format(re.escape(name)))
+    line = "{}={}".format(name, value)
+    result = []
+    replaced = False
+
+    for current in lines :
+        match = pattern.match(current)
+        if not match :
+            result.append(current)
+        elif not replaced :
+            result.append((match.group(1) or "") + line)
+            replaced = True
+
+    if not replaced :
+        result.append(line)
+
+    with open(path, 'w') as f :
+        f.write("\n".join(result) + "\n")
 
 #
 # Description
@@ -144,9 +883,22 @@ def main(argv):
     parser.add_argument("--delete-file-before", dest="delete_file_before", help="Delete the NuGet.Config file before adding the repository", action="store_true")
     parser.add_argument("--verbose",            dest="verbose",            help="Print all command submitted", action="store_true")
     parser.add_argument("--password-in-clear",  dest="password_in_clear",  help="Store the password in clear", action="store_true")
+    parser.add_argument("--backend",            dest="backend",            help="Edit NuGet.Config directly (file), through nuget.exe (cli) or directly when possible (auto, default)",
+                        choices=[ "auto", "file", "cli" ], default="auto")
+    parser.add_argument("--binary-sources-config", dest="binary_sources_config", help="JSON file describing the local and NuGet binary cache tiers (replaces --name/--url/--user/--api-key)")
+    parser.add_argument("--local-cache",        dest="local_cache",        help="Directory of a local files tier placed in front of the NuGet sources")
+    parser.add_argument("--env-file",           dest="env_file",           help="Set VCPKG_BINARY_SOURCES=... in this file, replacing any previous value")
+    parser.add_argument("--timings",            dest="timings",            help="Print the time spent in each phase and command, or write it as a Chrome trace to this file (default: ${})".format(TIMINGS_ENV),
+                        nargs="?", const="table", metavar="TRACE.json")
 
     args = parser.parse_args(argv)
 
+    if args.timings :
+        timings.enable(args.timings)
+
+    if not args.binary_sources_config and not (args.name and args.url and args.user and args.api_key) :
+        parser.error("--name, --url, --user and --api-key are required unless --binary-sources-config is used")
+
     verbose = args.verbose
 
     #========================
@@ -177,72 +929,33 @@ def main(argv):
             raise
 
 
-    # Objectives
-    #  We are going to set a repository to serve
-    #  as a binary cache for vcpkg. As such, it's
-    #  worth it to
-    #    1°) Check that vcpkg is properly configured (i.e. vcpkg executable exists)
-    #    2°) Get the nuget.exe that vcpkg is going to use (vpckg fetch nuget)
-    #        - For portability under Linux, check if mono is installed
-    #    3°) Use nuget.exe itself to configure our repository
-
-    #===============
-    #== GET VCPKG ==
-    #===============
-
-    if args.vcpkg_root :
-        vcpkg_root = args.vcpkg_root
-    elif "VCPKG_ROOT" in os.environ :
-        vcpkg_root = os.environ["VCPKG_ROOT"]
-    else :
-        raise ValueError("You did not specify where vcpkg root is located\n"
-                         "This can be done either through --vcpkg-root option or"
-                         " VCPKG_ROOT environment variable")
-
-    # Check that vcpkg can be found
-    vcpkg = shutil.which("vcpkg", path=vcpkg_root)
-
-    if not vcpkg :
-        raise RuntimeError("No vcpkg executable found at {}. Is vcpkg bootstrapped ?".format(vcpkg_root))
-
-    #===============
-    #== Get nuget ==
-    #===============
-
-    # NuGet requires mono under linux
-    mono = shutil.which("mono")
-
-    # Display a warning if not found. Probably suspicious
-    if not mono and sys.platform == "linux" :
-        print("WARNING : It seems you are on Linux machine and mono was not found."
-              " mono is required in order for NuGet to work")
-
-    # If nuget is not yet downloaded this command might fail
-    for i in range(0, 2) :
-        result = subprocess.run([vcpkg, "fetch", "nuget"], stdout=subprocess.PIPE, check=True)
-        nuget = result.stdout.decode('utf-8').strip()
-
-        # Check that command is valid
-        if os.path.exists(nuget) :
-            break
-
-    if verbose :
-        print("NuGet executable found at {}".format(nuget))
-
     #====================
     #== Append sources ==
     #====================
 
-    nuget_cli = NuGetCli(mono, nuget, verbose)
+    # Either a single repository from the command line,
+    # or the NuGet tiers of a binary sources configuration
+    if args.binary_sources_config :
+        sources = read_binary_sources_config(args.binary_sources_config)
+    else :
+        sources = { "local" : None, "nuget" : [ { "name" : args.name, "url" : args.url, "user" : args.user, "api_key" : args.api_key } ] }
 
-    print("-- Adding repository {} ({})".format(args.name, args.url))
+    if args.local_cache :
+        sources["local"] = { "path" : args.local_cache, "mode" : "readwrite" }
 
-    try :
-        nuget_cli.sources  ("add", args.name, args.url, args.user, args.api_key, args.password_in_clear)
-    except subprocess.CalledProcessError as e :
-        nuget_cli.sources  ("update", args.name, args.url, args.user, args.api_key, args.password_in_clear)
+    nuget_tools = NuGetTools(args.vcpkg_root, verbose)
+
+    for source in sources["nuget"] :
+        with timings.phase("add repository", repository=source["name"]) :
+            add_repository(nuget_config_file, nuget_tools, source["name"], source["url"], source["user"], source["api_key"],
+                           args.password_in_clear, args.backend, verbose)
+
+    if args.binary_sources_config or args.local_cache or args.env_file :
+        binary_sources = get_binary_sources(sources["local"], sources["nuget"])
+        print("-- VCPKG_BINARY_SOURCES={}".format(binary_sources))
 
-    nuget_cli.setapikey(args.name, args.user, args.api_key)
+        if args.env_file :
+            set_env_file_variable(args.env_file, "VCPKG_BINARY_SOURCES", binary_sources)
 
     print("-- Success")
 
@@ -0,0 +1,43 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def load_script(relative_path: str):
+    # The scripts have dashes in their names, they are loaded by path
+    path = os.path.join(REPO_ROOT, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git(cwd: str, *args: str) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    return result.stdout.strip()
+
+
+@pytest.fixture(autouse=True)
+def git_identity(monkeypatch):
+    # Commits made by the tests do not depend on the user configuration
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", os.devnull)
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "test")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "test@localhost")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "test")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "test@localhost")
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    git(str(root), "init", "-q", "-b", "main")
+    return root
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import subprocess
+
+from conftest import git, load_script
+from registry.archive import (
+    SHA512_CACHE_PATH,
+    ArchiveHasher,
+    find_mirror,
+    has_variables,
+    manifest_variables,
+    portfile_source,
+    stream_archive,
+)
+from registry.index import RegistryIndex, version_file_path
+
+prefetch_sources = load_script("prefetch-sources.py")
+
+
+def load_index() -> RegistryIndex:
+    index = RegistryIndex()
+    index.load_baselines()
+    return index
+
+
+def make_mirror(path) -> str:
+    os.makedirs(str(path))
+    git(str(path), "init", "-q", "-b", "main")
+    with open(os.path.join(str(path), "README"), 'w') as f:
+        f.write(f"{path}\n")
+    git(str(path), "add", "-A")
+    git(str(path), "commit", "-q", "-m", "initial")
+    return git(str(path), "rev-parse", "HEAD")
+
+
+def test_archive_matches_github(tmp_path):
+    # GitHub compresses 'git archive --format=tar' with an external gzip -n
+    mirror = tmp_path / "owner" / "project"
+    make_mirror(mirror)
+    (mirror / "data.bin").write_bytes(os.urandom(64 * 1024))
+    git(str(mirror), "add", "-A")
+    git(str(mirror), "commit", "-q", "-m", "data")
+    git(str(mirror), "tag", "v1.0.0")
+    tar = subprocess.Popen(["git", "-C", str(mirror), "archive", "--format=tar", "--prefix=project-v1.0.0/",
+                            "v1.0.0"], stdout=subprocess.PIPE)
+    expected = subprocess.run(["gzip", "-cn"], stdin=tar.stdout, stdout=subprocess.PIPE, check=True).stdout
+    tar.stdout.close()
+    assert tar.wait() == 0
+    chunks = []
+    sha512 = stream_archive(str(mirror), "owner/project", "v1.0.0", chunks.append)
+    assert b"".join(chunks) == expected
+    assert sha512 == hashlib.sha512(expected).hexdigest()
+
+
+def test_cache_of_older_format_ignored(tmp_path):
+    mirrors = tmp_path / "mirrors"
+    commit = make_mirror(mirrors / "owner" / "project")
+    registry = tmp_path / "registry"
+    registry.mkdir()
+    # A flat cache, written when the archives were compressed by git
+    (registry / SHA512_CACHE_PATH).write_text(json.dumps({f"owner/project@{commit}": "0" * 128}))
+    sha512 = ArchiveHasher(str(mirrors), root=str(registry)).sha512("owner/project", commit)
+    assert sha512 == stream_archive(str(mirrors / "owner" / "project"), "owner/project", commit)
+
+
+def test_find_mirror_matches_owner(tmp_path):
+    os.makedirs(str(tmp_path / "fork" / "zlib"))
+    assert find_mirror(str(tmp_path), "madler/zlib") is None
+    os.makedirs(str(tmp_path / "madler" / "zlib.git"))
+    assert find_mirror(str(tmp_path), "madler/zlib") == os.path.join(str(tmp_path), "madler", "zlib.git")
+    assert find_mirror(f"file://{tmp_path}", "madler/zlib") == os.path.join(str(tmp_path), "madler", "zlib.git")
+
+
+def test_cache_written_to_registry(tmp_path):
+    mirrors = tmp_path / "mirrors"
+    commit = make_mirror(mirrors / "owner" / "project")
+    registry = tmp_path / "registry"
+    registry.mkdir()
+    hasher = ArchiveHasher(str(mirrors), root=str(registry))
+    sha512 = hasher.sha512_many([("owner/project", commit)])[0]
+    assert len(sha512) == 128
+    assert os.path.isfile(str(registry / SHA512_CACHE_PATH))
+    assert not any(name.endswith(".json") for name in os.listdir(str(mirrors)))
+    # Served from the cache, even without the mirror
+    os.rename(str(mirrors / "owner"), str(mirrors / "moved"))
+    assert ArchiveHasher(str(mirrors), root=str(registry)).sha512("owner/project", commit) == sha512
+
+
+SDL_PORTFILE = """vcpkg_from_github(
+    OUT_SOURCE_PATH SOURCE_PATH
+    REPO "libsdl-org/SDL"
+    REF "release-${VERSION}"
+    SHA512 %s
+    HEAD_REF main
+    PATCHES
+        deps.patch
+)
+"""
+
+
+def test_portfile_source_expands_variables():
+    fields = portfile_source(SDL_PORTFILE % "0", manifest_variables({"name": "sdl2-core", "version": "2.32.4"}))
+    assert fields == {"REPO": "libsdl-org/SDL", "REF": "release-2.32.4", "SHA512": "0", "HEAD_REF": "main"}
+    # Unknown variables are left for the caller to detect
+    fields = portfile_source(SDL_PORTFILE.replace("VERSION", "SDL_TAG") % "0", {"VERSION": "2.32.4"})
+    assert fields["REF"] == "release-${SDL_TAG}"
+    assert has_variables(fields["REF"])
+
+
+def publish(root, port: str, portfile: str, version: str, baselines: tuple = ("default",)) -> str:
+    # Commits the port, then its version entry pinned by 'baselines'
+    if not os.path.isdir(str(root / ".git")):
+        os.makedirs(str(root))
+        git(str(root), "init", "-q", "-b", "main")
+    os.makedirs(str(root / "ports" / port), exist_ok=True)
+    (root / "ports" / port / "portfile.cmake").write_text(portfile)
+    (root / "ports" / port / "vcpkg.json").write_text(json.dumps({"name": port, "version": version}))
+    git(str(root), "add", "-A")
+    git(str(root), "commit", "-q", "-m", f"{port} {version}")
+    tree = git(str(root), "rev-parse", f"HEAD:ports/{port}")
+
+    path = root / version_file_path(port)
+    versions = json.loads(path.read_text()) if path.exists() else {"versions": []}
+    versions["versions"].insert(0, {"version": version, "git-tree": tree, "port-version": 0})
+    os.makedirs(str(path.parent), exist_ok=True)
+    path.write_text(json.dumps(versions))
+    path = root / "versions" / "baseline.json"
+    pins = json.loads(path.read_text()) if path.exists() else {}
+    for baseline in baselines:
+        pins.setdefault(baseline, {})[port] = {"baseline": version, "port-version": 0}
+    path.write_text(json.dumps(pins))
+    git(str(root), "add", "-A")
+    git(str(root), "commit", "-q", "-m", f"{port} {version} version")
+    return tree
+
+
+def sdl_mirror(mirrors, *tags: str) -> dict:
+    # {tag: SHA512 of its archive}
+    mirror = str(mirrors / "libsdl-org" / "SDL")
+    make_mirror(mirrors / "libsdl-org" / "SDL")
+    for tag in tags:
+        git(mirror, "commit", "-q", "--allow-empty", "-m", tag)
+        git(mirror, "tag", tag)
+    return {tag: stream_archive(mirror, "libsdl-org/SDL", tag) for tag in tags}
+
+
+def test_prefetch_ref_from_version(tmp_path, monkeypatch):
+    mirrors = tmp_path / "mirrors"
+    sha512s = sdl_mirror(mirrors, "release-2.32.4")
+    registry = tmp_path / "registry"
+    publish(registry, "sdl2-core", SDL_PORTFILE % sha512s["release-2.32.4"], "2.32.4")
+    monkeypatch.chdir(str(registry))
+
+    sources, problems = prefetch_sources.baseline_sources(load_index(), "default")
+    assert [(source.repo, source.ref) for source in sources] == [("libsdl-org/SDL", "release-2.32.4")]
+    assert problems == []
+    downloads = str(tmp_path / "downloads")
+    result = prefetch_sources.prefetch(sources[0], str(mirrors), downloads)
+    assert result.status == "fetched"
+    assert result.message == os.path.join(downloads, "libsdl-org-SDL-release-2.32.4.tar.gz")
+
+
+def test_prefetch_reads_pinned_tree(tmp_path, monkeypatch):
+    mirrors = tmp_path / "mirrors"
+    sha512s = sdl_mirror(mirrors, "release-2.30.0", "release-2.32.4")
+    registry = tmp_path / "registry"
+    publish(registry, "sdl2-core", SDL_PORTFILE % sha512s["release-2.30.0"], "2.30.0", ("default", "legacy"))
+    publish(registry, "sdl2-core", SDL_PORTFILE % sha512s["release-2.32.4"], "2.32.4")
+    # The working tree is ahead of every baseline
+    (registry / "ports" / "sdl2-core" / "vcpkg.json").write_text(json.dumps({"name": "sdl2-core", "version": "2.33.0"}))
+    (registry / "ports" / "sdl2-core" / "portfile.cmake").write_text(SDL_PORTFILE % ("1" * 128))
+    monkeypatch.chdir(str(registry))
+
+    for baseline, tag in (("default", "release-2.32.4"), ("legacy", "release-2.30.0")):
+        sources, _ = prefetch_sources.baseline_sources(load_index(), baseline)
+        assert [(source.ref, source.sha512) for source in sources] == [(tag, sha512s[tag])]
+        result = prefetch_sources.prefetch(sources[0], str(mirrors), str(tmp_path / "downloads"))
+        assert result.status == "fetched"
+
+
+def test_prefetch_reports_unresolved_pins(tmp_path, monkeypatch):
+    registry = tmp_path / "registry"
+    publish(registry, "sdl2-core", SDL_PORTFILE % ("1" * 128), "2.32.4")
+    path = registry / version_file_path("sdl2-core")
+    path.write_text(json.dumps({"versions": [{"version": "2.32.4", "git-tree": "2" * 40, "port-version": 0}]}))
+    monkeypatch.chdir(str(registry))
+
+    sources, problems = prefetch_sources.baseline_sources(load_index(), "default", ["sdl2-core", "zlib"])
+    assert sources == []
+    assert [(problem.port, problem.status) for problem in problems] == [("zlib", "error"), ("sdl2-core", "error")]
+    assert "not in the repository" in problems[1].message
+
+
+def test_prefetch_skips_unresolved_ref(tmp_path, monkeypatch):
+    registry = tmp_path / "registry"
+    publish(registry, "sdl2-core", SDL_PORTFILE.replace("VERSION", "SDL_TAG") % ("1" * 128), "2.32.4")
+    monkeypatch.chdir(str(registry))
+    sources, _ = prefetch_sources.baseline_sources(load_index(), "default")
+    result = prefetch_sources.prefetch(sources[0], str(tmp_path / "mirrors"), str(tmp_path / "downloads"))
+    assert result.status == "skipped"
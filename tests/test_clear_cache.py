@@ -0,0 +1,166 @@
+import json
+import os
+import time
+
+import pytest
+
+from conftest import load_script
+
+clear_cache = load_script("scripts/clear-cache.py")
+
+
+def make_tree(path) -> None:
+    os.makedirs(os.path.join(str(path), "src", "nested"))
+    for name in ("a", os.path.join("src", "b"), os.path.join("src", "nested", "c")):
+        with open(os.path.join(str(path), name), 'w') as f:
+            f.write(name)
+
+
+def trash_name(name: str, age: float) -> str:
+    return f"{name}.deleting-12345-{int(time.time() - age)}"
+
+
+def test_remove_directory_sweeps_stale_siblings(tmp_path):
+    make_tree(tmp_path / "buildtrees")
+    make_tree(tmp_path / trash_name("buildtrees", 3600))
+    make_tree(tmp_path / trash_name("downloads", 3600))
+    # Possibly still being deleted by its detached process
+    make_tree(tmp_path / trash_name("buildtrees", 10))
+    clear_cache.remove_directory(str(tmp_path / "buildtrees"))
+    assert sorted(os.listdir(str(tmp_path))) == sorted([trash_name("buildtrees", 10), trash_name("downloads", 3600)])
+
+
+def test_sweep_all_stale_trash(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("VCPKG_DEFAULT_BINARY_CACHE", str(tmp_path / "cache" / "archives"))
+    for variable in ("USERPROFILE", "LOCALAPPDATA", "APPDATA", "XDG_CACHE_HOME"):
+        monkeypatch.delenv(variable, raising=False)
+    root = tmp_path / "vcpkg"
+    stale = [root / trash_name("downloads", 3600),
+             root / "buildtrees" / trash_name("zlib", 3600),
+             root / "packages" / trash_name("zlib_x64-linux", 3600),
+             tmp_path / "cache" / trash_name("archives", 3600),
+             tmp_path / "home" / ".nuget" / trash_name("packages", 3600)]
+    for path in stale:
+        make_tree(path)
+    kept = tmp_path / "cache" / trash_name("other", 3600)
+    make_tree(kept)
+    clear_cache.sweep_all_stale_trash(str(root))
+    assert not any(os.path.exists(str(path)) for path in stale)
+    assert os.path.isdir(str(kept))
+
+
+def test_without_home_directory(tmp_path, monkeypatch, capsys):
+    for variable in ("HOME", "USERPROFILE", "LOCALAPPDATA", "APPDATA", "XDG_CACHE_HOME"):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setenv("VCPKG_DEFAULT_BINARY_CACHE", str(tmp_path / "archives"))
+    make_tree(tmp_path / "archives")
+    make_tree(tmp_path / trash_name("archives", 3600))
+    assert clear_cache.main(["--report", "--json", "--vcpkg-root", str(tmp_path / "vcpkg")]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["categories"]["nuget-packages"] == {"path": None, "exists": False, "size": 0, "files": 0}
+    assert report["categories"]["binary-cache"]["files"] == 3
+    # The NuGet packages are skipped, the binary cache is still cleaned
+    assert clear_cache.main(["--binary-cache"]) == 0
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_sweep_stale_trash(tmp_path, background):
+    make_tree(tmp_path / trash_name("buildtrees", 3600))
+    assert clear_cache.sweep_stale_trash(str(tmp_path), "buildtrees", None, background) == 1
+    deadline = time.monotonic() + 10
+    while os.listdir(str(tmp_path)) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def write_manifest(root, port: str, **fields) -> None:
+    os.makedirs(str(root / "ports" / port))
+    with open(str(root / "ports" / port / "vcpkg.json"), 'w') as f:
+        f.write(json.dumps(dict(name=port, **fields)))
+
+
+def test_ports_to_clean_with_dependents(tmp_path):
+    write_manifest(tmp_path, "bofstd", dependencies=["zlib"])
+    write_manifest(tmp_path, "bof2d", dependencies=["bofstd", {"name": "glfw3", "platform": "!wasm32"}])
+    # Feature dependencies count too
+    write_manifest(tmp_path, "bofwebrpc", features={"2d": {"dependencies": ["bof2d"]}})
+    assert clear_cache.get_ports_to_clean(str(tmp_path), ["bofstd"], False) == ["bofstd"]
+    assert clear_cache.get_ports_to_clean(str(tmp_path), ["bofstd"], True) == ["bof2d", "bofstd", "bofwebrpc"]
+    # A port of another registry reaches its dependents in this one
+    assert clear_cache.get_ports_to_clean(str(tmp_path), ["zlib"], True) == ["bof2d", "bofstd", "bofwebrpc", "zlib"]
+
+
+def make_archive(path, age_days: float, content: bytes = None) -> None:
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), 'wb') as f:
+        f.write(content if content is not None else os.urandom(100))
+    last_use = time.time() - age_days * 86400
+    os.utime(str(path), (last_use, last_use))
+
+
+def cache_files(root) -> list:
+    return sorted(os.path.relpath(os.path.join(directory, name), str(root))
+                  for directory, _, names in os.walk(str(root)) for name in names)
+
+
+def test_evict_least_recently_used(tmp_path):
+    for name, age in (("ab/old.zip", 30), ("cd/mid.zip", 20), ("ef/new.zip", 1)):
+        make_archive(tmp_path / name, age)
+    assert clear_cache.evict_binary_cache(str(tmp_path), 250, None, True) == 100
+    assert len(cache_files(tmp_path)) == 3
+    assert clear_cache.evict_binary_cache(str(tmp_path), 250) == 100
+    assert cache_files(tmp_path) == ["cd/mid.zip", "ef/new.zip"]
+    assert clear_cache.evict_binary_cache(str(tmp_path), None, 10) == 100
+    assert cache_files(tmp_path) == ["ef/new.zip"]
+
+
+def test_evict_counts_hard_links_once(tmp_path):
+    make_archive(tmp_path / "ab" / "old.zip", 30)
+    os.makedirs(str(tmp_path / "cd"))
+    os.link(str(tmp_path / "ab" / "old.zip"), str(tmp_path / "cd" / "linked.zip"))
+    make_archive(tmp_path / "ef" / "new.zip", 1)
+    # 200 bytes on disk: already under budget
+    assert clear_cache.evict_binary_cache(str(tmp_path), 200) == 0
+    assert len(cache_files(tmp_path)) == 3
+    # Removing a single link of the shared archive frees nothing, both go
+    assert clear_cache.evict_binary_cache(str(tmp_path), 150, None, True) == 100
+    assert clear_cache.evict_binary_cache(str(tmp_path), 150) == 100
+    assert cache_files(tmp_path) == ["ef/new.zip"]
+
+
+def test_dedupe_links_identical_archives(tmp_path, capsys):
+    content = os.urandom(100)
+    for name in ("ab/a.zip", "cd/b.zip", "ef/c.zip"):
+        make_archive(tmp_path / name, 1, content)
+    make_archive(tmp_path / "ab" / "same-size.zip", 1)
+    make_archive(tmp_path / "ab" / "other-size.zip", 1, b"x")
+    assert clear_cache.dedupe_binary_cache(str(tmp_path), None, True) == 200
+    assert os.stat(str(tmp_path / "ab" / "a.zip")).st_nlink == 1
+
+    assert clear_cache.dedupe_binary_cache(str(tmp_path)) == 200
+    inodes = {name: os.stat(str(tmp_path / name)).st_ino for name in cache_files(tmp_path)}
+    assert inodes["ab/a.zip"] == inodes["cd/b.zip"] == inodes["ef/c.zip"]
+    assert inodes["ab/same-size.zip"] != inodes["ab/a.zip"]
+    assert (tmp_path / "cd" / "b.zip").read_bytes() == content
+    with open(str(tmp_path / clear_cache.DEDUPE_INDEX_FILE_NAME), 'r') as f:
+        assert len(json.loads(f.read())) == 2
+    assert not any(name.startswith(".tmp") for name in os.listdir(str(tmp_path)))
+
+    # The next run hashes nothing, its files are indexed or linked
+    capsys.readouterr()
+    assert clear_cache.dedupe_binary_cache(str(tmp_path)) == 0
+    assert "0 file(s) hashed" in capsys.readouterr().out
+
+
+def test_dedupe_after_interrupted_run(tmp_path):
+    content = os.urandom(100)
+    make_archive(tmp_path / "ab" / "a.zip", 1, content)
+    make_archive(tmp_path / "cd" / "b.zip", 1, content)
+    # Left behind between os.link and os.replace
+    os.link(str(tmp_path / "ab" / "a.zip"), str(tmp_path / "cd" / "b.zip.dedupe-tmp"))
+    (tmp_path / clear_cache.DEDUPE_INDEX_FILE_NAME).write_text('{"truncated')
+    assert clear_cache.dedupe_binary_cache(str(tmp_path)) == 100
+    assert cache_files(tmp_path) == [clear_cache.DEDUPE_INDEX_FILE_NAME, "ab/a.zip", "cd/b.zip"]
+    assert os.stat(str(tmp_path / "ab" / "a.zip")).st_ino == os.stat(str(tmp_path / "cd" / "b.zip")).st_ino
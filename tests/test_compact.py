@@ -0,0 +1,53 @@
+import json
+import os
+
+from registry.compact import compact_entries, pinned_entries
+from registry.index import RegistryIndex, entry_version, version_file_path
+
+ENTRIES = [
+    {"version": "2.0.0", "git-tree": "a" * 40, "port-version": 1},
+    {"version": "2.0.0", "git-tree": "b" * 40, "port-version": 0},
+    {"version": "1.5.0", "git-tree": "c" * 40, "port-version": 0},
+    {"version": "1.0.0", "git-tree": "d" * 40, "port-version": 0},
+    {"version-string": "vista", "git-tree": "e" * 40, "port-version": 1},
+    {"version-string": "vista", "git-tree": "f" * 40, "port-version": 0},
+    {"version-date": "2023-04-01", "git-tree": "0" * 40},
+]
+
+
+def versions(entries: list) -> list:
+    return [(entry_version(entry), entry.get("port-version", 0)) for entry in entries]
+
+
+def test_drop_superseded():
+    kept, dropped = compact_entries(ENTRIES, set())
+    assert versions(dropped) == [("2.0.0", 0), ("vista", 0)]
+    assert len(kept) == len(ENTRIES) - 2
+
+
+def test_keep_most_recent_versions():
+    kept, dropped = compact_entries(ENTRIES, {("1.0.0", 0)}, keep=1)
+    # Pinned entries and versions that cannot be ordered are kept
+    assert versions(kept) == [("2.0.0", 1), ("1.0.0", 0), ("vista", 1), ("2023-04-01", 0)]
+    assert versions(dropped) == [("2.0.0", 0), ("1.5.0", 0), ("vista", 0)]
+    kept, _ = compact_entries(ENTRIES, set(), keep=2, superseded=False)
+    assert ("2.0.0", 0) in versions(kept) and ("1.0.0", 0) not in versions(kept)
+    assert ("vista", 0) in versions(kept)
+
+
+def test_pinned_entries():
+    baselines = {"default": {"zlib": {"baseline": "1.0.0", "port-version": 2}}, "old": {"zlib": {"baseline": "0.9"}}}
+    assert pinned_entries(baselines, "zlib") == {("1.0.0", 2), ("0.9", 0)}
+    assert pinned_entries(baselines, "png") == set()
+
+
+def test_add_version_keeps_newest_first(tmp_path):
+    path = tmp_path / version_file_path("zlib")
+    os.makedirs(str(path.parent))
+    path.write_text(json.dumps({"versions": [entry for entry in ENTRIES if entry.get("port-version") != 1]}))
+    index = RegistryIndex(str(tmp_path))
+    assert index.add_version("zlib", "1.2.0", "1" * 40) == 0
+    assert index.add_version("zlib", "2.0.0", "2" * 40) == 1
+    assert index.add_version("zlib", "3.0.0", "3" * 40) == 0
+    assert versions(index.versions["zlib"]) == [("3.0.0", 0), ("2.0.0", 1), ("2.0.0", 0), ("1.5.0", 0),
+                                                ("1.2.0", 0), ("1.0.0", 0), ("vista", 0), ("2023-04-01", 0)]
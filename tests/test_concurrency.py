@@ -0,0 +1,95 @@
+import glob
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from conftest import git, load_script
+from registry.index import RegistryIndex, version_file_path
+
+PROCESSES = 6
+ROUNDS = 4
+
+
+def make_registry(root, ports: list) -> None:
+    # Each port has a 1.0.0 entry pinned by the 'default' baseline
+    baseline = {}
+    for port in ports:
+        os.makedirs(str(root / "ports" / port))
+        (root / "ports" / port / "vcpkg.json").write_text(json.dumps({"name": port, "version": "1.0.0"}))
+        (root / "ports" / port / "portfile.cmake").write_text(
+            "vcpkg_from_github(\n  REPO owner/%s\n  REF 0000\n  SHA512 0\n)\n" % port)
+        path = root / version_file_path(port)
+        os.makedirs(str(path.parent), exist_ok=True)
+        path.write_text(json.dumps({"versions": [{"version": "1.0.0", "git-tree": "0" * 40, "port-version": 0}]}))
+        baseline[port] = {"baseline": "1.0.0", "port-version": 0}
+    (root / "versions" / "baseline.json").write_text(json.dumps({"default": baseline}))
+    (root / ".gitignore").write_text(".registry.lock\n.registry-index.json\n")
+    git(str(root), "init", "-q", "-b", "main")
+    git(str(root), "add", "-A")
+    git(str(root), "commit", "-q", "-m", "registry")
+
+
+def update_ports_worker(root: str, port: str, barrier) -> None:
+    os.chdir(root)
+    update_port = load_script("update-port.py")
+    barrier.wait()
+    for i in range(ROUNDS):
+        update_port.update_ports([update_port.PortUpdate(port, f"1.{i + 1}.0", f"{i + 1:040x}")])
+
+
+def save_worker(root: str, port: str, barrier) -> None:
+    # The registry is loaded before the other writers save theirs: save()
+    # merges the baseline pins they wrote meanwhile
+    barrier.wait()
+    for i in range(ROUNDS):
+        index = RegistryIndex.load(root)
+        index.add_version(port, f"1.{i + 1}.0", f"{i + 1:040x}")
+        index.baselines["default"][port] = {"baseline": f"1.{i + 1}.0", "port-version": 0}
+        index.save()
+
+
+def check_registry(root, ports: list) -> None:
+    # No temporary file left, every JSON file parses
+    leftovers = [path for path in glob.glob(str(root / "**" / "*"), recursive=True)
+                 if os.path.basename(path).startswith(".tmp")]
+    assert leftovers == []
+    for path in glob.glob(str(root / "versions" / "**" / "*.json"), recursive=True):
+        with open(path, 'r') as f:
+            json.loads(f.read())
+
+    index = RegistryIndex.load(str(root))
+    expected = [f"1.{i}.0" for i in range(ROUNDS, -1, -1)]
+    for port in ports:
+        assert [entry["version"] for entry in index.versions[port]] == expected
+        assert index.baselines["default"][port] == {"baseline": f"1.{ROUNDS}.0", "port-version": 0}
+
+
+def run_workers(worker, root, ports: list) -> None:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(len(ports))
+    processes = [context.Process(target=worker, args=(str(root), port, barrier)) for port in ports]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+    assert [process.exitcode for process in processes] == [0] * len(ports)
+
+
+@pytest.mark.parametrize("worker", [update_ports_worker, save_worker])
+def test_concurrent_writers_lose_nothing(tmp_path, worker):
+    ports = [f"port{i}" for i in range(PROCESSES)]
+    root = tmp_path / "registry"
+    make_registry(root, ports)
+    run_workers(worker, root, ports)
+    check_registry(root, ports)
+
+
+def test_update_ports_commits_every_update(tmp_path):
+    ports = [f"port{i}" for i in range(PROCESSES)]
+    root = tmp_path / "registry"
+    make_registry(root, ports)
+    run_workers(update_ports_worker, root, ports)
+    assert int(git(str(root), "rev-list", "--count", "HEAD")) == 1 + PROCESSES * ROUNDS
+    assert git(str(root), "status", "--porcelain") == ""
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from conftest import git
+from registry.fingerprint import FINGERPRINT_CACHE_PATH, changed_ports, port_fingerprints
+
+# a -> b -> c, d alone
+DEPENDENCIES = {"a": ["b"], "b": [{"name": "c", "host": True}], "c": [], "d": ["vcpkg-cmake"]}
+
+
+def write_port(root, port: str, dependencies: list, portfile: str = "# portfile\n") -> None:
+    os.makedirs(str(root / "ports" / port), exist_ok=True)
+    manifest = {"name": port, "version": "1.0.0", "dependencies": dependencies}
+    (root / "ports" / port / "vcpkg.json").write_text(json.dumps(manifest))
+    (root / "ports" / port / "portfile.cmake").write_text(portfile)
+
+
+@pytest.fixture
+def registry(git_repo):
+    for port, dependencies in DEPENDENCIES.items():
+        write_port(git_repo, port, dependencies)
+    (git_repo / ".gitignore").write_text("*.log\n/.port-fingerprints.json\n")
+    git(str(git_repo), "add", "-A")
+    git(str(git_repo), "commit", "-q", "-m", "registry")
+    return git_repo
+
+
+def test_worktree_matches_commit(registry):
+    assert port_fingerprints(root=str(registry)) == port_fingerprints("HEAD", str(registry))
+    assert os.path.isfile(str(registry / FINGERPRINT_CACHE_PATH))
+
+
+def test_dependency_change_reaches_dependents(registry):
+    before = port_fingerprints("HEAD", str(registry))
+    write_port(registry, "c", [], "# patched\n")
+    changed, removed = changed_ports(before, port_fingerprints(root=str(registry)))
+    # In dependency order, the unrelated port left out
+    assert changed == ["c", "b", "a"]
+    assert removed == []
+
+    git(str(registry), "commit", "-q", "-am", "patch c")
+    changed, _ = changed_ports(port_fingerprints("HEAD~1", str(registry)), port_fingerprints("HEAD", str(registry)))
+    assert changed == ["c", "b", "a"]
+
+
+def test_leaf_change_stays_local(registry):
+    before = port_fingerprints("HEAD", str(registry))
+    write_port(registry, "a", ["b"], "# patched\n")
+    assert changed_ports(before, port_fingerprints(root=str(registry))) == (["a"], [])
+
+
+def test_new_dependency_changes_fingerprint(registry):
+    before = port_fingerprints("HEAD", str(registry))
+    write_port(registry, "d", ["vcpkg-cmake", "c"])
+    after = port_fingerprints(root=str(registry))
+    assert changed_ports(before, after) == (["d"], [])
+    # d now follows c
+    write_port(registry, "c", [], "# patched\n")
+    changed, _ = changed_ports(after, port_fingerprints(root=str(registry)))
+    assert sorted(changed) == ["a", "b", "c", "d"]
+
+
+def test_ignored_files_do_not_change_fingerprint(registry):
+    before = port_fingerprints("HEAD", str(registry))
+    (registry / "ports" / "c" / "build.log").write_text("noise\n")
+    assert changed_ports(before, port_fingerprints(root=str(registry))) == ([], [])
+    # An untracked file that is not ignored would be committed: it counts
+    (registry / "ports" / "c" / "fix.patch").write_text("patch\n")
+    assert changed_ports(before, port_fingerprints(root=str(registry)))[0] == ["c", "b", "a"]
+
+
+def test_removed_port(registry):
+    before = port_fingerprints("HEAD", str(registry))
+    git(str(registry), "rm", "-q", "-r", "ports/d")
+    assert changed_ports(before, port_fingerprints(root=str(registry))) == ([], ["d"])
+
+
+def test_cache_does_not_change_result(registry):
+    uncached = port_fingerprints("HEAD", str(registry), use_cache=False)
+    assert port_fingerprints("HEAD", str(registry)) == uncached
+    # Second run, served from the cache
+    assert port_fingerprints("HEAD", str(registry)) == uncached
+    assert port_fingerprints(root=str(registry)) == uncached
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+from conftest import git
+from registry.gittree import EMPTY_TREE, hash_tree
+
+
+def write(path, content: bytes = b"content\n", mode: int = None) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if mode is not None:
+        os.chmod(path, mode)
+
+
+def committed_tree(root, relative: str) -> str:
+    # Tree id git itself gives 'relative' once everything is staged
+    git(str(root), "add", "-A")
+    return git(str(root), "rev-parse", f"{git(str(root), 'write-tree')}:{relative}")
+
+
+def test_plain_files(git_repo):
+    port = git_repo / "ports" / "zlib"
+    write(str(port / "vcpkg.json"), b'{"name": "zlib"}\n')
+    write(str(port / "portfile.cmake"), b"vcpkg_from_github()\n")
+    assert hash_tree(str(port)) == committed_tree(git_repo, "ports/zlib")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no executable bit")
+def test_executable_bit(git_repo):
+    port = git_repo / "ports" / "tool"
+    write(str(port / "vcpkg.json"))
+    write(str(port / "build.sh"), b"#!/bin/sh\n", 0o755)
+    assert hash_tree(str(port)) == committed_tree(git_repo, "ports/tool")
+
+
+def test_nested_directories(git_repo):
+    port = git_repo / "ports" / "nested"
+    write(str(port / "vcpkg.json"))
+    write(str(port / "patches" / "0001-fix.patch"))
+    write(str(port / "patches" / "more" / "0002-fix.patch"))
+    # 'a.b' sorts before 'a/' in a tree, 'a' as a directory after it
+    write(str(port / "a" / "file"))
+    write(str(port / "a.b"))
+    os.makedirs(str(port / "empty"))
+    assert hash_tree(str(port)) == committed_tree(git_repo, "ports/nested")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="symlinks need privileges")
+def test_symlinks(git_repo):
+    port = git_repo / "ports" / "links"
+    write(str(port / "vcpkg.json"))
+    write(str(port / "patches" / "fix.patch"))
+    os.symlink("vcpkg.json", str(port / "manifest-link"))
+    os.symlink("patches", str(port / "patches-link"))
+    assert hash_tree(str(port)) == committed_tree(git_repo, "ports/links")
+
+
+def test_ignored_files(git_repo):
+    write(str(git_repo / ".gitignore"), b"*.pyc\nbuild/\n")
+    port = git_repo / "ports" / "bofstd"
+    write(str(port / "vcpkg.json"))
+    write(str(port / "untracked.cmake"))
+    write(str(port / "junk.pyc"))
+    write(str(port / "build" / "output.log"))
+    write(str(port / ".gitignore"), b"local.txt\n")
+    write(str(port / "local.txt"))
+    assert hash_tree(str(port)) == committed_tree(git_repo, "ports/bofstd")
+
+
+def test_tracked_ignored_file(git_repo):
+    # A file added before it was ignored is still committed
+    port = git_repo / "ports" / "forced"
+    write(str(port / "vcpkg.json"))
+    write(str(port / "kept.pyc"))
+    git(str(git_repo), "add", "-A")
+    write(str(git_repo / ".gitignore"), b"*.pyc\n")
+    assert hash_tree(str(port)) == committed_tree(git_repo, "ports/forced")
+
+
+def test_overrides(git_repo):
+    port = git_repo / "ports" / "zlib"
+    write(str(port / "vcpkg.json"), b"old\n")
+    expected = hash_tree(str(port), {"vcpkg.json": b"new\n", "usage": b"usage\n"})
+    write(str(port / "vcpkg.json"), b"new\n")
+    write(str(port / "usage"), b"usage\n")
+    assert expected == committed_tree(git_repo, "ports/zlib")
+
+
+def test_outside_work_tree(tmp_path):
+    # Every file counts when there is no repository to ask
+    directory = tmp_path / "plain"
+    write(str(directory / "file"), b"x")
+    assert hash_tree(str(directory)) != EMPTY_TREE
+    os.remove(str(directory / "file"))
+    assert hash_tree(str(directory)) == EMPTY_TREE
@@ -0,0 +1,63 @@
+import json
+import os
+
+from conftest import REPO_ROOT
+from registry.plan import PLAN_CACHE_PATH, install_plan, install_plans, load_manifests
+from registry.platform import native_triplet, triplet_identifiers
+
+MANIFESTS = {
+    "app": {"name": "app", "dependencies": ["lib", {"name": "tool", "host": True}]},
+    "lib": {"name": "lib", "dependencies": ["helper"]},
+    "tool": {"name": "tool", "dependencies": ["helper", {"name": "winapi", "platform": "windows"}]},
+    "helper": {"name": "helper"},
+    "winapi": {"name": "winapi", "supports": "windows"},
+}
+
+
+def ports(steps: list) -> list:
+    return [step["port"] for step in steps]
+
+
+def test_host_dependencies_use_host_triplet():
+    plan = install_plan(MANIFESTS, "wasm32-emscripten", ["app"], "x64-windows")
+    assert ports(plan["plan"]) == ["helper", "lib", "app"]
+    # tool, and what it depends on, is built for the host
+    assert plan["host-triplet"] == "x64-windows"
+    assert ports(plan["host"]) == ["helper", "winapi", "tool"]
+    assert plan["unsupported"] == []
+
+    plan = install_plan(MANIFESTS, "x64-windows", ["app"], "x64-linux")
+    assert ports(plan["plan"]) == ["helper", "lib", "app"]
+    assert ports(plan["host"]) == ["helper", "tool"]
+
+
+def test_unsupported_host_port():
+    manifests = dict(MANIFESTS, tool={"name": "tool", "supports": "!linux"})
+    plan = install_plan(manifests, "x64-windows", ["app"], "x64-linux")
+    assert plan["unsupported"] == ["tool:x64-linux: supports '!linux'"]
+
+
+def test_registry_host_dependencies():
+    manifests, _ = load_manifests(REPO_ROOT)
+    plan = install_plan(manifests, "wasm32-emscripten", ["linenoise-ng", "sdl2-core"], "x64-linux")
+    assert "vcpkg-cmake" not in ports(plan["plan"])
+    assert {"vcpkg-cmake", "vcpkg-cmake-config"} <= set(ports(plan["host"]))
+    assert all(not step["registry"] for step in plan["host"])
+
+
+def test_native_triplet():
+    identifiers = triplet_identifiers(native_triplet())
+    assert identifiers & {"x64", "x86", "arm", "arm64"}
+    assert identifiers & {"linux", "windows", "osx", "freebsd", "openbsd"}
+
+
+def test_plans_cached_per_host_triplet(tmp_path):
+    for port, manifest in MANIFESTS.items():
+        os.makedirs(str(tmp_path / "ports" / port))
+        (tmp_path / "ports" / port / "vcpkg.json").write_text(json.dumps(manifest))
+    linux = install_plans(["x64-linux"], ["app"], str(tmp_path), max_workers=1, host_triplet="x64-linux")
+    windows = install_plans(["x64-linux"], ["app"], str(tmp_path), max_workers=1, host_triplet="x64-windows")
+    assert ports(linux["x64-linux"]["host"]) == ["helper", "tool"]
+    assert ports(windows["x64-linux"]["host"]) == ["helper", "winapi", "tool"]
+    with open(str(tmp_path / PLAN_CACHE_PATH), 'r') as f:
+        assert len(json.loads(f.read())["plans"]) == 2
@@ -0,0 +1,48 @@
+import json
+import os
+
+from registry.index import version_file_path
+from registry.query import QUERY_INDEX_PATH, QueryIndex
+
+VERSIONS = [
+    {"version": "2.0.0", "git-tree": "a" * 40, "port-version": 1},
+    {"version": "2.0.0", "git-tree": "b" * 40, "port-version": 0},
+    {"version": "1.5.0", "git-tree": "c" * 40},
+    {"version": "1.0.0", "git-tree": "d" * 40, "port-version": 0},
+    {"version-string": "vista", "git-tree": "e" * 40, "port-version": 0},
+]
+
+
+def write_registry(root, versions: list) -> None:
+    path = root / version_file_path("zlib")
+    os.makedirs(str(path.parent), exist_ok=True)
+    path.write_text(json.dumps({"versions": versions}))
+    (root / "versions" / "baseline.json").write_text(
+        json.dumps({"default": {"zlib": {"baseline": "2.0.0", "port-version": 0}}}))
+
+
+def test_versions_range(tmp_path):
+    write_registry(tmp_path, VERSIONS)
+    index = QueryIndex.load(str(tmp_path))
+    assert [entry[:2] for entry in index.versions("zlib")] == [["vista", 0], ["1.0.0", 0], ["1.5.0", 0],
+                                                               ["2.0.0", 0], ["2.0.0", 1]]
+    assert [entry[:2] for entry in index.versions("zlib", "1.2", "2.0.0")] == [["1.5.0", 0], ["2.0.0", 0],
+                                                                                ["2.0.0", 1]]
+    assert index.find("zlib", "2.0.0") == ["2.0.0", 1, "a" * 40]
+    assert index.baseline("zlib") == ["2.0.0", 0, "b" * 40]
+    assert index.versions("png") == []
+
+
+def test_refresh_after_update(tmp_path):
+    write_registry(tmp_path, VERSIONS)
+    index = QueryIndex.load(str(tmp_path))
+    assert index.latest("zlib")[0] == "2.0.0"
+    assert index.find("zlib", "3.0.0") is None
+    assert index.save()
+    assert os.path.isfile(str(tmp_path / QUERY_INDEX_PATH))
+
+    write_registry(tmp_path, [{"version": "3.0.0", "git-tree": "f" * 40}] + VERSIONS)
+    os.utime(str(tmp_path / version_file_path("zlib")), ns=(0, 1))
+    assert index.refresh() == ["zlib"]
+    assert index.find("zlib", "3.0.0") == ["3.0.0", 0, "f" * 40]
+    assert QueryIndex.load(str(tmp_path)).latest("zlib")[0] == "3.0.0"
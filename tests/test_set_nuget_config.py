@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from conftest import REPO_ROOT, load_script
+
+set_nuget_config = load_script("scripts/set-nuget-config.py")
+
+DATA_DIR = os.path.join(REPO_ROOT, "tests", "data")
+NAME = "my artifactory"
+URL = "https://artifactory.example.com/api/nuget/vcpkg"
+USER = "builder"
+API_KEY = "secret"
+
+
+def canonical(path: str):
+    # Elements and attributes, whitespace and comments left out
+    def convert(element):
+        return (element.tag, sorted(element.attrib.items()), [convert(child) for child in element])
+    return convert(ElementTree.parse(path).getroot())
+
+
+def read(path: str) -> str:
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def test_matches_nuget_sources_add(tmp_path):
+    # 'nuget sources add -StorePasswordInClearText' on the NuGet default
+    # configuration writes NuGet.Config.sources-add
+    path = str(tmp_path / "NuGet.Config")
+    shutil.copy(os.path.join(DATA_DIR, "NuGet.Config.default"), path)
+    config_file = set_nuget_config.NuGetConfigFile(path, False)
+    assert config_file.set_source(NAME, URL, USER, API_KEY, True)
+    assert config_file.save()
+    assert canonical(path) == canonical(os.path.join(DATA_DIR, "NuGet.Config.sources-add"))
+
+
+def nuget_command():
+    # A real nuget.exe, given through NUGET_EXE, or a nuget on the PATH
+    nuget = os.environ.get("NUGET_EXE") or shutil.which("nuget")
+    if not nuget:
+        return None
+    if nuget.lower().endswith(".exe") and sys.platform != "win32":
+        return [shutil.which("mono"), nuget] if shutil.which("mono") else None
+    return [nuget]
+
+
+@pytest.mark.skipif(nuget_command() is None, reason="nuget is not available")
+def test_matches_nuget_cli(tmp_path, monkeypatch):
+    for home in ("cli", "file"):
+        os.makedirs(str(tmp_path / home))
+    monkeypatch.delenv("APPDATA", raising=False)
+    monkeypatch.setenv("HOME", str(tmp_path / "cli"))
+    cli_config = str(tmp_path / "cli" / ".config" / "NuGet" / "NuGet.Config")
+    os.makedirs(os.path.dirname(cli_config))
+    shutil.copy(os.path.join(DATA_DIR, "NuGet.Config.default"), cli_config)
+    subprocess.run(nuget_command() + ["sources", "add", "-Name", NAME, "-Source", URL, "-username", USER,
+                                      "-password", API_KEY, "-StorePasswordInClearText"], check=True)
+
+    path = str(tmp_path / "file" / "NuGet.Config")
+    shutil.copy(os.path.join(DATA_DIR, "NuGet.Config.default"), path)
+    config_file = set_nuget_config.NuGetConfigFile(path, False)
+    config_file.set_source(NAME, URL, USER, API_KEY, True)
+    config_file.save()
+    assert canonical(path) == canonical(cli_config)
+
+
+def test_comments_are_kept(tmp_path):
+    path = str(tmp_path / "NuGet.Config")
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                '<!-- managed by IT -->\n'
+                '<configuration>\n'
+                '  <!-- corporate proxy, do not remove -->\n'
+                '  <config>\n'
+                '    <add key="http_proxy" value="http://proxy:8080" />\n'
+                '  </config>\n'
+                '</configuration>\n'
+                '<!-- end -->\n')
+    config_file = set_nuget_config.NuGetConfigFile(path, False)
+    config_file.set_source(NAME, URL, USER, API_KEY, True)
+    config_file.save()
+    content = read(path)
+    for comment in ("<!-- managed by IT -->", "<!-- corporate proxy, do not remove -->", "<!-- end -->"):
+        assert comment in content
+    assert content.index("managed by IT") < content.index("<configuration>") < content.index("corporate proxy")
+    assert content.index("</configuration>") < content.index("end -->")
+
+
+def test_second_run_does_not_write(tmp_path):
+    path = str(tmp_path / "NuGet.Config")
+    for written in (True, False):
+        config_file = set_nuget_config.NuGetConfigFile(path, False)
+        config_file.set_source(NAME, URL, USER, API_KEY, True)
+        config_file.set_api_key(URL, USER, API_KEY)
+        assert config_file.save() == written
+
+
+@pytest.mark.skipif(sys.platform != "win32", reason="DPAPI is Windows only")
+def test_encrypted_values_are_not_rewritten(tmp_path):
+    path = str(tmp_path / "NuGet.Config")
+    for written in (True, False):
+        config_file = set_nuget_config.NuGetConfigFile(path, False)
+        assert config_file.set_source(NAME, URL, USER, API_KEY, False)
+        assert config_file.set_api_key(URL, USER, API_KEY)
+        assert config_file.save() == written
+    config_file = set_nuget_config.NuGetConfigFile(path, False)
+    config_file.set_api_key(URL, USER, "rotated")
+    assert config_file.save()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="DPAPI is available")
+def test_without_dpapi(tmp_path):
+    # The encrypted values are left to nuget.exe, without empty sections
+    path = str(tmp_path / "NuGet.Config")
+    config_file = set_nuget_config.NuGetConfigFile(path, False)
+    assert not config_file.set_source(NAME, URL, USER, API_KEY, False)
+    assert not config_file.set_api_key(URL, USER, API_KEY)
+    assert not config_file.save()
+    assert not os.path.exists(path)
+
+
+def write_executable(path: str, content: str) -> None:
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+
+
+@pytest.fixture
+def stub_tools(tmp_path, monkeypatch):
+    # A vcpkg whose 'fetch nuget' prints a stub nuget, which logs its
+    # arguments instead of touching any configuration
+    vcpkg_root = tmp_path / "vcpkg"
+    vcpkg_root.mkdir()
+    log = tmp_path / "nuget.log"
+    nuget = tmp_path / "nuget"
+    write_executable(str(nuget), f'#!/bin/sh\necho "$@" >> "{log}"\n')
+    write_executable(str(vcpkg_root / "vcpkg"), f'#!/bin/sh\necho "{nuget}"\n')
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    for variable in ("APPDATA", "LOCALAPPDATA"):
+        monkeypatch.delenv(variable, raising=False)
+    # Run the stub directly, even where mono is installed
+    which = shutil.which
+    monkeypatch.setattr(shutil, "which", lambda name, **kwargs: None if name == "mono" else which(name, **kwargs))
+    return vcpkg_root, log
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="shell script stubs")
+def test_binary_sources(tmp_path, stub_tools, monkeypatch):
+    vcpkg_root, log = stub_tools
+    monkeypatch.setenv("ARTIFACTORY_API_KEY", API_KEY)
+    config = tmp_path / "binary-sources.json"
+    config.write_text(json.dumps({
+        "local": {"path": str(tmp_path / "local;cache"), "mode": "readwrite"},
+        "nuget": [{"name": "mirror", "url": "https://mirror.example.com/nuget", "user": USER,
+                   "api_key_env": "ARTIFACTORY_API_KEY", "mode": "read"},
+                  {"name": NAME, "url": URL, "user": USER, "api_key_env": "ARTIFACTORY_API_KEY",
+                   "priority": 10}]}))
+    env_file = tmp_path / "build.env"
+    env_file.write_text("CC=clang\nVCPKG_BINARY_SOURCES=stale\nexport VCPKG_BINARY_SOURCES=older\n")
+    argv = ["--binary-sources-config", str(config), "--vcpkg-root", str(vcpkg_root), "--password-in-clear",
+            "--env-file", str(env_file)]
+
+    assert set_nuget_config.main(argv) == 0
+    assert set_nuget_config.main(argv) == 0
+
+    local = str(tmp_path / "local;cache")
+    assert os.path.isdir(local)
+    expected = (f"VCPKG_BINARY_SOURCES=clear;files,{local.replace(';', '`;')},readwrite;"
+                f"nuget,{URL},readwrite;nuget,https://mirror.example.com/nuget,read")
+    assert env_file.read_text() == f"CC=clang\n{expected}\n"
+
+    # The sources are written to NuGet.Config, the API keys, which cannot
+    # be encrypted here, are left to nuget
+    config_path = str(tmp_path / "home" / ".config" / "NuGet" / "NuGet.Config")
+    sources = ElementTree.parse(config_path).getroot().find("packageSources")
+    assert [(item.get("key"), item.get("value")) for item in sources] == [
+        (NAME, URL), ("mirror", "https://mirror.example.com/nuget")]
+    calls = log.read_text().splitlines()
+    assert calls == [f"setapikey {USER}:{API_KEY} -source {NAME}", f"setapikey {USER}:{API_KEY} -source mirror"] * 2
+
+
+def test_env_file_keeps_export(tmp_path):
+    env_file = tmp_path / "vcpkg.env"
+    env_file.write_text("export VCPKG_BINARY_SOURCES=old\n")
+    set_nuget_config.set_env_file_variable(str(env_file), "VCPKG_BINARY_SOURCES", "clear")
+    assert env_file.read_text() == "export VCPKG_BINARY_SOURCES=clear\n"
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import REPO_ROOT, git, load_script
+from registry.deps import DependencyGraph
+from registry.index import RegistryIndex, version_file_path
+
+update_port = load_script("update-port.py")
+PortUpdate = update_port.PortUpdate
+InvalidManifest = update_port.InvalidManifest
+
+COMMIT = "1" * 40
+
+
+@pytest.fixture
+def registry(git_repo, monkeypatch):
+    # A copy of the ports and versions of this registry
+    for name in ("ports", "versions"):
+        shutil.copytree(os.path.join(REPO_ROOT, name), str(git_repo / name))
+    (git_repo / ".gitignore").write_text(".registry.lock\n.registry-index.json\n")
+    git(str(git_repo), "add", "-A")
+    git(str(git_repo), "commit", "-q", "-m", "registry")
+    monkeypatch.chdir(str(git_repo))
+    return git_repo
+
+
+def test_parse_batch_entry():
+    assert update_port.parse_batch_entry(f"zlib:1.3:{COMMIT}") == PortUpdate("zlib", "1.3", COMMIT, "default")
+    assert update_port.parse_batch_entry(f"zlib:1.3:{COMMIT}:lts") == PortUpdate("zlib", "1.3", COMMIT, "lts")
+    for entry in ("zlib:1.3", f"zlib:1.3:{COMMIT}:lts:extra", f"zlib::{COMMIT}"):
+        with pytest.raises(InvalidManifest):
+            update_port.parse_batch_entry(entry)
+
+
+def test_parse_manifest():
+    expected = [PortUpdate("zlib", "1.3", COMMIT, "default"), PortUpdate("png", "1.6", COMMIT, "lts")]
+    assert update_port.parse_manifest(f"# ports\nzlib 1.3 {COMMIT}\n\npng 1.6 {COMMIT} lts\n") == expected
+    assert update_port.parse_manifest(json.dumps([
+        {"port": "zlib", "version": "1.3", "commit": COMMIT},
+        ["png", "1.6", COMMIT, "lts"]])) == expected
+    assert update_port.parse_manifest(json.dumps({"ports": [["zlib", "1.3", COMMIT]]})) == expected[:1]
+    for content in (f"zlib 1.3\npng 1.6 {COMMIT}", "[{", json.dumps([{"port": "zlib"}]),
+                    json.dumps([["zlib", "1.3", COMMIT, "lts", "extra"]])):
+        with pytest.raises(InvalidManifest):
+            update_port.parse_manifest(content)
+
+
+def test_update_ports_single_commit(registry):
+    update_port.update_ports([PortUpdate("bofstd", "6.2.0", COMMIT), PortUpdate("sdl2-core", "2.32.6", "2" * 40)])
+
+    assert git(str(registry), "log", "--format=%s").splitlines()[0] == "Update bofstd, sdl2-core"
+    assert git(str(registry), "status", "--porcelain") == ""
+    index = RegistryIndex.load()
+    for port, version in (("bofstd", "6.2.0"), ("sdl2-core", "2.32.6")):
+        assert index.manifests[port]["version"] == version
+        assert index.baselines["default"][port] == {"baseline": version, "port-version": 0}
+        # The git-tree recorded is the one committed
+        assert index.versions[port][0] == {"version": version, "port-version": 0,
+                                           "git-tree": git(str(registry), "rev-parse", f"HEAD:ports/{port}")}
+    assert f"REF {COMMIT}" in (registry / "ports" / "bofstd" / "portfile.cmake").read_text()
+
+
+def test_update_ports_rejects_duplicates(registry):
+    with pytest.raises(InvalidManifest):
+        update_port.update_ports([PortUpdate("bofstd", "6.2.0", COMMIT), PortUpdate("bofstd", "6.3.0", COMMIT)])
+    with pytest.raises(update_port.PortNotFound):
+        update_port.update_ports([PortUpdate("bofstd", "6.2.0", COMMIT), PortUpdate("zlib", "1.3", COMMIT)])
+    assert git(str(registry), "status", "--porcelain") == ""
+    assert len(git(str(registry), "log", "--format=%s").splitlines()) == 1
+
+
+def test_update_ports_rolls_back_failed_commit(registry):
+    hook = registry / ".git" / "hooks" / "pre-commit"
+    hook.write_text("#!/bin/sh\nexit 1\n")
+    hook.chmod(0o755)
+    with pytest.raises(subprocess.CalledProcessError):
+        update_port.update_ports([PortUpdate("bofstd", "6.2.0", COMMIT), PortUpdate("lvgl", "2.1.0", COMMIT)])
+    # Neither written nor staged, the CRLF portfile of bofstd included
+    assert git(str(registry), "status", "--porcelain") == ""
+    hook.unlink()
+    update_port.update_ports([PortUpdate("bofstd", "6.2.0", COMMIT)])
+    # No port-version left over from the failed attempt
+    assert RegistryIndex.load().versions["bofstd"][0]["port-version"] == 0
+
+
+def test_cascade_order(registry):
+    index = RegistryIndex.load()
+    bumps = update_port.cascade_updates([PortUpdate("bofstd", "6.2.0", COMMIT, "default")], index,
+                                        DependencyGraph(index.manifests))
+    assert [bump.port for bump in bumps] == ["bof2d", "bofdearimgui", "bofwebrpc", "lvgl"]
+    assert all(bump.commit_id is None and bump.baseline == "default" for bump in bumps)
+    # Every bump comes after its updated dependencies
+    bumps = update_port.cascade_updates([PortUpdate("sdl2-core", "2.32.6", COMMIT)], index,
+                                        DependencyGraph(index.manifests))
+    assert [bump.port for bump in bumps] == ["bofdearimgui"]
+
+
+def test_update_ports_cascade(registry):
+    before = RegistryIndex.load()
+    update_port.update_ports([PortUpdate("bofstd", "6.2.0", COMMIT)], cascade=True)
+
+    index = RegistryIndex.load()
+    subject = git(str(registry), "log", "--format=%s").splitlines()[0]
+    assert subject == "Update bofstd, bof2d, bofdearimgui, bofwebrpc, lvgl"
+    for port in ("bof2d", "bofdearimgui", "bofwebrpc", "lvgl"):
+        version = before.manifests[port]["version"]
+        port_version = before.manifests[port].get("port-version", 0) + 1
+        assert index.manifests[port]["version"] == version
+        assert index.manifests[port]["port-version"] == port_version
+        assert index.baselines["default"][port] == {"baseline": version, "port-version": port_version}
+        assert os.path.isfile(version_file_path(port))
+    assert index.manifests["sdl2-core"] == before.manifests["sdl2-core"]
+    assert git(str(registry), "status", "--porcelain") == ""
@@ -0,0 +1,204 @@
+import json
+import os
+
+import pytest
+
+from conftest import git, load_script
+from registry.index import RegistryIndex, version_file_path
+from registry.watch import InotifyWatcher, PollingWatcher, mirror_tags
+
+update_port = load_script("update-port.py")
+
+
+def make_upstream(path) -> None:
+    os.makedirs(str(path))
+    git(str(path), "init", "-q", "-b", "main")
+    (path / "README").write_text("upstream\n")
+    git(str(path), "add", "-A")
+    git(str(path), "commit", "-q", "-m", "initial")
+    git(str(path), "tag", "v1.0.0")
+
+
+def push_tag(upstream, tag: str) -> str:
+    # A new commit tagged 'tag', pushed to the mirror
+    (upstream / "README").write_text(f"{tag}\n")
+    git(str(upstream), "commit", "-q", "-am", tag)
+    git(str(upstream), "tag", tag)
+    git(str(upstream), "push", "-q", "mirror", "main", tag)
+    return git(str(upstream), "rev-parse", "HEAD")
+
+
+def make_registry(root, ports: dict) -> None:
+    # 'ports' is {port: REPO}, each port being at 1.0.0
+    baseline = {}
+    for port, repo in ports.items():
+        os.makedirs(str(root / "ports" / port))
+        (root / "ports" / port / "vcpkg.json").write_text(json.dumps({"name": port, "version": "1.0.0"}))
+        (root / "ports" / port / "portfile.cmake").write_text(
+            "vcpkg_from_github(\n  OUT_SOURCE_PATH SOURCE_PATH\n  REPO %s\n  REF 0000\n  SHA512 0\n)\n" % repo)
+        path = root / version_file_path(port)
+        os.makedirs(str(path.parent), exist_ok=True)
+        path.write_text(json.dumps({"versions": [{"version": "1.0.0", "git-tree": "0" * 40, "port-version": 0}]}))
+        baseline[port] = {"baseline": "1.0.0", "port-version": 0}
+    (root / "versions" / "baseline.json").write_text(json.dumps({"default": baseline}))
+    (root / ".gitignore").write_text(".registry.lock\n.registry-index.json\n.sha512-cache.json\n")
+    git(str(root), "init", "-q", "-b", "main")
+    git(str(root), "add", "-A")
+    git(str(root), "commit", "-q", "-m", "registry")
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    # upstream work repo -> bare mirror under mirrors/owner/project, and a
+    # registry whose port 'project' comes from owner/project. Port 'other'
+    # has its own mirror, which is not pushed to
+    upstream = tmp_path / "upstream"
+    make_upstream(upstream)
+    mirror = tmp_path / "mirrors" / "owner" / "project.git"
+    git(str(tmp_path), "clone", "-q", "--bare", str(upstream), str(mirror))
+    git(str(tmp_path), "clone", "-q", "--bare", str(upstream), str(tmp_path / "mirrors" / "owner" / "other"))
+    git(str(upstream), "remote", "add", "mirror", str(mirror))
+    registry = tmp_path / "registry"
+    make_registry(registry, {"project": "owner/project", "other": "owner/other"})
+    monkeypatch.chdir(str(registry))
+    return upstream, str(mirror), registry
+
+
+class ScriptedWatcher(object):
+    # Each wait() runs the next step, which returns the changed mirrors.
+    # The watch ends once the script is exhausted
+
+    def __init__(self, steps: list) -> None:
+        self.steps = list(steps)
+        self.timeouts = []
+
+    def wait(self, timeout: float = None) -> set:
+        self.timeouts.append(timeout)
+        if not self.steps:
+            raise KeyboardInterrupt
+        return self.steps.pop(0)()
+
+    def close(self) -> None:
+        pass
+
+
+def run_watch(monkeypatch, mirrors: str, steps: list, **kwargs) -> ScriptedWatcher:
+    watcher = ScriptedWatcher(steps)
+    monkeypatch.setattr(update_port, "create_watcher", lambda mirrors, poll_interval: watcher)
+    with pytest.raises(KeyboardInterrupt):
+        update_port.watch(mirrors, **kwargs)
+    return watcher
+
+
+def commit_subjects(registry) -> list:
+    return git(str(registry), "log", "--format=%s").splitlines()
+
+
+def test_mirror_tags(setup):
+    upstream, mirror, _ = setup
+    commit_id = push_tag(upstream, "v1.1.0")
+    git(str(upstream), "tag", "-a", "-m", "annotated", "v1.2.0")
+    git(str(upstream), "push", "-q", "mirror", "v1.2.0")
+    tags = mirror_tags(mirror)
+    assert tags["v1.1.0"] == commit_id
+    # Annotated tags are peeled to their commit
+    assert tags["v1.2.0"] == commit_id
+
+
+@pytest.mark.parametrize("watcher_class", [InotifyWatcher, PollingWatcher])
+def test_watcher_sees_push(setup, watcher_class):
+    upstream, mirror, _ = setup
+    try:
+        watcher = watcher_class([mirror])
+    except (OSError, AttributeError):
+        pytest.skip("inotify is unavailable")
+    try:
+        assert watcher.wait(0.1) == set()
+        push_tag(upstream, "v1.1.0")
+        assert watcher.wait(10) == {mirror}
+    finally:
+        watcher.close()
+
+
+def test_watch_updates_port(setup, monkeypatch):
+    upstream, mirror, registry = setup
+    mirrors = os.path.dirname(os.path.dirname(mirror))
+    commit_ids = []
+    steps = [lambda: commit_ids.append(push_tag(upstream, "v1.1.0")) or {mirror},
+             lambda: commit_ids.append(push_tag(upstream, "v1.2.0")) or {mirror},
+             lambda: set()]
+    run_watch(monkeypatch, mirrors, steps, baseline="default")
+
+    # The burst is one commit, to the highest tag
+    assert commit_subjects(registry) == [f"Update project to 1.2.0/{commit_ids[1]}", "registry"]
+    index = RegistryIndex.load()
+    assert index.manifests["project"]["version"] == "1.2.0"
+    assert index.baselines["default"]["project"] == {"baseline": "1.2.0", "port-version": 0}
+    # The tags of a mirror only apply to the ports of that mirror
+    assert index.manifests["other"]["version"] == "1.0.0"
+    portfile = (registry / "ports" / "project" / "portfile.cmake").read_text()
+    assert f"REF {commit_ids[1]}" in portfile
+    assert "SHA512 0\n" not in portfile
+    assert git(str(registry), "status", "--porcelain") == ""
+
+
+def test_watch_applies_tags_pushed_before_start(setup, monkeypatch):
+    upstream, mirror, registry = setup
+    mirrors = os.path.dirname(os.path.dirname(mirror))
+    commit_id = push_tag(upstream, "v1.1.0")
+    watcher = run_watch(monkeypatch, mirrors, [], baseline="default")
+    assert watcher.timeouts == [None]
+    assert commit_subjects(registry) == [f"Update project to 1.1.0/{commit_id}", "registry"]
+    # Nothing newer than the registry: nothing to do
+    run_watch(monkeypatch, mirrors, [lambda: {mirror}, lambda: set()], baseline="default")
+    assert len(commit_subjects(registry)) == 2
+
+
+def test_watch_retries_failed_batch(setup, monkeypatch, capsys):
+    upstream, mirror, registry = setup
+    mirrors = os.path.dirname(os.path.dirname(mirror))
+    # The first commit is refused by a hook
+    hook = registry / ".git" / "hooks" / "pre-commit"
+    hook.write_text("#!/bin/sh\nif [ -f .git/fail-once ]; then rm .git/fail-once; exit 1; fi\n")
+    hook.chmod(0o755)
+    (registry / ".git" / "fail-once").write_text("")
+    commit_ids = []
+    pushed = lambda: commit_ids.append(push_tag(upstream, "v1.1.0")) or {mirror}
+
+    def after_failure():
+        # The failed batch left nothing behind, and no push follows
+        assert git(str(registry), "status", "--porcelain") == ""
+        assert commit_subjects(registry) == ["registry"]
+        return set()
+
+    watcher = run_watch(monkeypatch, mirrors, [pushed, lambda: set(), after_failure, lambda: set()],
+                        baseline="default", retry_interval=0.5)
+
+    assert "git commit" in capsys.readouterr().err
+    assert watcher.timeouts[2] == 0.5
+    assert commit_subjects(registry) == [f"Update project to 1.1.0/{commit_ids[0]}", "registry"]
+    index = RegistryIndex.load()
+    # Applied once: no port-version bump on top of the failed attempt
+    assert [entry["version"] for entry in index.versions["project"]] == ["1.1.0", "1.0.0"]
+    assert index.baselines["default"]["project"] == {"baseline": "1.1.0", "port-version": 0}
+    assert git(str(registry), "status", "--porcelain") == ""
+
+
+def test_watch_survives_git_error(setup, monkeypatch, capsys):
+    upstream, mirror, registry = setup
+    mirrors = os.path.dirname(os.path.dirname(mirror))
+
+    def broken_mirror():
+        os.rename(os.path.join(mirror, "HEAD"), os.path.join(mirror, "HEAD.moved"))
+        return {mirror}
+
+    def repaired_mirror():
+        os.rename(os.path.join(mirror, "HEAD.moved"), os.path.join(mirror, "HEAD"))
+        push_tag(upstream, "v1.1.0")
+        return {mirror}
+
+    run_watch(monkeypatch, mirrors, [broken_mirror, lambda: set(), repaired_mirror, lambda: set()],
+              baseline="default")
+
+    assert "failed" in capsys.readouterr().err
+    assert RegistryIndex.load().manifests["project"]["version"] == "1.1.0"
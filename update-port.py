@@ -1,15 +1,50 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import difflib
 import json
 import os.path
 import re
 import subprocess
 import sys
+from typing import NamedTuple
 #from distutils.version import LooseVersion
 from packaging.version import Version as LooseVersion # Use packaging.version
 
-VERSION_BASELINE_PATH="versions/baseline.json"
-PORTS_DIR_PATH="ports"
+from registry import (
+    MIRRORS_ENV,
+    ArchiveHasher,
+    ConcurrentUpdate,
+    CyclicDependency,
+    DependencyGraph,
+    PORTS_DIR_PATH,
+    VERSION_BASELINE_PATH,
+    LockTimeout,
+    QueryIndex,
+    RegistryIndex,
+    RegistryLock,
+    SourceArchiveError,
+    TIMINGS_ENV,
+    atomic_write,
+    hash_tree,
+    portfile_source,
+    render_json,
+    timings,
+    version_file_path,
+)
+from registry.archive import find_mirror
+from registry.index import entry_version, parse_version
+from registry.watch import create_watcher, mirror_tags, tag_version
+
+DEFAULT_BASELINE="default"
+
+
+class PortUpdate(NamedTuple):
+    port: str
+    version: str
+    # None for a port-version bump leaving the sources unchanged
+    commit_id: str
+    baseline: str = DEFAULT_BASELINE
 
 class PortNotFound(Exception):
     def __init__(self, port: str, *args: object) -> None:
@@ -41,64 +76,88 @@ class PortNotFoundInBaseline(Exception):
     def message(self) -> str:
         return f"Port '{self.__port}' not found in baseline '{self.__baseline}"
 
-def read_current_port_version(port:str, version:str):
+
+class InvalidManifest(Exception):
+    def __init__(self, reason: str, *args: object) -> None:
+        super().__init__(*args)
+        self.__reason = reason
+
+    @property
+    def message(self) -> str:
+        return f"Invalid batch manifest: {self.__reason}"
+
+
+class NoMirrorFound(Exception):
+    def __init__(self, mirrors: str, *args: object) -> None:
+        super().__init__(*args)
+        self.__mirrors = mirrors
+
+    @property
+    def message(self) -> str:
+        return f"No port has a mirror of its sources in '{self.__mirrors}'"
+
+
+def read_json(path: str):
+    with open(path, 'r') as f:
+        text = f.read()
+    with timings.phase("parse json"):
+        return json.loads(text)
+
+
+def write_json(path: str, data) -> None:
+    atomic_write(path, render_json(data))
+
+
+def encode_text(text: str) -> bytes:
+    # Bytes a text mode write of 'text' produces on this platform
+    return text.replace("\n", os.linesep).encode()
+
+
+def read_current_port_version(port:str, version:str, index: RegistryIndex = None):
     # Read the current port version for the given version
     # in the version file of the registry
-    version_sub_dir = os.path.join("versions", f"{port[0]}-")
-    version_path = os.path.join(version_sub_dir, f"{port}.json")
-    
-    # Version file does not exists (i.e. port have not been added yet)
-    if not os.path.isfile(version_path) :
-        return -1
-        
-    with open(version_path, 'r') as f:
-        data = json.loads(f.read())
-
-    index = -1
-    for i, version_obj in enumerate(data["versions"]):
-        if version_obj.get('version', None) == version:
-            index = i
-            break
-            
-    # Port exists and version was found        
-    if index != -1:
-        try:
-            # Read current port version
-            port_version = data["versions"][index]["port-version"]
-        except KeyError:
-            # port-version field does not exists. 0 is assumed
-            port_version = 0
-    # Port exists but version was not found (i.e. new version)
-    else:
-        port_version = -1
-        
-    return port_version
-    
+    if index is None:
+        index = RegistryIndex()
+    if port not in index.versions:
+        # A missing version file (i.e. port have not been added yet) is empty
+        index.load_versions(port)
+    return index.current_port_version(port, version)
+
+
+def apply_vcpkg_json(data: dict, port: str, version: str, port_version: int) -> dict:
+    # Enforce vcpkg parameters
+    data["name"] = port
+    data["version"] = version
+    data["port-version"] = port_version
+    return data
+
+
 def update_vcpkg_json(port:str, port_dir: str, version: str) -> None:
     path = os.path.join(port_dir, "vcpkg.json")
-    with open(path, 'r') as f:
-        data = json.loads(f.read())
+    data = read_json(path)
     
     # Read the current port version from the version file
     # for the given version
     port_version = read_current_port_version(port, version)
     port_version += 1
     
-    # Enforce vcpkg parameters
-    data["name"] = port
-    data["version"] = version
-    data["port-version"] = port_version
+    write_json(path, apply_vcpkg_json(data, port, version, port_version))
+
 
-    with open(path, 'w') as f:
-        f.write(json.dumps(data, indent=2))
+def apply_portfile(content: str, commit_id: str, sha512: str = None) -> str:
+    # Anchored on the argument lines so comments mentioning them are left alone
+    with timings.phase("rewrite portfile"):
+        content = re.sub(R"^([ \t]*)REF\s.*", f"\\g<1>REF {commit_id}", content, count=1, flags=re.MULTILINE)
+        if sha512:
+            content = re.sub(R"^([ \t]*)SHA512\s.*", f"\\g<1>SHA512 {sha512}", content, count=1, flags=re.MULTILINE)
+    return content
 
-def update_portfile(port_dir: str, commit_id: str) -> None:
+
+def update_portfile(port_dir: str, commit_id: str, sha512: str = None) -> None:
     path = os.path.join(port_dir, "portfile.cmake")
     with open(path, 'r') as f:
         content = f.read()
-    content = re.sub(R"REF\s.*", f"REF {commit_id}", content, count=1)
-    with open(path, 'w') as f:
-        f.write(content)
+    atomic_write(path, apply_portfile(content, commit_id, sha512))
 
 
 def commit(paths: list, message: str = "", amend=False) -> None:
@@ -106,7 +165,7 @@ def commit(paths: list, message: str = "", amend=False) -> None:
         print(message)
     add_command = ["git", "add"] + paths
     print(" ".join(add_command))
-    subprocess.check_call(add_command)
+    timings.run(add_command, check=True)
     commit_command = ["git", "commit"]
     if message:
         commit_command += ["-m", message]
@@ -115,7 +174,7 @@ def commit(paths: list, message: str = "", amend=False) -> None:
         if not message:
             commit_command += ["--no-edit"]
     print(" ".join(commit_command))
-    subprocess.check_output(commit_command)
+    timings.run(commit_command, check=True, stdout=subprocess.PIPE)
 
 
 def update_port(port: str, version: str, commit_id: str) -> None:
@@ -125,39 +184,22 @@ def update_port(port: str, version: str, commit_id: str) -> None:
 
     update_vcpkg_json(port, port_dir, version)
     update_portfile(port_dir, commit_id)
-    commit([port_dir], f"Update {port} to {version}/{commit_id}")
+
+
+def port_git_tree(port: str, overrides: dict = None) -> str:
+    # Tree id 'ports/<port>/' will have once committed, computed from the
+    # working tree (plus the pending 'overrides') without forking git
+    return hash_tree(os.path.join(PORTS_DIR_PATH, port), overrides)
 
 
 def update_port_version(port:str, version:str, path: str):
-    if not os.path.exists(path):
-        with open(path, 'w') as f:
-            f.write(json.dumps({"versions": []}))
-    with open(path, 'r') as f:
-        data = json.loads(f.read())
-    git_tree = subprocess.check_output(["git", "rev-parse", f"HEAD:{PORTS_DIR_PATH}/{port}/"]).decode().splitlines()[0]
-    index = -1
-    for i, version_obj in enumerate(data["versions"]):
-        if version_obj.get('version', None) == version:
-            index = i
-            break
-    if index != -1:
-        # update existing version: add new entry with incremented port version
-        try:
-            port_version = data["versions"][index]["port-version"]
-            port_version += 1
-        except KeyError:
-            port_version = 1
-    else:
-        port_version = 0
-
-    data["versions"].insert(index, {"version": version, "git-tree": git_tree, "port-version": port_version})
-    with open(path, 'w') as f:
-        f.write(json.dumps(data, indent=2))
+    index = RegistryIndex()
+    index.load_versions(port, path)
+    port_version = index.add_version(port, version, port_git_tree(port))
+    index.save()
     return port_version   
 
-def update_baseline(baseline_name, port, version, port_version, path=VERSION_BASELINE_PATH):
-    with open(path, 'r') as f:
-        baselines = json.loads(f.read())
+def apply_baseline(baselines: dict, baseline_name: str, port: str, version: str, port_version: int) -> bool:
     try:
         baseline = baselines[baseline_name]
     except KeyError:
@@ -167,24 +209,319 @@ def update_baseline(baseline_name, port, version, port_version, path=VERSION_BAS
         current_version = baseline[port]['baseline']
         if LooseVersion(version) < LooseVersion(current_version):
             print("skipping baseline update, current version is most recent")
-            return
+            return False
 
     baseline[port] = {"baseline": version, "port-version": port_version}
     baselines[baseline_name] = baseline
+    return True
 
-    with open(path, 'w') as f:
-        f.write(json.dumps(baselines, indent=2))
+
+def update_baseline(baseline_name, port, version, port_version, path=VERSION_BASELINE_PATH):
+    # Read under the lock, so the pins other jobs write meanwhile are kept
+    with RegistryLock():
+        baselines = read_json(path)
+        if apply_baseline(baselines, baseline_name, port, version, port_version):
+            write_json(path, baselines)
 
 
 def update_versions(baseline: str, port: str, version: str, commit_id: str) -> None:
     print(f"Updating baseline: '{baseline}'")
-    version_sub_dir = os.path.join("versions", f"{port[0]}-")
-    version_path = os.path.join(version_sub_dir, f"{port}.json")
+    version_path = version_file_path(port)
+    version_sub_dir = os.path.dirname(version_path)
     if not os.path.isdir(version_sub_dir) :
         os.makedirs(version_sub_dir)
-    port_version = update_port_version(port, version, version_path)
-    update_baseline(baseline, port, version, port_version, path=VERSION_BASELINE_PATH)
-    commit([version_path, VERSION_BASELINE_PATH], amend=True)
+    with RegistryLock():
+        port_version = update_port_version(port, version, version_path)
+        update_baseline(baseline, port, version, port_version, path=VERSION_BASELINE_PATH)
+        port_dir = os.path.join(os.getcwd(), PORTS_DIR_PATH, port)
+        commit([port_dir, version_path, VERSION_BASELINE_PATH], f"Update {port} to {version}/{commit_id}")
+
+
+def parse_batch_entry(entry: str) -> PortUpdate:
+    # port:version:commit[:baseline]
+    fields = entry.split(":")
+    if len(fields) not in (3, 4) or not all(fields):
+        raise InvalidManifest(f"expected 'port:version:commit[:baseline]', got '{entry}'")
+    return PortUpdate(*fields)
+
+
+def parse_manifest(content: str) -> list:
+    # A manifest is either a JSON list of objects/arrays,
+    # or one whitespace separated 'port version commit [baseline]' per line
+    content = content.strip()
+    if content.startswith("[") or content.startswith("{"):
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise InvalidManifest(str(e))
+        if isinstance(data, dict):
+            data = data.get("ports", [])
+        updates = []
+        for item in data:
+            try:
+                if isinstance(item, dict):
+                    updates.append(PortUpdate(item["port"], item["version"], item["commit"],
+                                              item.get("baseline", DEFAULT_BASELINE)))
+                else:
+                    updates.append(PortUpdate(*item))
+            except (KeyError, TypeError):
+                raise InvalidManifest(f"malformed entry {json.dumps(item)}")
+        return updates
+
+    updates = []
+    for line in content.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if len(fields) not in (3, 4):
+            raise InvalidManifest(f"expected 'port version commit [baseline]', got '{line}'")
+        updates.append(PortUpdate(*fields))
+    return updates
+
+
+def compute_sha512s(updates: list, mirrors: str) -> dict:
+    # SHA512 of the archive vcpkg_from_github downloads for each update,
+    # produced from the local mirrors on a thread pool. Returns {port: sha512}
+    sources = []
+    for update in updates:
+        with open(os.path.join(PORTS_DIR_PATH, update.port, "portfile.cmake"), 'r') as f:
+            repo = portfile_source(f.read()).get("REPO")
+        if not repo:
+            raise SourceArchiveError(update.port, update.commit_id, "no vcpkg_from_github REPO in portfile.cmake")
+        sources.append((repo, update.commit_id))
+    with timings.phase("compute sha512"):
+        sha512s = ArchiveHasher(mirrors).sha512_many(sources)
+    return {update.port: sha512 for update, sha512 in zip(updates, sha512s)}
+
+
+def cascade_updates(updates: list, index: RegistryIndex, graph: DependencyGraph) -> list:
+    # port-version bumps of every in-registry port depending, directly or
+    # not, on an updated port, in dependency order. A bump goes into the
+    # baseline of the first updated dependency that triggers it
+    updated = {update.port for update in updates}
+    baselines = {update.port: update.baseline for update in updates}
+    bumps = []
+    for port in graph.topological_order(graph.transitive_dependents(updated) | updated):
+        if port in updated:
+            continue
+        baselines[port] = next(baselines[dependency] for dependency in sorted(graph.dependencies[port])
+                               if dependency in baselines)
+        bumps.append(PortUpdate(port, entry_version(index.manifests[port]), None, baselines[port]))
+    return bumps
+
+
+def print_rebuild_plan(updates: list, index: RegistryIndex, graph: DependencyGraph) -> None:
+    ports = {update.port: update for update in updates}
+    print("Rebuild plan:")
+    for i, port in enumerate(graph.topological_order(ports), 1):
+        manifest = index.manifests[port]
+        if ports[port].commit_id is None:
+            reason = "depends on " + ", ".join(sorted(graph.dependencies[port] & set(ports)))
+        else:
+            reason = f"updated to {ports[port].commit_id}"
+        print(f"  {i}. {port} {entry_version(manifest)}#{manifest.get('port-version', 0)} ({reason})")
+
+
+def plan_updates(updates: list, index: RegistryIndex, sha512s: dict = None) -> dict:
+    # Apply 'updates' to the in-memory registry and return the new content
+    # of every file they touch, without writing anything. Returns {path: text}
+    seen = set()
+    for update in updates:
+        if update.port in seen:
+            raise InvalidManifest(f"port '{update.port}' listed more than once")
+        seen.add(update.port)
+
+    # Fail before touching anything if a port or a baseline is unknown
+    for update in updates:
+        if not index.has_port(update.port):
+            raise PortNotFound(update.port)
+        if update.baseline not in index.baselines:
+            raise BaselineNotFound(update.baseline)
+
+    portfiles = {}
+    for update in updates:
+        port_dir = os.path.join(PORTS_DIR_PATH, update.port)
+        port_version = read_current_port_version(update.port, update.version, index) + 1
+        manifest = apply_vcpkg_json(index.manifests.get(update.port) or index.load_manifest(update.port),
+                                    update.port, update.version, port_version)
+
+        overrides = {"vcpkg.json": encode_text(render_json(manifest))}
+        if update.commit_id is not None:
+            portfile_path = os.path.join(port_dir, "portfile.cmake")
+            with open(portfile_path, 'r') as f:
+                portfiles[portfile_path] = apply_portfile(f.read(), update.commit_id, (sha512s or {}).get(update.port))
+            overrides["portfile.cmake"] = encode_text(portfiles[portfile_path])
+
+        git_tree = port_git_tree(update.port, overrides)
+        port_version = index.add_version(update.port, update.version, git_tree)
+        apply_baseline(index.baselines, update.baseline, update.port, update.version, port_version)
+
+    return {**index.pending(), **portfiles}
+
+
+def print_diff(pending: dict) -> None:
+    for path, text in pending.items():
+        try:
+            with open(path, 'r') as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = ""
+        diff = difflib.unified_diff(current.splitlines(keepends=True), text.splitlines(keepends=True),
+                                    f"a/{path}", f"b/{path}")
+        for line in diff:
+            sys.stdout.write(line if line.endswith("\n") else line + "\n")
+
+
+def read_bytes(path: str):
+    # None for a file that does not exist yet
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def restore(originals: dict) -> None:
+    # Puts back the {path: content} read before an update, byte for byte
+    # (line endings included), and unstages them
+    for path, content in originals.items():
+        if content is not None:
+            atomic_write(path, content)
+        elif os.path.exists(path):
+            os.remove(path)
+    timings.run(["git", "reset", "-q", "--"] + list(originals), stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+
+
+def update_ports(updates: list, dry_run: bool = False, mirrors: str = None, cascade: bool = False,
+                 lock_timeout: float = None) -> None:
+    # The SHA512s, the slow part, are computed first. Then, under the
+    # registry lock so that concurrent jobs see each other's changes, the
+    # registry is loaded once, every update is applied in memory, each
+    # modified file is written once and the whole batch is committed
+    sha512s = compute_sha512s(updates, mirrors) if mirrors else None
+    with contextlib.nullcontext() if dry_run else RegistryLock(timeout=lock_timeout):
+        index = RegistryIndex.load()
+        if cascade:
+            graph = DependencyGraph(index.manifests)
+            updates = updates + cascade_updates(updates, index, graph)
+        with timings.phase("plan updates"):
+            pending = plan_updates(updates, index, sha512s)
+        if cascade:
+            print_rebuild_plan(updates, index, graph)
+        if dry_run:
+            print_diff(pending)
+            return
+
+        for update in updates:
+            print(f"Updating baseline: '{update.baseline}'")
+        originals = {path: read_bytes(path) for path in pending}
+        try:
+            for path, text in pending.items():
+                atomic_write(path, text)
+            # Only the version files just written are re-read
+            QueryIndex.load().save()
+
+            lines = [f"Update {u.port} to {u.version}/{u.commit_id}" if u.commit_id is not None
+                     else f"Bump {u.port} port-version" for u in updates]
+            if len(lines) == 1:
+                message = lines[0]
+            else:
+                message = "Update " + ", ".join(u.port for u in updates) + "\n\n" + "\n".join(lines)
+            commit(list(pending), message)
+        except BaseException:
+            # A failed commit must not leave a half-applied batch, which
+            # the next run would bump on top of
+            restore(originals)
+            raise
+
+
+def port_mirrors(index: RegistryIndex, mirrors: str) -> dict:
+    # {port: mirror} of the ports whose vcpkg_from_github REPO has a mirror
+    result = {}
+    for port in sorted(index.manifests):
+        try:
+            with open(os.path.join(PORTS_DIR_PATH, port, "portfile.cmake"), 'r') as f:
+                repo = portfile_source(f.read()).get("REPO")
+        except FileNotFoundError:
+            continue
+        mirror = find_mirror(mirrors, repo) if repo else None
+        if mirror is not None:
+            result[port] = mirror
+    return result
+
+
+def tag_updates(index: RegistryIndex, ports: list, tags: dict, baseline: str) -> list:
+    # For each port, the highest version tag among 'tags' ({tag: commit})
+    # if it is newer than the version of the port in the registry
+    versions = sorted((parse_version(tag_version(tag)), tag_version(tag), commit)
+                      for tag, commit in tags.items() if tag_version(tag) is not None)
+    if not versions:
+        return []
+    parsed, version, commit_id = versions[-1]
+    updates = []
+    for port in ports:
+        current = parse_version(entry_version(index.manifests[port]))
+        if current is None or parsed > current:
+            updates.append(PortUpdate(port, version, commit_id, baseline))
+    return updates
+
+
+def mirror_updates(index: RegistryIndex, mirrors: str, changed: set, baseline: str) -> list:
+    # Updates of the ports whose REPO is mirrored by one of the 'changed'
+    # mirrors, to the highest tag of their own mirror. The portfiles are
+    # read again: a port may have moved to another REPO meanwhile
+    updates = []
+    tags = {}
+    for port, mirror in port_mirrors(index, mirrors).items():
+        if mirror in changed:
+            if mirror not in tags:
+                tags[mirror] = mirror_tags(mirror)
+            updates += tag_updates(index, [port], tags[mirror], baseline)
+    return updates
+
+
+def watch(mirrors: str, baseline: str = DEFAULT_BASELINE, debounce: float = 5.0, poll_interval: float = 2.0,
+          lock_timeout: float = None, retry_interval: float = 60.0) -> None:
+    # Waits for ref changes in the mirrors of the ports. The tags pushed in
+    # a burst, until 'debounce' seconds pass without change, are applied as
+    # a single batch and a single commit. Tags are only compared with the
+    # versions of the registry: those pushed while the watch was down are
+    # applied at startup, and a failed batch is tried again every
+    # 'retry_interval' seconds, or on the next push
+    watched = sorted(set(port_mirrors(RegistryIndex.load(), mirrors).values()))
+    if not watched:
+        raise NoMirrorFound(mirrors)
+    watcher = create_watcher(watched, poll_interval)
+    print(f"Watching {len(watched)} mirror(s) with {type(watcher).__name__}: {', '.join(watched)}")
+    changed = set(watched)
+    try:
+        while True:
+            failed = set()
+            try:
+                updates = mirror_updates(RegistryIndex.load(), mirrors, changed, baseline)
+                if updates:
+                    update_ports(updates, mirrors=mirrors, lock_timeout=lock_timeout)
+            except (PortNotFound, BaselineNotFound, InvalidManifest, SourceArchiveError, ConcurrentUpdate,
+                    LockTimeout) as e:
+                # A failed batch must not stop the watch
+                print(e.message, file=sys.stderr)
+                failed = changed
+            except subprocess.CalledProcessError as e:
+                print(f"{' '.join(e.cmd)} failed with exit code {e.returncode}", file=sys.stderr)
+                failed = changed
+            except OSError as e:
+                print(f"{e.filename or ''}: {e.strerror or e}", file=sys.stderr)
+                failed = changed
+
+            changed = watcher.wait(retry_interval if failed else None) | failed
+            while True:
+                burst = watcher.wait(debounce)
+                if not burst:
+                    break
+                changed |= burst
+    finally:
+        watcher.close()
 
 
 def fatal(message):
@@ -194,15 +531,67 @@ def fatal(message):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("port")
-    parser.add_argument("version")
-    parser.add_argument("commit")
-    parser.add_argument("baseline", default="default", nargs='?')
+    parser.add_argument("port", nargs='?')
+    parser.add_argument("version", nargs='?')
+    parser.add_argument("commit", nargs='?')
+    parser.add_argument("baseline", default=DEFAULT_BASELINE, nargs='?')
+    parser.add_argument("--batch", nargs='+', metavar="PORT:VERSION:COMMIT[:BASELINE]",
+                        help="Update several ports in a single run and a single commit")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="Read the batch from a JSON or text manifest ('-' for stdin)")
+    parser.add_argument("--mirrors", default=os.environ.get(MIRRORS_ENV), metavar="DIR",
+                        help="Directory (or file:// URL) holding local clones of the port sources, used to"
+                             f" compute the SHA512 of portfile.cmake (default: ${MIRRORS_ENV})")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Also bump the port-version of the registry ports depending on the updated ports")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the changes that would be made, without writing or committing")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and update the ports when version tags are pushed to their --mirrors")
+    parser.add_argument("--debounce", type=float, default=5.0, metavar="SECONDS",
+                        help="With --watch, wait for this long without push before updating (default: 5)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, metavar="SECONDS",
+                        help="With --watch, check the mirrors this often when inotify is unavailable (default: 2)")
+    parser.add_argument("--retry-interval", type=float, default=60.0, metavar="SECONDS",
+                        help="With --watch, try a failed update again this often (default: 60)")
+    parser.add_argument("--lock-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Give up if another update holds the registry lock for longer (default: wait)")
+    parser.add_argument("--timings", nargs='?', const="table", metavar="TRACE.json",
+                        help="Print the time spent in each phase and subprocess, or write it as a Chrome"
+                             f" trace to TRACE.json (default: ${TIMINGS_ENV})")
     args = parser.parse_args()
+    if args.timings:
+        timings.enable(args.timings)
 
     try:
-        update_port(args.port, args.version, args.commit)
-        update_versions(args.baseline, args.port, args.version, args.commit)
+        if args.watch:
+            if args.port or args.batch or args.manifest:
+                parser.error("--watch cannot be combined with ports to update")
+            if not args.mirrors:
+                parser.error(f"--watch requires --mirrors or ${MIRRORS_ENV}")
+            try:
+                watch(args.mirrors, args.baseline, args.debounce, args.poll_interval, args.lock_timeout,
+                      args.retry_interval)
+            except KeyboardInterrupt:
+                pass
+            return
+        if args.batch or args.manifest:
+            if args.port:
+                parser.error("positional port arguments cannot be combined with --batch/--manifest")
+            updates = [parse_batch_entry(entry) for entry in args.batch or []]
+            if args.manifest == "-":
+                updates += parse_manifest(sys.stdin.read())
+            elif args.manifest:
+                with open(args.manifest, 'r') as f:
+                    updates += parse_manifest(f.read())
+            if not updates:
+                parser.error("the batch manifest is empty")
+        else:
+            if not args.commit:
+                parser.error("the following arguments are required: port, version, commit")
+            updates = [PortUpdate(args.port, args.version, args.commit, args.baseline)]
+        update_ports(updates, dry_run=args.dry_run, mirrors=args.mirrors, cascade=args.cascade,
+                     lock_timeout=args.lock_timeout)
     except FileNotFoundError as e:
         fatal(f"File not found: {e.filename}")
     except PortNotFound as e:
@@ -211,6 +600,18 @@ def main():
         fatal(e.message)
     except PortNotFoundInBaseline as e:
         fatal(e.message)
+    except InvalidManifest as e:
+        fatal(e.message)
+    except SourceArchiveError as e:
+        fatal(e.message)
+    except CyclicDependency as e:
+        fatal(e.message)
+    except LockTimeout as e:
+        fatal(e.message)
+    except ConcurrentUpdate as e:
+        fatal(e.message)
+    except NoMirrorFound as e:
+        fatal(e.message)
 
 
 if __name__ == "__main__":
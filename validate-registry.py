@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os.path
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from registry import (
+    PORTS_DIR_PATH,
+    VERSION_BASELINE_PATH,
+    RegistryIndex,
+    hash_tree,
+    object_types,
+    version_file_path,
+)
+from registry.index import entry_version, parse_version
+
+
+class Problem(NamedTuple):
+    code: str
+    file: str
+    port: str
+    message: str
+    version: str = None
+    port_version: int = None
+
+
+def check_git_trees(index: RegistryIndex) -> list:
+    # Every git-tree of every version file must be a tree object of this
+    # repository. All ids go through a single git cat-file process
+    trees = [(port, entry) for port in index.ports() for entry in index.versions.get(port, [])]
+    types = object_types(entry["git-tree"] for _, entry in trees if "git-tree" in entry)
+    problems = []
+    for port, entry in trees:
+        git_tree = entry.get("git-tree")
+        if git_tree is None:
+            problems.append(Problem("missing-git-tree", version_file_path(port), port,
+                                    "version entry has no git-tree",
+                                    entry_version(entry), entry.get("port-version", 0)))
+        elif types.get(git_tree) != "tree":
+            found = types.get(git_tree) or "missing"
+            problems.append(Problem("invalid-git-tree", version_file_path(port), port,
+                                    f"git-tree {git_tree} is not a tree object ({found})",
+                                    entry_version(entry), entry.get("port-version", 0)))
+    return problems
+
+
+def check_baselines(index: RegistryIndex) -> list:
+    # Every baseline entry must exist in the version file of its port
+    problems = []
+    for baseline_name, baseline in index.baselines.items():
+        for port, pin in baseline.items():
+            version = pin.get("baseline")
+            port_version = pin.get("port-version", 0)
+            if port not in index.versions:
+                problems.append(Problem("unknown-baseline-port", VERSION_BASELINE_PATH, port,
+                                        f"baseline '{baseline_name}' references a port without version file",
+                                        version, port_version))
+                continue
+            entries = index.find(port, version)
+            if not any(entry.get("port-version", 0) == port_version for entry in entries):
+                problems.append(Problem("unknown-baseline-version", VERSION_BASELINE_PATH, port,
+                                        f"baseline '{baseline_name}' references {version}#{port_version}"
+                                        f" which is not in {version_file_path(port)}",
+                                        version, port_version))
+    return problems
+
+
+def check_port(index: RegistryIndex, port: str) -> list:
+    # ports/<port>/vcpkg.json must match the most recent entry of its
+    # version file, git-tree included
+    manifest_path = os.path.join(PORTS_DIR_PATH, port, "vcpkg.json")
+    manifest = index.manifests[port]
+    version = entry_version(manifest)
+    port_version = manifest.get("port-version", 0)
+    entries = index.versions.get(port)
+    if not entries:
+        return [Problem("missing-version-file", version_file_path(port), port,
+                        "port has no version entries", version, port_version)]
+
+    problems = []
+    if manifest.get("name") != port:
+        problems.append(Problem("name-mismatch", manifest_path, port,
+                                f"vcpkg.json name is '{manifest.get('name')}'", version, port_version))
+
+    def key(entry):
+        parsed = parse_version(entry_version(entry))
+        return (parsed is not None, parsed or parse_version("0"), entry.get("port-version", 0))
+
+    latest = max(entries, key=key)
+    latest_version = entry_version(latest)
+    latest_port_version = latest.get("port-version", 0)
+    if (version, port_version) != (latest_version, latest_port_version):
+        problems.append(Problem("not-latest", manifest_path, port,
+                                f"vcpkg.json declares {version}#{port_version} but the latest entry"
+                                f" is {latest_version}#{latest_port_version}", version, port_version))
+        return problems
+
+    git_tree = hash_tree(os.path.join(PORTS_DIR_PATH, port))
+    if latest.get("git-tree") != git_tree:
+        problems.append(Problem("stale-git-tree", version_file_path(port), port,
+                                f"latest entry has git-tree {latest.get('git-tree')} but"
+                                f" {PORTS_DIR_PATH}/{port}/ is {git_tree}", version, port_version))
+    return problems
+
+
+def validate(index: RegistryIndex, max_workers: int = None) -> list:
+    # The git object check runs alongside the JSON checks
+    tree_problems = []
+    tree_thread = threading.Thread(target=lambda: tree_problems.extend(check_git_trees(index)))
+    tree_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            port_problems = executor.map(lambda port: check_port(index, port), sorted(index.manifests))
+            problems = check_baselines(index)
+            for result in port_problems:
+                problems.extend(result)
+    finally:
+        tree_thread.join()
+    return tree_problems + problems
+
+
+def fatal(message):
+    print(message, file=sys.stderr)
+    sys.exit(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the consistency of the registry before publishing it")
+    parser.add_argument("--format", choices=["text", "json"], default="text",
+                        help="Report problems as text or as a JSON array")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of ports checked in parallel")
+    args = parser.parse_args()
+
+    try:
+        problems = validate(RegistryIndex.load(), args.jobs)
+    except FileNotFoundError as e:
+        fatal(f"File not found: {e.filename}")
+
+    if args.format == "json":
+        print(json.dumps([problem._asdict() for problem in problems], indent=2))
+    else:
+        for problem in problems:
+            print(f"{problem.file}: {problem.code}: {problem.message}")
+        print(f"{len(problems)} problem(s) found")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()